@@ -7,6 +7,7 @@ import streamlit as st
 import os
 from typing import Dict, Any, Optional
 from config_manager import load_config, save_config, save_api_key, get_api_key_from_config
+from limitador_llm import LIMITES_POR_DEFECTO, limites_configurados, reiniciar_limitadores
 
 def run_admin_panel():
     """Ejecuta el panel de administración."""
@@ -62,7 +63,8 @@ def manage_api_keys():
     else:
         st.warning("⚠️ No hay clave API configurada para Redpill.")
     
-    # Opción para cambiar la clave    change_key = st.checkbox("Cambiar clave API de Redpill", key="change_redpill_key")
+    # Opción para cambiar la clave
+    change_key = st.checkbox("Cambiar clave API de Redpill", key="change_redpill_key")
     
     if change_key:
         new_key = st.text_input(
@@ -110,7 +112,9 @@ def manage_api_keys():
             "Nueva clave API de OpenAI:", 
             type="password",
             help="La clave API se guardará de forma permanente."
-        )        if st.button("Guardar clave API", key="save_openai_key"):
+        )
+        
+        if st.button("Guardar clave API", key="save_openai_key"):
             if new_openai_key:
                 # Intentar guardar la clave API
                 result = save_api_key(new_openai_key, "openai")
@@ -203,6 +207,59 @@ def manage_general_settings():
         else:
             st.error("❌ Error al guardar la configuración.")
     
+    # Cruce de datos
+    st.divider()
+    st.subheader("Cruce de datos")
+    cruce_workers = config["general"].get("cruce_workers", 1)
+    
+    new_cruce_workers = st.number_input(
+        "Procesos para el cruce de datos",
+        min_value=1,
+        max_value=max(os.cpu_count() or 1, cruce_workers),
+        value=cruce_workers,
+        help="Cantidad de procesos en paralelo para el fuzzy matching del Cruce Inteligente. Con 1 se ejecuta en el mismo proceso."
+    )
+    
+    if st.button("Guardar configuración de cruce", key="save_cruce_config"):
+        config["general"]["cruce_workers"] = int(new_cruce_workers)
+        if save_config(config):
+            st.success("✅ Configuración guardada correctamente.")
+        else:
+            st.error("❌ Error al guardar la configuración.")
+
+    # Límites de la API
+    st.divider()
+    st.subheader("Límites de la API")
+    st.caption("Las llamadas se espacian para no superar estos límites; ante un error 429 se reduce la concurrencia y se reintenta.")
+    nuevos_limites = {}
+    for proveedor in LIMITES_POR_DEFECTO:
+        limites = limites_configurados(proveedor)
+        col1, col2 = st.columns(2)
+        with col1:
+            rpm = st.number_input(
+                f"Peticiones por minuto ({proveedor})",
+                min_value=1,
+                value=int(limites["rpm"]),
+                key=f"limite_rpm_{proveedor}"
+            )
+        with col2:
+            tpm = st.number_input(
+                f"Tokens por minuto ({proveedor})",
+                min_value=100,
+                value=int(limites["tpm"]),
+                step=1000,
+                key=f"limite_tpm_{proveedor}"
+            )
+        nuevos_limites[proveedor] = {"rpm": int(rpm), "tpm": int(tpm)}
+
+    if st.button("Guardar límites de la API", key="save_limites_config"):
+        config["general"]["limites_llm"] = nuevos_limites
+        if save_config(config):
+            reiniciar_limitadores()
+            st.success("✅ Configuración guardada correctamente.")
+        else:
+            st.error("❌ Error al guardar la configuración.")
+
     # Limpiar caché
     st.divider()
     st.subheader("Mantenimiento")
@@ -212,10 +269,10 @@ def manage_general_settings():
         cache_dir = os.path.join(os.path.dirname(__file__), 'cache')
         if os.path.exists(cache_dir):
             try:
-                for filename in os.listdir(cache_dir):
-                    file_path = os.path.join(cache_dir, filename)
-                    if os.path.isfile(file_path):
-                        os.unlink(file_path)
+                # También las subcarpetas (p. ej. cache/datasets/)
+                for carpeta, _, archivos in os.walk(cache_dir):
+                    for filename in archivos:
+                        os.unlink(os.path.join(carpeta, filename))
                 st.success("✅ Caché limpiada correctamente.")
             except Exception as e:
                 st.error(f"❌ Error al limpiar la caché: {e}")
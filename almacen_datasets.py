@@ -0,0 +1,292 @@
+"""
+Registro de datasets de la sesión, guardados como archivos Arrow en disco.
+
+Cada tabla cargada se escribe una sola vez en cache/datasets/ en formato Feather
+(Arrow IPC sin comprimir) y se abre con memory map: las columnas numéricas se
+leen directamente del archivo mapeado, sin copiarlas, y todas las sesiones que
+abren el mismo dataset comparten las mismas páginas en memoria en lugar de
+guardar cada una su propia copia en st.session_state.
+
+El registro (nombre → dataset) es por sesión y lo comparten las páginas:
+lo que se carga en el Cruce Inteligente o en cualquier página se puede abrir por
+nombre desde el Dashboard, el Editor, el Exportador o el Mapeo. Al registrar un
+archivo subido se convierte a Feather en ese momento (o, si se registra en
+diferido, se copia tal cual a disco y se convierte la primera vez que se abre) y
+la sesión guarda solo su huella: ni el archivo subido ni una copia parseada
+quedan en memoria.
+
+Los archivos de cache/datasets/ sin usar en DIAS_CACHE_DATASETS días se borran,
+igual que los más viejos si el total supera BYTES_MAXIMOS_CACHE_DATASETS; las
+entradas del registro que apuntaban a ellos se descartan al abrirlas.
+"""
+
+import hashlib
+import os
+import shutil
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import streamlit as st
+
+from utils import (CACHE_ARCHIVOS_DIR, file_content_hash, huella_archivo, leer_archivo, limpiar_cache,
+                   seleccionar_hoja_excel)
+
+DATASETS_DIR = os.path.join(CACHE_ARCHIVOS_DIR, "datasets")
+
+# Datasets abiertos que se conservan en el proceso (los más recientes); son vistas
+# sobre archivos mapeados, así que ocupan memoria compartida y no del heap
+DATASETS_EN_MEMORIA = 8
+
+# Límites de cache/datasets/ (ver `limpiar_cache_datasets`)
+DIAS_CACHE_DATASETS = 7
+BYTES_MAXIMOS_CACHE_DATASETS = 4 * 1024 ** 3
+
+CLAVE_SESION = "datasets"
+
+_ABIERTOS: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+
+
+def _registro() -> Dict[str, Dict[str, Any]]:
+    """Registro de datasets de la sesión actual."""
+    return st.session_state.setdefault(CLAVE_SESION, {})
+
+
+def _ruta_dataset(huella: str) -> str:
+    """Ruta del archivo Feather de un dataset."""
+    return os.path.join(DATASETS_DIR, f"dataset_{huella}.feather")
+
+
+def _ruta_origen(uploaded_file) -> str:
+    """Ruta de la copia sin parsear de un archivo registrado en diferido (por contenido)."""
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    return os.path.join(DATASETS_DIR, f"origen_{file_content_hash(uploaded_file)}{extension}")
+
+
+def limpiar_cache_datasets() -> int:
+    """
+    Borra los Feather y las copias sin parsear de cache/datasets/ sin usar en más de
+    DIAS_CACHE_DATASETS días y, si el resto supera BYTES_MAXIMOS_CACHE_DATASETS, los
+    usados hace más tiempo.
+
+    Returns:
+        int: Archivos borrados
+    """
+    return limpiar_cache(DATASETS_DIR, ("dataset_", "origen_"), (".feather", ".csv", ".xls", ".xlsx"),
+                         DIAS_CACHE_DATASETS, BYTES_MAXIMOS_CACHE_DATASETS)
+
+
+def _escribir_feather(huella: str, df: pd.DataFrame) -> bool:
+    """
+    Escribe un dataset como Feather sin comprimir (escritura atómica).
+
+    Returns:
+        bool: False si Arrow no admite alguna columna (p. ej. tipos mezclados)
+    """
+    ruta = _ruta_dataset(huella)
+    if os.path.exists(ruta):
+        return True
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(DATASETS_DIR, exist_ok=True)
+        feather.write_feather(df.reset_index(drop=True), temporal, compression="uncompressed")
+        os.replace(temporal, ruta)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        return False
+    limpiar_cache_datasets()
+    return True
+
+
+def _abrir_feather(huella: str) -> pd.DataFrame:
+    """Abre un Feather con memory map; el DataFrame queda compartido por todo el proceso."""
+    # La fecha de modificación marca el último uso (ver `limpiar_cache_datasets`)
+    os.utime(_ruta_dataset(huella))
+    if huella in _ABIERTOS:
+        _ABIERTOS.move_to_end(huella)
+        return _ABIERTOS[huella]
+    tabla = pa.ipc.open_file(pa.memory_map(_ruta_dataset(huella))).read_all()
+    # split_blocks evita consolidar columnas del mismo tipo, lo que obligaría a copiarlas
+    df = tabla.to_pandas(split_blocks=True)
+    _ABIERTOS[huella] = df
+    if len(_ABIERTOS) > DATASETS_EN_MEMORIA:
+        _ABIERTOS.popitem(last=False)
+    return df
+
+
+def _registrar(nombre: str, huella: str, df: Optional[pd.DataFrame] = None) -> None:
+    """
+    Registra un dataset por su huella, escribiendo antes el Feather si hace falta.
+
+    Si Arrow no admite el DataFrame, queda en la sesión tal como está.
+    """
+    entrada = {"huella": huella}
+    if df is not None and not _escribir_feather(huella, df):
+        entrada["df"] = df
+    _registro()[nombre] = entrada
+
+
+def registrar_archivo(nombre: str, uploaded_file, hoja: Optional[str] = None,
+                      columnas: Optional[List[str]] = None, diferido: bool = False) -> None:
+    """
+    Registra un archivo subido como dataset de la sesión.
+
+    El archivo se parsea y se escribe como Feather una sola vez por contenido
+    (si ya existe el Feather, no se vuelve a leer); la sesión no guarda el archivo.
+
+    Args:
+        nombre: Nombre con el que se abre el dataset desde las páginas
+        uploaded_file: Archivo subido a través de st.file_uploader
+        hoja: Hoja de un Excel (por defecto la primera)
+        columnas: Columnas a cargar (por defecto todas)
+        diferido: Si es True, el archivo no se parsea ahora: se copia tal cual a
+            cache/datasets/ y se convierte a Feather la primera vez que se abre.
+            Para quien ya leyó del archivo solo lo que necesita y no quiere pagar
+            una lectura completa que quizás nadie use
+    """
+    huella = huella_archivo(uploaded_file, hoja, columnas)
+    if os.path.exists(_ruta_dataset(huella)):
+        _registrar(nombre, huella)
+    elif diferido:
+        origen = _ruta_origen(uploaded_file)
+        if not os.path.exists(origen):
+            temporal = f"{origen}.{os.getpid()}.tmp"
+            os.makedirs(DATASETS_DIR, exist_ok=True)
+            posicion = uploaded_file.tell()
+            uploaded_file.seek(0)
+            try:
+                with open(temporal, "wb") as destino:
+                    shutil.copyfileobj(uploaded_file, destino)
+                os.replace(temporal, origen)
+            finally:
+                uploaded_file.seek(posicion)
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+            limpiar_cache_datasets()
+        else:
+            os.utime(origen)
+        _registro()[nombre] = {"huella": huella, "origen": origen, "hoja": hoja, "columnas": columnas}
+    else:
+        # Lectura directa, sin pasar por el caché de archivos de read_flexible_file
+        _registrar(nombre, huella, leer_archivo(uploaded_file, hoja=hoja, columnas=columnas))
+
+
+def _convertir_origen(nombre: str, entrada: Dict[str, Any]) -> None:
+    """Parsea la copia de un archivo registrado en diferido y lo registra como Feather."""
+    with open(entrada["origen"], "rb") as archivo:
+        df = leer_archivo(archivo, hoja=entrada["hoja"], columnas=entrada["columnas"])
+    _registrar(nombre, entrada["huella"], df)
+    # La copia se conserva (otras hojas del mismo libro, o la misma en otras sesiones,
+    # pueden seguir pendientes); la borra la limpieza del caché cuando deja de usarse
+
+
+def registrar_dataset(nombre: str, df: pd.DataFrame) -> None:
+    """
+    Registra un DataFrame como dataset de la sesión y lo escribe en disco.
+
+    Args:
+        nombre: Nombre con el que se abre el dataset desde las páginas
+        df: Datos a registrar
+    """
+    contenido = pd.util.hash_pandas_object(df, index=False).values.tobytes()
+    huella = hashlib.md5(contenido + repr(list(df.columns)).encode()).hexdigest()
+    _registrar(nombre, huella, df)
+
+
+def datasets_registrados() -> List[str]:
+    """Nombres de los datasets registrados en la sesión."""
+    return list(_registro())
+
+
+def quitar_dataset(nombre: str) -> None:
+    """Quita un dataset del registro de la sesión (el archivo en disco se conserva)."""
+    _registro().pop(nombre, None)
+
+
+def abrir_dataset(nombre: str, filas: Optional[int] = None) -> pd.DataFrame:
+    """
+    Abre un dataset registrado.
+
+    Args:
+        nombre: Nombre del dataset
+        filas: Si se indica, solo las primeras filas
+
+    Returns:
+        pd.DataFrame: Vista sobre el archivo mapeado. Es una copia superficial: se
+        pueden agregar, quitar o reemplazar columnas sin afectar a otras páginas,
+        pero las columnas numéricas son de solo lectura (para editar celdas,
+        reemplazar antes la columna por una copia)
+
+    Raises:
+        KeyError: Si no hay un dataset registrado con ese nombre, o si su archivo
+            ya no existe (p. ej. se limpió el caché); en ese caso se quita del registro
+    """
+    entrada = _registro()[nombre]
+    if "df" in entrada:
+        return _vista(entrada["df"], filas)
+
+    huella = entrada["huella"]
+    if "origen" in entrada:
+        # Registrado en diferido: se convierte ahora, salvo que otra sesión ya lo haya hecho
+        if not os.path.exists(_ruta_dataset(huella)) and os.path.exists(entrada["origen"]):
+            _convertir_origen(nombre, entrada)
+        else:
+            _registrar(nombre, huella)
+        entrada = _registro()[nombre]
+        if "df" in entrada:
+            return _vista(entrada["df"], filas)
+
+    if not os.path.exists(_ruta_dataset(huella)):
+        quitar_dataset(nombre)
+        _ABIERTOS.pop(huella, None)
+        raise KeyError(f"El dataset '{nombre}' ya no está disponible (se borró su archivo del caché). "
+                       "Volvé a cargarlo.")
+
+    return _vista(_abrir_feather(huella), filas)
+
+
+def _vista(df: pd.DataFrame, filas: Optional[int]) -> pd.DataFrame:
+    """Copia superficial de un dataset, opcionalmente solo con las primeras filas."""
+    if filas is None:
+        return df.copy(deep=False)
+    muestra = df.head(filas).copy(deep=False)
+    muestra.attrs["filas_totales"] = len(df)
+    return muestra
+
+
+def elegir_datos(etiqueta: str, key: str, filas: Optional[int] = None) -> Tuple[Optional[str], Optional[pd.DataFrame]]:
+    """
+    Muestra el origen de datos de una página: un dataset ya registrado o un archivo nuevo.
+
+    Los archivos subidos quedan registrados para las demás páginas.
+
+    Args:
+        etiqueta: Texto del selector de archivo
+        key: Prefijo para las claves de los widgets
+        filas: Si se indica, solo se devuelven las primeras filas (ver `abrir_dataset`)
+
+    Returns:
+        Tuple[Optional[str], Optional[pd.DataFrame]]: Nombre del dataset y sus datos,
+        o (None, None) si todavía no se eligió nada
+    """
+    registrados = datasets_registrados()
+    if registrados and st.radio("Origen de los datos", ["Subir archivo", "Dataset registrado"],
+                                horizontal=True, key=f"{key}_origen") == "Dataset registrado":
+        nombre = st.selectbox("Dataset", registrados, key=f"{key}_dataset")
+        try:
+            return nombre, abrir_dataset(nombre, filas)
+        except KeyError as e:
+            st.warning(f"⚠️ {e.args[0]}")
+            return None, None
+
+    uploaded_file = st.file_uploader(etiqueta, type=["csv", "xls", "xlsx"], key=f"{key}_archivo")
+    if not uploaded_file:
+        return None, None
+    hoja, columnas = seleccionar_hoja_excel(uploaded_file, key=key)
+    nombre = uploaded_file.name if hoja is None else f"{uploaded_file.name} [{hoja}]"
+    with st.spinner("Cargando el archivo..."):
+        registrar_archivo(nombre, uploaded_file, hoja, columnas)
+    return nombre, abrir_dataset(nombre, filas)
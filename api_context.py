@@ -49,10 +49,16 @@ def generar_contexto_datos() -> str:
             if 'coincidencias' in st.session_state and st.session_state['coincidencias']:
                 coincidencias = st.session_state['coincidencias']
                 contexto += f"\n\nSe han encontrado {len(coincidencias)} coincidencias entre los archivos."
+                # Las coincidencias incluyen el score de similitud (0-100) como tercer elemento
+                scores = [c[2] for c in coincidencias if len(c) > 2]
+                if scores:
+                    contexto += f"\nScore de similitud promedio: {sum(scores) / len(scores):.1f} (mínimo {min(scores)}, máximo {max(scores)})."
                 if len(coincidencias) > 0:
                     contexto += "\nEjemplos de coincidencias:"
-                    for i, (val1, val2) in enumerate(coincidencias[:3]):
+                    for i, (val1, val2, *resto) in enumerate(coincidencias[:3]):
                         contexto += f"\n- '{val1}' coincide con '{val2}'"
+                        if resto:
+                            contexto += f" (similitud {resto[0]}%)"
                         if i >= 2:
                             break
     
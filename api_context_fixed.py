@@ -4,10 +4,11 @@ con soporte para incluir el contexto de los datos cargados en la aplicación.
 """
 
 import streamlit as st
-import requests
+import httpx
 import pandas as pd
-from typing import Dict, List, Any, Optional
-from utils import get_api_key, get_api_url
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+from utils import get_api_key, get_api_url, filas_totales
+from cliente_llm import post_chat, stream_chat
 
 def generar_contexto_datos() -> str:
     """
@@ -26,8 +27,8 @@ def generar_contexto_datos() -> str:
         # Verificar que sean DataFrames válidos
         if isinstance(base_df, pd.DataFrame) and isinstance(new_df, pd.DataFrame):
             contexto += "\n\nEl usuario ha cargado dos archivos de datos:"
-            contexto += f"\n1. Archivo BASE con {len(base_df)} filas y columnas: {', '.join(base_df.columns.tolist())}"
-            contexto += f"\n2. Archivo NUEVO con {len(new_df)} filas y columnas: {', '.join(new_df.columns.tolist())}"
+            contexto += f"\n1. Archivo BASE con {filas_totales(base_df)} filas y columnas: {', '.join(base_df.columns.tolist())}"
+            contexto += f"\n2. Archivo NUEVO con {filas_totales(new_df)} filas y columnas: {', '.join(new_df.columns.tolist())}"
             
             # Incluir ejemplos de datos para mejor contexto
             contexto += "\n\nEjemplo de 3 filas del Archivo BASE:"
@@ -49,10 +50,16 @@ def generar_contexto_datos() -> str:
             if 'coincidencias' in st.session_state and st.session_state['coincidencias']:
                 coincidencias = st.session_state['coincidencias']
                 contexto += f"\n\nSe han encontrado {len(coincidencias)} coincidencias entre los archivos."
+                # Las coincidencias incluyen el score de similitud (0-100) como tercer elemento
+                scores = [c[2] for c in coincidencias if len(c) > 2]
+                if scores:
+                    contexto += f"\nScore de similitud promedio: {sum(scores) / len(scores):.1f} (mínimo {min(scores)}, máximo {max(scores)})."
                 if len(coincidencias) > 0:
                     contexto += "\nEjemplos de coincidencias:"
-                    for i, (val1, val2) in enumerate(coincidencias[:3]):
+                    for i, (val1, val2, *resto) in enumerate(coincidencias[:3]):
                         contexto += f"\n- '{val1}' coincide con '{val2}'"
+                        if resto:
+                            contexto += f" (similitud {resto[0]}%)"
                         if i >= 2:
                             break
     
@@ -138,11 +145,7 @@ def make_api_request_contexto(pregunta: str) -> dict:
     pregunta_enriquecida = f"{contexto}\n\nPregunta del usuario: {pregunta}\n\nResponde a la pregunta del usuario en español, teniendo en cuenta el contexto proporcionado y las funcionalidades de la aplicación para el cruce inteligente de datos."
     
     try:
-        # Uso de la biblioteca requests con verificación SSL desactivada
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
+        # Cliente compartido: reutiliza la conexión abierta (keep-alive, HTTP/2)
         payload = {
             "model": "mistralai/ministral-8b",
             "messages": [
@@ -153,29 +156,20 @@ def make_api_request_contexto(pregunta: str) -> dict:
             "max_tokens": 1000
         }
         
-        response = requests.post(
-            api_url,
-            headers=headers,
-            json=payload,
-            verify=False,  # Desactivar verificación SSL
-            timeout=30.0   # Timeout en segundos
-        )
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
+        return post_chat(api_url, api_key, payload, timeout=30.0)
+    except httpx.HTTPError as e:
         st.error(f"Error de conexión: {str(e)}")
         raise
 
-def make_api_request_agente(pregunta: str) -> dict:
+def _peticion_agente(pregunta: str) -> Tuple[str, str, Dict[str, Any]]:
     """
-    Realiza una petición a la API de Redpill en modo agente, permitiendo un procesamiento
-    más autónomo y orientado a tareas con los datos cargados.
+    Prepara la petición del modo agente: clave, URL y cuerpo con el contexto de los datos.
     
     Args:
         pregunta (str): Pregunta o instrucción del usuario
         
     Returns:
-        dict: Respuesta de la API
+        Tuple[str, str, Dict[str, Any]]: URL de la API, clave API y payload
     """
     api_key = get_api_key("redpill")
     api_url = get_api_url("redpill")
@@ -266,34 +260,53 @@ def make_api_request_agente(pregunta: str) -> dict:
     # Enriquecer la pregunta con el contexto de la aplicación y las instrucciones del agente
     pregunta_enriquecida = f"{contexto}\n\n{instrucciones_agente}\n\nConsulta/Instrucción del usuario: {pregunta}\n\n"
     
-    try:
-        # Uso de la biblioteca requests con verificación SSL desactivada
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}"
-        }
+    # Cuerpo de la petición
+    payload = {
+        "model": "mistralai/ministral-8b",
+        "messages": [
+            {"role": "system", "content": "Eres un agente inteligente especializado en análisis de datos que ayuda a los usuarios a trabajar con archivos CSV y Excel. Puedes analizar, interpretar y actuar sobre los datos proporcionados. DEBES responder SIEMPRE utilizando un formato ESTRUCTURADO con tres secciones: ANÁLISIS, HALLAZGOS y RECOMENDACIONES. Nunca respondas en formato de chat informal."},
+            {"role": "user", "content": pregunta_enriquecida}
+        ],
+        "temperature": 0.3,  # Temperatura más baja para respuestas más determinísticas y estructuradas
+        "max_tokens": 1500,  # Aumentado para permitir respuestas más detalladas
+        "response_format": {"type": "text"}  # Asegurar que la respuesta sea texto
+    }
+    return api_url, api_key, payload
+
+def make_api_request_agente(pregunta: str) -> dict:
+    """
+    Realiza una petición a la API de Redpill en modo agente, permitiendo un procesamiento
+    más autónomo y orientado a tareas con los datos cargados.
+    
+    Args:
+        pregunta (str): Pregunta o instrucción del usuario
         
-        payload = {
-            "model": "mistralai/ministral-8b",
-            "messages": [
-                {"role": "system", "content": "Eres un agente inteligente especializado en análisis de datos que ayuda a los usuarios a trabajar con archivos CSV y Excel. Puedes analizar, interpretar y actuar sobre los datos proporcionados. DEBES responder SIEMPRE utilizando un formato ESTRUCTURADO con tres secciones: ANÁLISIS, HALLAZGOS y RECOMENDACIONES. Nunca respondas en formato de chat informal."},
-                {"role": "user", "content": pregunta_enriquecida}
-            ],
-            "temperature": 0.3,  # Temperatura más baja para respuestas más determinísticas y estructuradas
-            "max_tokens": 1500,  # Aumentado para permitir respuestas más detalladas
-            "response_format": {"type": "text"}  # Asegurar que la respuesta sea texto
-        }
+    Returns:
+        dict: Respuesta de la API
+    """
+    api_url, api_key, payload = _peticion_agente(pregunta)
+    try:
+        # Cliente compartido: reutiliza la conexión abierta (keep-alive, HTTP/2)
+        return post_chat(api_url, api_key, payload, timeout=30.0)
+    except httpx.HTTPError as e:
+        st.error(f"Error de conexión: {str(e)}")
+        raise
+
+def make_api_request_agente_stream(pregunta: str) -> Iterator[str]:
+    """
+    Igual que `make_api_request_agente`, pero devuelve la respuesta en streaming:
+    los tokens llegan a medida que el modelo los genera.
+    
+    Args:
+        pregunta (str): Pregunta o instrucción del usuario
         
-        response = requests.post(
-            api_url,
-            headers=headers,
-            json=payload,
-            verify=False,  # Desactivar verificación SSL
-            timeout=30.0   # Timeout en segundos
-        )
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
+    Yields:
+        str: Fragmentos de texto de la respuesta, en orden
+    """
+    api_url, api_key, payload = _peticion_agente(pregunta)
+    try:
+        yield from stream_chat(api_url, api_key, payload, timeout=30.0)
+    except httpx.HTTPError as e:
         st.error(f"Error de conexión: {str(e)}")
         raise
 
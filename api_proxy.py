@@ -7,6 +7,8 @@ import ssl
 import socket
 from urllib3.poolmanager import PoolManager
 from requests.adapters import HTTPAdapter
+import httpx
+from cliente_llm import http2_disponible, post_chat
 
 # Suprimir advertencias SSL para evitar mensajes molestos en la consola
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -82,12 +84,6 @@ def make_api_request_proxy(api_key, api_url, messages, model="mistralai/ministra
             except Exception as cache_error:
                 print(f"Error al leer caché: {str(cache_error)}")
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    }
-    
     payload = {
         "model": model,
         "messages": messages,
@@ -95,84 +91,19 @@ def make_api_request_proxy(api_key, api_url, messages, model="mistralai/ministra
         "max_tokens": 1000
     }
     
-    # Suprimir advertencias SSL
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    
-    # Extraer el hostname del URL para logs
-    import urllib.parse
-    parsed_url = urllib.parse.urlparse(api_url)
-    hostname = parsed_url.netloc.split(':')[0]
-    
     # Lista de errores para registro
     all_errors = []
     
-    # Método 1: Configuración básica con SSL permisivo
-    try:
-        # Crear sesión simple
-        session = create_session()
-        
-        # Realizar la petición
-        response = session.post(
-            api_url,
-            headers=headers,
-            json=payload,
-            timeout=30.0
-        )
-        
-        # Verificar respuesta
-        response.raise_for_status()
-        
-        # Guardar en caché si está habilitado
-        result = response.json()
-        if use_cache:
-            try:
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    json.dump(result, f, ensure_ascii=False, indent=2)
-            except Exception as cache_write_error:
-                print(f"Error al escribir caché: {str(cache_write_error)}")
-        
-        # Devolver JSON
-        return result
-    
-    except (requests.exceptions.SSLError, requests.exceptions.ConnectionError) as e:
-        all_errors.append(f"Error de SSL/Conexión (método 1): {str(e)}")
-        # Continuar con método alternativo
-    except Exception as e:
-        all_errors.append(f"Error general (método 1): {str(e)}")
-        # Si es un error HTTP, manejarlo específicamente
-        if isinstance(e, requests.exceptions.HTTPError):
-            if hasattr(e.response, 'status_code'):
-                if e.response.status_code == 429:
-                    raise Exception("Se ha excedido el límite de uso de la API. Verifica tu saldo o plan.")
-                elif e.response.status_code == 401:
-                    raise Exception("API key inválida o expirada. Verifica tus credenciales.")
-                else:
-                    raise Exception(f"Error HTTP {e.response.status_code}: {str(e)}")
-            else:
-                raise Exception(f"Error HTTP no especificado: {str(e)}")
-    
-    # Método 2: Usar urllib3 directamente
-    try:
-        # Configurar urllib3 con SSL permisivo
-        http = urllib3.PoolManager(
-            cert_reqs='CERT_NONE',
-            assert_hostname=False
-        )
-        
-        # Realizar la petición
-        response = http.request(
-            'POST', 
-            api_url,
-            body=json.dumps(payload).encode('utf-8'),
-            headers=headers,
-            timeout=30.0
-        )
-        
-        # Verificar respuesta
-        if response.status == 200:
-            result = json.loads(response.data.decode('utf-8'))
+    # Método 1: cliente compartido (conexiones persistentes, HTTP/2 si está disponible)
+    # Método 2: el mismo pool forzando HTTP/1.1, para proxies que no negocian HTTP/2
+    # Si otra sesión hace la misma petición a la vez (misma clave de caché), post_chat comparte su respuesta
+    # Sin h2 el cliente compartido ya usa HTTP/1.1: el método 2 repetiría la misma petición
+    metodos = ((1, True), (2, False)) if http2_disponible() else ((1, False),)
+    for metodo, http2 in metodos:
+        try:
+            result = post_chat(api_url, api_key, payload, timeout=30.0, http2=http2)
             
-            # Guardar en caché
+            # Guardar en caché si está habilitado
             if use_cache:
                 try:
                     with open(cache_file, 'w', encoding='utf-8') as f:
@@ -181,11 +112,20 @@ def make_api_request_proxy(api_key, api_url, messages, model="mistralai/ministra
                     print(f"Error al escribir caché: {str(cache_write_error)}")
             
             return result
-        else:
-            all_errors.append(f"Error HTTP (método 2): {response.status}")
-            
-    except Exception as urllib3_error:
-        all_errors.append(f"Error usando urllib3 (método 2): {str(urllib3_error)}")
+        
+        except httpx.HTTPStatusError as e:
+            # Si es un error HTTP, manejarlo específicamente
+            if e.response.status_code == 429:
+                raise Exception("Se ha excedido el límite de uso de la API. Verifica tu saldo o plan.")
+            elif e.response.status_code == 401:
+                raise Exception("API key inválida o expirada. Verifica tus credenciales.")
+            else:
+                raise Exception(f"Error HTTP {e.response.status_code}: {str(e)}")
+        except httpx.TransportError as e:
+            all_errors.append(f"Error de SSL/Conexión (método {metodo}): {str(e)}")
+            # Continuar con método alternativo
+        except Exception as e:
+            all_errors.append(f"Error general (método {metodo}): {str(e)}")
     
     # Si todos los métodos fallaron, mostrar errores acumulados
     error_message = "Todos los métodos de conexión fallaron:\n" + "\n".join(all_errors)
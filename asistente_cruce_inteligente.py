@@ -8,9 +8,11 @@ import pandas as pd
 import time
 import json
 from typing import Dict, List, Any, Optional, Tuple
-from api_context_fixed import make_api_request_agente, generar_contexto_datos
+from api_context_fixed import make_api_request_agente_stream, generar_contexto_datos
+from cliente_llm import consumir_stream
 from api_fix import ensure_api_key_exists
 from ui_components import stat_card, loading_animation, chat_message, data_card
+from utils import filas_totales
 
 # Asegurar que la API key esté disponible
 ensure_api_key_exists()
@@ -332,14 +334,14 @@ def run_asistente_cruce_inteligente():
         with col1:
             stat_card(
                 title="Registros en archivo BASE", 
-                value=len(base_df), 
+                value=filas_totales(base_df), 
                 icon="📋"
             )
         
         with col2:
             stat_card(
                 title="Registros en archivo NUEVO", 
-                value=len(new_df), 
+                value=filas_totales(new_df), 
                 icon="📄"
             )
         
@@ -347,7 +349,7 @@ def run_asistente_cruce_inteligente():
             # Calcular porcentaje de coincidencias si existe
             if 'coincidencias' in st.session_state and st.session_state['coincidencias']:
                 coincidencias = len(st.session_state['coincidencias'])
-                porcentaje = (coincidencias / len(new_df)) * 100
+                porcentaje = (coincidencias / filas_totales(new_df)) * 100
                 stat_card(
                     title="Coincidencias encontradas", 
                     value=coincidencias, 
@@ -402,23 +404,27 @@ def run_asistente_cruce_inteligente():
             with st.spinner("El agente está analizando tus datos..."):
                 st.info("El agente proporcionará una respuesta estructurada con análisis, hallazgos y recomendaciones, no un chat normal.")
                 try:
-                    # Realizar la consulta a la API en modo agente
-                    respuesta = make_api_request_agente(consulta.strip())
+                    # Mostrar la consulta y respuesta
+                    st.subheader("📝 Tu consulta")
+                    st.info(consulta)
                     
-                    # Guardar en el historial
-                    agregar_consulta_cruce(consulta.strip(), respuesta)
+                    st.subheader("🧠 Análisis del agente")
+                    # La respuesta llega en streaming: las secciones se completan a medida que llegan los tokens
+                    salida = st.empty()
                     
-                    # Obtener texto de respuesta
-                    if "choices" in respuesta and len(respuesta["choices"]) > 0:
-                        respuesta_texto = respuesta["choices"][0]["message"]["content"]
-                        
-                        # Mostrar la consulta y respuesta
-                        st.subheader("📝 Tu consulta")
-                        st.info(consulta)
-                        
-                        st.subheader("🧠 Análisis del agente")
-                        mostrar_analisis_estructurado(respuesta_texto)
+                    def al_actualizar(parcial):
+                        with salida.container():
+                            mostrar_analisis_estructurado(parcial)
+                    
+                    respuesta_texto = consumir_stream(make_api_request_agente_stream(consulta.strip()), al_actualizar)
+                    
+                    if respuesta_texto.strip():
+                        # Guardar en el historial con el mismo formato que una respuesta completa de la API
+                        agregar_consulta_cruce(consulta.strip(), {
+                            "choices": [{"message": {"role": "assistant", "content": respuesta_texto}}]
+                        })
                     else:
+                        salida.empty()
                         st.error("No se pudo obtener una respuesta válida del agente.")
                 except Exception as e:
                     st.error(f"Error al procesar la consulta: {str(e)}")
@@ -10,6 +10,7 @@ import requests
 from typing import Dict, List, Any, Optional, Tuple
 import random
 from api_context import make_api_request_agente, generar_contexto_datos
+from utils import filas_totales
 
 # Colores y estilos personalizados
 COLORS = {
@@ -263,14 +264,14 @@ def show_data_insights():
     
     with col1:
         st.markdown("#### 📄 Archivo BASE")
-        st.write(f"Filas: {len(base_df):,}")
+        st.write(f"Filas: {filas_totales(base_df):,}")
         st.write(f"Columnas: {len(base_df.columns):,}")
         st.markdown("##### Primeras columnas:")
         st.write(", ".join(base_df.columns[:5]))
     
     with col2:
         st.markdown("#### 📄 Archivo NUEVO")
-        st.write(f"Filas: {len(new_df):,}")
+        st.write(f"Filas: {filas_totales(new_df):,}")
         st.write(f"Columnas: {len(new_df.columns):,}")
         st.markdown("##### Primeras columnas:")
         st.write(", ".join(new_df.columns[:5]))
@@ -282,7 +283,7 @@ def show_data_insights():
         
         if len(coincidencias) > 0:
             st.dataframe(
-                pd.DataFrame(coincidencias[:10], columns=["Nuevo", "Base"]),
+                pd.DataFrame(coincidencias[:10], columns=["Nuevo", "Base", "Score"][:len(coincidencias[0])]),
                 use_container_width=True,
                 hide_index=True
             )
@@ -10,7 +10,8 @@ import json
 import random
 import requests
 from typing import Dict, List, Any, Optional, Tuple
-from api_context_fixed import make_api_request_agente, generar_contexto_datos
+from api_context_fixed import make_api_request_agente_stream, generar_contexto_datos
+from cliente_llm import consumir_stream
 from api_fix import ensure_api_key_exists
 
 # Asegurar que la API key esté disponible
@@ -359,19 +360,21 @@ def run_data_assistant():
             show_typing_animation(1.5)
         
         try:
-            # Realizar la consulta a la API
+            # Realizar la consulta a la API en streaming: las secciones se muestran a medida que llegan
             with st.spinner("Analizando datos..."):
-                response_data = make_api_request_agente(user_input)
+                output = st.empty()
                 
-                if response_data and "choices" in response_data and len(response_data["choices"]) > 0:
-                    response_text = response_data["choices"][0]["message"]["content"]
-                    
+                def on_update(partial_text):
+                    with output.container():
+                        show_analysis_result(partial_text)
+                
+                response_text = consumir_stream(make_api_request_agente_stream(user_input), on_update)
+                
+                if response_text.strip():
                     # Agregar respuesta al historial
                     add_message(is_user=False, message=response_text)
-                    
-                    # Mostrar resultados con formato mejorado
-                    show_analysis_result(response_text)
                 else:
+                    output.empty()
                     st.error("No se pudo obtener una respuesta válida. Por favor, intenta nuevamente.")
         except Exception as e:
             st.error(f"Ocurrió un error durante el análisis: {str(e)}")
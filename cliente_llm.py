@@ -0,0 +1,341 @@
+"""
+Cliente HTTP compartido para las llamadas a los modelos de lenguaje.
+
+Un único `httpx.Client` por proceso, con pool de conexiones persistentes
+(keep-alive) y HTTP/2 si el paquete `h2` está instalado. Todas las llamadas a
+Redpill y OpenAI pasan por acá, así que las preguntas siguientes reutilizan la
+conexión abierta en lugar de repetir el handshake TCP y TLS en cada una.
+`httpx.Client` es seguro para usar desde varios hilos. Cada petición pasa por el
+limitador de su proveedor (ver `limitador_llm`), que la espacia y reintenta los 429.
+
+`stream_chat` pide la respuesta en modo streaming (`stream: true`) y devuelve los
+tokens a medida que llegan por server-sent events, para mostrar la respuesta sin
+esperar a que el modelo termine.
+
+Las peticiones idénticas que se hacen a la vez (mismo endpoint, clave y cuerpo,
+p. ej. varios usuarios que eligen la misma sugerencia sobre el mismo dataset)
+se agrupan en una sola llamada en vuelo y todas reciben su resultado; en
+streaming, cada una recibe todos los tokens desde el principio.
+"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import httpx
+import urllib3
+
+from limitador_llm import TransporteLimitado
+
+# Conexiones simultáneas por proceso y conexiones inactivas que se mantienen abiertas
+CONEXIONES_MAXIMAS = 20
+CONEXIONES_EN_ESPERA = 10
+
+# Segundos que una conexión inactiva permanece abierta para reutilizarse
+SEGUNDOS_KEEPALIVE = 120
+
+# Timeout por defecto de una llamada (segundos)
+TIMEOUT_LLM = 30.0
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+_clientes: Dict[bool, httpx.Client] = {}
+_bloqueo = threading.Lock()
+
+# Peticiones en vuelo por clave (ver `clave_peticion`)
+_vuelos: Dict[str, Any] = {}
+_bloqueo_vuelos = threading.Lock()
+
+# Las llamadas usan SSL permisivo, como el resto de la aplicación
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def http2_disponible() -> bool:
+    """Indica si está instalado `h2`, necesario para que httpx use HTTP/2."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def obtener_cliente(http2: bool = True) -> httpx.Client:
+    """
+    Devuelve el cliente compartido del proceso, creándolo la primera vez.
+
+    Args:
+        http2: Si es False, devuelve un cliente aparte que solo usa HTTP/1.1
+            (para servidores o proxies que no negocian bien HTTP/2)
+
+    Returns:
+        httpx.Client: Cliente con pool de conexiones persistentes
+    """
+    http2 = http2 and http2_disponible()
+    cliente = _clientes.get(http2)
+    if cliente is not None and not cliente.is_closed:
+        return cliente
+    with _bloqueo:
+        cliente = _clientes.get(http2)
+        if cliente is None or cliente.is_closed:
+            transporte = httpx.HTTPTransport(
+                http2=http2,
+                verify=False,
+                limits=httpx.Limits(max_connections=CONEXIONES_MAXIMAS,
+                                    max_keepalive_connections=CONEXIONES_EN_ESPERA,
+                                    keepalive_expiry=SEGUNDOS_KEEPALIVE),
+            )
+            cliente = httpx.Client(
+                transport=TransporteLimitado(transporte),
+                timeout=TIMEOUT_LLM,
+                headers={"User-Agent": USER_AGENT},
+            )
+            _clientes[http2] = cliente
+    return cliente
+
+
+def clave_peticion(api_url: str, api_key: str, payload: Dict[str, Any]) -> str:
+    """Clave que identifica peticiones idénticas: hash del endpoint, la clave API y el cuerpo."""
+    return hashlib.md5(json.dumps({
+        "api_url": api_url,
+        "api_key": api_key,
+        "payload": payload,
+    }, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class _Vuelo:
+    """Resultado compartido de una petición en vuelo."""
+
+    def __init__(self):
+        self.terminado = threading.Event()
+        self.completo = False
+        self.resultado = None
+        self.error: Optional[Exception] = None
+
+
+def _en_vuelo(clave: str, funcion: Callable[[], Any]) -> Any:
+    """
+    Ejecuta `funcion` una sola vez para todas las llamadas simultáneas con la misma clave.
+
+    La primera llamada la ejecuta; las que llegan mientras tanto esperan y reciben una
+    copia del mismo resultado (o la misma excepción).
+    """
+    while True:
+        with _bloqueo_vuelos:
+            vuelo = _vuelos.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = _vuelos[clave] = _Vuelo()
+        if lider:
+            try:
+                vuelo.resultado = funcion()
+                vuelo.completo = True
+                return vuelo.resultado
+            except Exception as e:
+                vuelo.error = e
+                vuelo.completo = True
+                raise
+            finally:
+                with _bloqueo_vuelos:
+                    del _vuelos[clave]
+                vuelo.terminado.set()
+
+        vuelo.terminado.wait()
+        if vuelo.error is not None:
+            raise vuelo.error
+        if vuelo.completo:
+            return copy.deepcopy(vuelo.resultado)
+        # La primera llamada se interrumpió (p. ej. un rerun de Streamlit): se vuelve a intentar
+
+
+def post_chat(api_url: str, api_key: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+              http2: bool = True) -> Dict[str, Any]:
+    """
+    Envía una petición de chat completions y devuelve la respuesta JSON.
+
+    Si ya hay una petición idéntica en vuelo, espera su respuesta en lugar de enviar otra.
+
+    Args:
+        api_url: URL del endpoint de chat completions
+        api_key: Clave API (se envía como Bearer)
+        payload: Cuerpo de la petición (modelo, mensajes, temperatura...)
+        timeout: Timeout en segundos (por defecto TIMEOUT_LLM)
+        http2: Si es False, usa el cliente HTTP/1.1
+
+    Returns:
+        Dict[str, Any]: Respuesta de la API
+
+    Raises:
+        httpx.HTTPStatusError: Si la API responde con un código de error
+        httpx.RequestError: Si falla la conexión
+    """
+    def enviar() -> Dict[str, Any]:
+        respuesta = obtener_cliente(http2).post(
+            api_url,
+            json=payload,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout if timeout is not None else TIMEOUT_LLM,
+        )
+        respuesta.raise_for_status()
+        return respuesta.json()
+
+    return _en_vuelo(clave_peticion(api_url, api_key, payload), enviar)
+
+
+class _VueloStream:
+    """Tokens compartidos de una petición en streaming en vuelo."""
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.terminado = False
+        self.error: Optional[Exception] = None
+        self.condicion = threading.Condition()
+
+    def bombear(self, clave: str, tokens: Iterator[str]) -> None:
+        """Lee el stream de la API (en un hilo propio) y publica cada token."""
+        try:
+            for token in tokens:
+                with self.condicion:
+                    self.tokens.append(token)
+                    self.condicion.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            with _bloqueo_vuelos:
+                _vuelos.pop(clave, None)
+            with self.condicion:
+                self.terminado = True
+                self.condicion.notify_all()
+
+    def leer(self) -> Iterator[str]:
+        """Devuelve todos los tokens, desde el principio, a medida que llegan."""
+        leidos = 0
+        while True:
+            with self.condicion:
+                while leidos == len(self.tokens) and not self.terminado:
+                    self.condicion.wait()
+                nuevos = self.tokens[leidos:]
+                terminado = self.terminado
+            leidos += len(nuevos)
+            yield from nuevos
+            if terminado:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+def stream_chat(api_url: str, api_key: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+                http2: bool = True) -> Iterator[str]:
+    """
+    Envía una petición de chat completions en modo streaming y devuelve los tokens.
+
+    El stream se lee en un hilo aparte; si ya hay una petición idéntica en vuelo,
+    se reciben sus tokens en lugar de enviar otra.
+
+    Args:
+        api_url: URL del endpoint de chat completions
+        api_key: Clave API (se envía como Bearer)
+        payload: Cuerpo de la petición; se le agrega `stream: true`
+        timeout: Timeout en segundos entre datos recibidos (por defecto TIMEOUT_LLM)
+        http2: Si es False, usa el cliente HTTP/1.1
+
+    Yields:
+        str: Fragmentos de texto de la respuesta, en orden
+
+    Raises:
+        httpx.HTTPStatusError: Si la API responde con un código de error
+        httpx.RequestError: Si falla la conexión
+    """
+    clave = clave_peticion(api_url, api_key, {**payload, "stream": True})
+    with _bloqueo_vuelos:
+        vuelo = _vuelos.get(clave)
+        if vuelo is None:
+            vuelo = _vuelos[clave] = _VueloStream()
+            threading.Thread(target=vuelo.bombear,
+                             args=(clave, _leer_stream(api_url, api_key, payload, timeout, http2)),
+                             daemon=True).start()
+    yield from vuelo.leer()
+
+
+def _leer_stream(api_url: str, api_key: str, payload: Dict[str, Any], timeout: Optional[float],
+                 http2: bool) -> Iterator[str]:
+    """Envía la petición en streaming y devuelve los tokens de los eventos SSE."""
+    with obtener_cliente(http2).stream(
+        "POST",
+        api_url,
+        json={**payload, "stream": True},
+        headers={"Authorization": f"Bearer {api_key}", "Accept": "text/event-stream"},
+        timeout=timeout if timeout is not None else TIMEOUT_LLM,
+    ) as respuesta:
+        if respuesta.is_error:
+            respuesta.read()
+        respuesta.raise_for_status()
+        for linea in respuesta.iter_lines():
+            # Eventos SSE: "data: {json}"; las líneas vacías y los comentarios (":") se ignoran
+            if not linea.startswith("data:"):
+                continue
+            datos = linea[len("data:"):].strip()
+            if datos == "[DONE]":
+                break
+            try:
+                evento = json.loads(datos)
+            except json.JSONDecodeError:
+                continue
+            for opcion in evento.get("choices") or []:
+                texto = (opcion.get("delta") or {}).get("content")
+                if texto:
+                    yield texto
+
+
+def consumir_stream(tokens: Iterator[str], al_actualizar: Callable[[str], None],
+                    intervalo: float = 0.15) -> str:
+    """
+    Acumula los tokens de `stream_chat` y avisa el texto parcial a intervalos.
+
+    Args:
+        tokens: Tokens de la respuesta
+        al_actualizar: Función llamada con el texto acumulado (como máximo una vez
+            por intervalo, y siempre al terminar)
+        intervalo: Segundos mínimos entre actualizaciones
+
+    Returns:
+        str: Texto completo de la respuesta
+    """
+    texto = ""
+    ultima = 0.0
+    for token in tokens:
+        texto += token
+        ahora = time.monotonic()
+        if ahora - ultima >= intervalo:
+            al_actualizar(texto)
+            ultima = ahora
+    al_actualizar(texto)
+    return texto
+
+
+def cliente_openai(api_key: str):
+    """
+    Cliente del SDK de OpenAI que usa el pool de conexiones compartido.
+
+    Los reintentos del SDK quedan desactivados: los 429 ya los reintenta, con
+    backoff, el transporte del pool (ver `limitador_llm.TransporteLimitado`), y
+    sumar los del SDK multiplicaría las peticiones a un proveedor saturado.
+
+    Args:
+        api_key: Clave API de OpenAI
+
+    Returns:
+        openai.OpenAI: Cliente del SDK (liviano; la conexión es la del pool)
+    """
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, http_client=obtener_cliente(), max_retries=0)
+
+
+def cerrar_clientes() -> None:
+    """Cierra los clientes compartidos y sus conexiones (se recrean al volver a usarlos)."""
+    with _bloqueo:
+        for cliente in _clientes.values():
+            cliente.close()
+        _clientes.clear()
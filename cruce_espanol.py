@@ -0,0 +1,261 @@
+"""
+Claves normalizadas y fonéticas para nombres y direcciones en español.
+
+Las claves se precalculan una sola vez por columna (sobre los valores distintos)
+y se guardan como arrays categóricos: la normalización quita acentos, unifica
+mayúsculas, expande abreviaturas ("Av.", "Bs As", "CABA"...) y ordena los tokens;
+la clave fonética agrupa grafías que suenan igual en español (b/v, c/s/z, ll/y,
+h muda...). El cruce usa la clave fonética para formar bloques y compara las
+claves normalizadas ya calculadas en lugar de procesar cada par.
+"""
+
+import hashlib
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz as rf_fuzz
+from rapidfuzz import process as rf_process
+
+from motor_cruce import IndiceBloques, cruzar_exactas
+
+# Abreviaturas frecuentes en nombres, razones sociales y direcciones (ya sin
+# acentos ni puntuación). Las de varias palabras se aplican primero
+ABREVIATURAS = {
+    "bs as": "buenos aires",
+    "cap fed": "capital federal",
+    "s a": "sociedad anonima",
+    "s r l": "sociedad de responsabilidad limitada",
+    "caba": "ciudad autonoma de buenos aires",
+    "av": "avenida",
+    "avda": "avenida",
+    "bv": "bulevar",
+    "bvar": "bulevar",
+    "blvd": "bulevar",
+    "pje": "pasaje",
+    "pcia": "provincia",
+    "prov": "provincia",
+    "cdad": "ciudad",
+    "esq": "esquina",
+    "nro": "numero",
+    "gral": "general",
+    "pte": "presidente",
+    "tte": "teniente",
+    "dr": "doctor",
+    "dra": "doctora",
+    "ing": "ingeniero",
+    "sta": "santa",
+    "sto": "santo",
+    "sa": "sociedad anonima",
+    "srl": "sociedad de responsabilidad limitada",
+    "sas": "sociedad por acciones simplificada",
+    "cia": "compania",
+    "hnos": "hermanos",
+}
+
+_ABREVIATURAS_COMPUESTAS = [(f" {a} ", f" {e} ") for a, e in ABREVIATURAS.items() if " " in a]
+_ABREVIATURAS_SIMPLES = {a: e for a, e in ABREVIATURAS.items() if " " not in a}
+
+# Reglas fonéticas en orden de aplicación: los dígrafos antes que las letras sueltas
+_REGLAS_FONETICAS = [
+    (re.compile(r"ch"), "X"),
+    (re.compile(r"ll"), "Y"),
+    (re.compile(r"qu"), "K"),
+    (re.compile(r"gu(?=[ei])"), "G"),
+    (re.compile(r"g(?=[ei])"), "J"),
+    (re.compile(r"c(?=[ei])"), "S"),
+    (re.compile(r"h"), ""),
+    (re.compile(r"y(?=[^aeiou]|$)"), "I"),
+    (re.compile(r"x"), "KS"),
+    (re.compile(r"[zs]"), "S"),
+    (re.compile(r"[ckq]"), "K"),
+    (re.compile(r"[bvw]"), "B"),
+    (re.compile(r"(.)\1+"), r"\1"),
+]
+
+# Columnas cuyas claves se conservan en memoria (las más recientes)
+CLAVES_EN_MEMORIA = 8
+
+_CACHE_CLAVES: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+
+
+def normalizar_es(valor: Any) -> str:
+    """
+    Normaliza un nombre o dirección en español.
+
+    Args:
+        valor: Valor a normalizar (se convierte a string)
+
+    Returns:
+        str: Tokens sin acentos, en minúsculas, con las abreviaturas expandidas y
+        ordenados alfabéticamente
+    """
+    texto = unicodedata.normalize("NFKD", str(valor)).encode("ascii", errors="ignore").decode("ascii")
+    texto = " " + " ".join(re.sub(r"[^0-9a-z]+", " ", texto.casefold()).split()) + " "
+    for abreviatura, expansion in _ABREVIATURAS_COMPUESTAS:
+        texto = texto.replace(abreviatura, expansion)
+    tokens = [_ABREVIATURAS_SIMPLES.get(t, t) for t in texto.split()]
+    return " ".join(sorted(" ".join(tokens).split()))
+
+
+def fonetica_es(clave: str) -> str:
+    """
+    Codifica fonéticamente una clave ya normalizada con `normalizar_es`.
+
+    Args:
+        clave: Clave normalizada
+
+    Returns:
+        str: Códigos fonéticos de cada token, ordenados alfabéticamente
+    """
+    codigos = []
+    for token in clave.split():
+        for patron, reemplazo in _REGLAS_FONETICAS:
+            token = patron.sub(reemplazo, token)
+        if token:
+            codigos.append(token.upper())
+    return " ".join(sorted(codigos))
+
+
+def precalcular_claves(valores: pd.Series) -> pd.DataFrame:
+    """
+    Calcula las claves normalizada y fonética de una columna.
+
+    Cada valor distinto se procesa una sola vez y el resultado se conserva en
+    memoria según el contenido de la columna, así que volver a cruzar la misma
+    columna no repite el cálculo.
+
+    Args:
+        valores: Valores de la columna
+
+    Returns:
+        pd.DataFrame: Columnas categóricas `normalizada` y `fonetica`, una fila por valor
+    """
+    textos = valores.reset_index(drop=True).map(str)
+    contenido = hashlib.sha256(pd.util.hash_pandas_object(textos, index=False).values.tobytes()).hexdigest()
+    if contenido in _CACHE_CLAVES:
+        _CACHE_CLAVES.move_to_end(contenido)
+        return _CACHE_CLAVES[contenido]
+
+    codigos, distintos = pd.factorize(textos)
+    normalizadas = [normalizar_es(v) for v in distintos]
+    foneticas = [fonetica_es(c) for c in normalizadas]
+    claves = pd.DataFrame({
+        "normalizada": pd.Categorical(np.asarray(normalizadas, dtype=object)[codigos]),
+        "fonetica": pd.Categorical(np.asarray(foneticas, dtype=object)[codigos]),
+    })
+
+    _CACHE_CLAVES[contenido] = claves
+    if len(_CACHE_CLAVES) > CLAVES_EN_MEMORIA:
+        _CACHE_CLAVES.popitem(last=False)
+    return claves
+
+
+def cruzar_espanol(valores_nuevos: Iterable[Any], valores_base: Iterable[Any], umbral: int = 85, k: int = 1,
+                   al_progresar: Optional[Callable[[int, int, List[Tuple[Any, Any, int]]], Optional[bool]]] = None
+                   ) -> Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]:
+    """
+    Cruce con claves en español: hash join, bloques fonéticos y fuzzy sobre claves normalizadas.
+
+    Args:
+        valores_nuevos: Valores del campo clave del archivo NUEVO
+        valores_base: Valores del campo clave del archivo BASE
+        umbral: Umbral de similitud (0-100)
+        k: Cantidad máxima de coincidencias por valor del NUEVO
+        al_progresar: Función llamada tras cada etapa o lote con las filas procesadas,
+            el total y las coincidencias parciales; si devuelve False el cruce se detiene
+
+    Returns:
+        Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]: Coincidencias (valor
+        nuevo, valor base, score) en el orden del NUEVO y filas por etapa
+        (`exacta`, `normalizada`, `fonetica`, `difusa` y `pendientes` si se canceló)
+    """
+    valores_nuevos = pd.Series(list(valores_nuevos), dtype=object)
+    valores_base = pd.Series(list(valores_base), dtype=object)
+
+    resultado = cruzar_exactas(valores_nuevos, valores_base)
+    por_fila: Dict[int, List[Tuple[Any, Any, int]]] = {
+        fila: [(resultado.at[fila, "valor_nuevo"], resultado.at[fila, "valor_base"], 100)]
+        for fila in resultado.index[resultado["etapa"].notna()]
+    }
+
+    # Coincidencias parciales para el progreso: se agregan las de cada etapa y
+    # fragmento (el orden del NUEVO se arma una sola vez, al final)
+    parciales: List[Tuple[Any, Any, int]] = []
+
+    def progresar(procesadas):
+        return al_progresar is None or al_progresar(procesadas, len(valores_nuevos), parciales) is not False
+
+    def en_orden():
+        return [c for fila in sorted(por_fila) for c in por_fila[fila]]
+
+    claves_nuevas = precalcular_claves(valores_nuevos)
+    claves_base = precalcular_claves(valores_base)
+
+    # Una fila del BASE por clave normalizada (la primera en que aparece)
+    base = pd.DataFrame({
+        "normalizada": claves_base["normalizada"].astype(object),
+        "fonetica": claves_base["fonetica"].astype(object),
+        "valor_base": valores_base,
+    }).drop_duplicates("normalizada", keep="first").reset_index(drop=True)
+    base["id_base"] = np.arange(len(base))
+
+    # Bloques fonéticos: solo se comparan las claves que suenan igual
+    pendientes = pd.DataFrame({
+        "fila": resultado.index[resultado["etapa"].isna()],
+    })
+    pendientes["normalizada"] = claves_nuevas["normalizada"].astype(object).to_numpy()[pendientes["fila"]]
+    pendientes["fonetica"] = claves_nuevas["fonetica"].astype(object).to_numpy()[pendientes["fila"]]
+    pares = pendientes[pendientes["fonetica"] != ""].merge(
+        base[["fonetica", "normalizada", "id_base"]], on="fonetica", suffixes=("", "_base")
+    )
+    if len(pares):
+        pares["score"] = rf_process.cpdist(pares["normalizada"].tolist(), pares["normalizada_base"].tolist(),
+                                           scorer=rf_fuzz.token_sort_ratio, workers=-1)
+        pares = pares[np.rint(pares["score"]) >= umbral]
+        pares = pares.sort_values(["fila", "score", "id_base"], ascending=[True, False, True])
+        for fila, grupo in pares.groupby("fila", sort=False):
+            resultado.at[fila, "etapa"] = "fonetica"
+            por_fila[fila] = [
+                (resultado.at[fila, "valor_nuevo"], base.at[id_base, "valor_base"], int(round(score)))
+                for id_base, score in zip(grupo["id_base"][:k], grupo["score"][:k])
+            ]
+
+    parciales.extend(en_orden())
+    procesadas = int(resultado["etapa"].notna().sum())
+    if not progresar(procesadas):
+        return en_orden(), _contar_etapas(resultado, int(resultado["etapa"].isna().sum()))
+
+    # Fuzzy con índice de bloques sobre las claves normalizadas ya calculadas
+    indice = IndiceBloques(base["normalizada"])
+    restantes = pendientes[~pendientes["fila"].isin(por_fila)]
+    sin_procesar = 0
+    for inicio in range(0, len(restantes), 1000):
+        lote = restantes.iloc[inicio:inicio + 1000]
+        for fila, mejores in zip(lote["fila"], indice.buscar_mejores_lote(lote["normalizada"], umbral, k)):
+            if mejores:
+                resultado.at[fila, "etapa"] = "difusa"
+                por_fila[fila] = [
+                    (resultado.at[fila, "valor_nuevo"], base.at[id_clave, "valor_base"], score)
+                    for id_clave, score in mejores
+                ]
+                parciales.extend(por_fila[fila])
+        procesadas += len(lote)
+        if not progresar(procesadas):
+            sin_procesar = len(restantes) - inicio - len(lote)
+            break
+
+    return en_orden(), _contar_etapas(resultado, sin_procesar)
+
+
+def _contar_etapas(resultado: pd.DataFrame, pendientes: int) -> Dict[str, int]:
+    """Cuenta las filas resueltas en cada etapa."""
+    etapas = {
+        etapa: int((resultado["etapa"] == etapa).sum())
+        for etapa in ("exacta", "normalizada", "fonetica", "difusa")
+    }
+    etapas["pendientes"] = pendientes
+    return etapas
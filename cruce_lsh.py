@@ -0,0 +1,251 @@
+"""
+Modo de cruce aproximado (MinHash/LSH) para archivos muy grandes.
+
+Calcula firmas MinHash sobre los shingles de caracteres de cada clave y las agrupa
+en buckets LSH (bandas x filas). Solo los pares que comparten algún bucket se
+verifican con el mismo umbral de token_sort_ratio del cruce exacto. Como el
+resultado es aproximado, se estima el recall comparando una muestra de filas
+contra una búsqueda exhaustiva.
+"""
+
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz as rf_fuzz
+from rapidfuzz import process as rf_process
+
+from motor_cruce import cruzar_exactas, normalizar_clave
+from utils import similarity_matrix
+
+# Tamaño de los shingles de caracteres
+TAMANO_SHINGLE = 3
+
+# Primo de Mersenne para las permutaciones (a * x + b) mod p
+PRIMO = (1 << 31) - 1
+
+# Semilla fija: las mismas claves producen siempre las mismas firmas
+SEMILLA = 42
+
+# Claves y permutaciones que se procesan juntas al calcular firmas (limita la memoria)
+CLAVES_POR_PASO = 50_000
+PERMUTACIONES_POR_PASO = 8
+
+# Los buckets del BASE con más claves se descartan: son claves muy genéricas que
+# generarían demasiados pares candidatos
+CUBETA_MAXIMA = 1000
+
+# Filas del NUEVO usadas para estimar el recall contra una búsqueda exhaustiva
+MUESTRA_RECALL = 200
+
+
+def shingles(clave: str) -> List[int]:
+    """
+    Obtiene los hashes de los shingles de caracteres de una clave normalizada.
+
+    Args:
+        clave: Clave normalizada
+
+    Returns:
+        List[int]: Hashes (crc32) de los shingles distintos; las claves más cortas
+        que un shingle se usan completas y las vacías no tienen shingles
+    """
+    if len(clave) < TAMANO_SHINGLE:
+        return [zlib.crc32(clave.encode())] if clave else []
+    return list({
+        zlib.crc32(clave[i:i + TAMANO_SHINGLE].encode())
+        for i in range(len(clave) - TAMANO_SHINGLE + 1)
+    })
+
+
+def firmas_minhash(claves: List[str], num_permutaciones: int) -> np.ndarray:
+    """
+    Calcula las firmas MinHash de una lista de claves no vacías.
+
+    Args:
+        claves: Claves normalizadas (todas con al menos un shingle)
+        num_permutaciones: Cantidad de valores por firma (bandas x filas)
+
+    Returns:
+        np.ndarray: Matriz uint64 de tamaño len(claves) x num_permutaciones
+    """
+    rng = np.random.default_rng(SEMILLA)
+    a = rng.integers(1, PRIMO, num_permutaciones, dtype=np.uint64)
+    b = rng.integers(0, PRIMO, num_permutaciones, dtype=np.uint64)
+    firmas = np.empty((len(claves), num_permutaciones), dtype=np.uint64)
+
+    for inicio in range(0, len(claves), CLAVES_POR_PASO):
+        hashes = [shingles(c) for c in claves[inicio:inicio + CLAVES_POR_PASO]]
+        longitudes = np.array([len(h) for h in hashes])
+        desplazamientos = np.concatenate(([0], np.cumsum(longitudes)[:-1]))
+        planos = np.fromiter((x for h in hashes for x in h), dtype=np.uint64) % np.uint64(PRIMO)
+        for p in range(0, num_permutaciones, PERMUTACIONES_POR_PASO):
+            q = min(p + PERMUTACIONES_POR_PASO, num_permutaciones)
+            permutados = (a[p:q, None] * planos[None, :] + b[p:q, None]) % np.uint64(PRIMO)
+            firmas[inicio:inicio + len(hashes), p:q] = np.minimum.reduceat(permutados, desplazamientos, axis=1).T
+    return firmas
+
+
+def _cubetas(firmas: np.ndarray, bandas: int, filas: int) -> np.ndarray:
+    """Combina las filas de cada banda en un único hash por banda (len(firmas) x bandas)."""
+    rng = np.random.default_rng(SEMILLA + 1)
+    multiplicadores = rng.integers(1, np.iinfo(np.int64).max, filas, dtype=np.uint64) | np.uint64(1)
+    cubetas = np.empty((len(firmas), bandas), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for banda in range(bandas):
+            tramo = firmas[:, banda * filas:(banda + 1) * filas]
+            cubetas[:, banda] = (tramo * multiplicadores).sum(axis=1)
+    return cubetas
+
+
+def umbral_jaccard(bandas: int, filas: int) -> float:
+    """
+    Similitud de Jaccard a partir de la cual un par tiene ~50% de probabilidad de
+    compartir un bucket. Más bandas lo bajan (más recall), más filas lo suben
+    (menos candidatos).
+    """
+    return (1 / bandas) ** (1 / filas)
+
+
+def pares_candidatos(claves_nuevas: List[str], claves_base: List[str],
+                     bandas: int, filas: int) -> pd.DataFrame:
+    """
+    Obtiene los pares (nuevo, base) que comparten al menos un bucket LSH.
+
+    Args:
+        claves_nuevas: Claves normalizadas del NUEVO
+        claves_base: Claves normalizadas del BASE (sin repetir)
+        bandas: Cantidad de bandas
+        filas: Filas (valores de la firma) por banda
+
+    Returns:
+        pd.DataFrame: Columnas `id_nuevo` e `id_base` (posiciones en cada lista)
+    """
+    con_shingles_nuevo = np.array([bool(c) for c in claves_nuevas], dtype=bool)
+    con_shingles_base = np.array([bool(c) for c in claves_base], dtype=bool)
+    ids_nuevo = np.flatnonzero(con_shingles_nuevo)
+    ids_base = np.flatnonzero(con_shingles_base)
+    if len(ids_nuevo) == 0 or len(ids_base) == 0:
+        return pd.DataFrame({"id_nuevo": [], "id_base": []}, dtype=np.int64)
+
+    num_permutaciones = bandas * filas
+    cubetas_nuevo = _cubetas(firmas_minhash([claves_nuevas[i] for i in ids_nuevo], num_permutaciones), bandas, filas)
+    cubetas_base = _cubetas(firmas_minhash([claves_base[i] for i in ids_base], num_permutaciones), bandas, filas)
+
+    pares = []
+    for banda in range(bandas):
+        base = pd.DataFrame({"cubeta": cubetas_base[:, banda], "id_base": ids_base})
+        tamanos = base["cubeta"].map(base["cubeta"].value_counts())
+        base = base[tamanos <= CUBETA_MAXIMA]
+        nuevo = pd.DataFrame({"cubeta": cubetas_nuevo[:, banda], "id_nuevo": ids_nuevo})
+        pares.append(nuevo.merge(base, on="cubeta")[["id_nuevo", "id_base"]])
+    return pd.concat(pares, ignore_index=True).drop_duplicates()
+
+
+def estimar_recall(claves_nuevas: List[str], claves_base: List[str], encontrados: set,
+                   umbral: int, tamano_muestra: int = MUESTRA_RECALL) -> Tuple[Optional[float], int]:
+    """
+    Estima el recall del modo aproximado contra una búsqueda exhaustiva sobre una muestra.
+
+    Args:
+        claves_nuevas: Claves normalizadas del NUEVO
+        claves_base: Claves normalizadas del BASE (sin repetir)
+        encontrados: Posiciones del NUEVO para las que el modo aproximado encontró coincidencia
+        umbral: Umbral de similitud (0-100)
+        tamano_muestra: Filas del NUEVO a verificar de forma exhaustiva
+
+    Returns:
+        Tuple[Optional[float], int]: Recall estimado (None si ninguna fila de la
+        muestra tiene coincidencias) y filas de la muestra con coincidencia real
+    """
+    if not claves_nuevas or not claves_base:
+        return None, 0
+    rng = np.random.default_rng(SEMILLA)
+    muestra = rng.choice(len(claves_nuevas), size=min(tamano_muestra, len(claves_nuevas)), replace=False)
+
+    reales = []
+    # Pocas filas por matriz para acotar la memoria frente a un BASE de millones de claves
+    for inicio in range(0, len(muestra), 16):
+        lote = muestra[inicio:inicio + 16]
+        scores = similarity_matrix([claves_nuevas[i] for i in lote], claves_base,
+                                   scorer=rf_fuzz.ratio, threshold=umbral - 0.5)
+        reales.extend(int(i) for i, fila in zip(lote, scores) if (np.rint(fila) >= umbral).any())
+
+    if not reales:
+        return None, 0
+    return sum(1 for i in reales if i in encontrados) / len(reales), len(reales)
+
+
+def cruzar_lsh(valores_nuevos: Iterable[Any], valores_base: Iterable[Any], umbral: int = 85, k: int = 1,
+               bandas: int = 16, filas: int = 4,
+               tamano_muestra: int = MUESTRA_RECALL) -> Tuple[List[Tuple[Any, Any, int]], Dict[str, Any]]:
+    """
+    Cruce aproximado: hash join exacto/normalizado y MinHash/LSH para el resto.
+
+    Args:
+        valores_nuevos: Valores del campo clave del archivo NUEVO
+        valores_base: Valores del campo clave del archivo BASE
+        umbral: Umbral de similitud (0-100) con el que se verifican los candidatos
+        k: Cantidad máxima de coincidencias por valor del NUEVO
+        bandas: Cantidad de bandas LSH
+        filas: Filas de la firma por banda
+        tamano_muestra: Filas usadas para estimar el recall (0 para no estimarlo)
+
+    Returns:
+        Tuple[List[Tuple[Any, Any, int]], Dict[str, Any]]: Coincidencias (valor
+        nuevo, valor base, score) en el orden del NUEVO y estadísticas: filas por
+        etapa, `pares_candidatos` verificados, `recall_estimado` (o None) y
+        `muestra_recall` (filas de la muestra con coincidencia real)
+    """
+    valores_nuevos = pd.Series(list(valores_nuevos), dtype=object)
+    valores_base = pd.Series(list(valores_base), dtype=object)
+
+    resultado = cruzar_exactas(valores_nuevos, valores_base)
+    por_fila: Dict[int, List[Tuple[Any, Any, int]]] = {
+        fila: [(resultado.at[fila, "valor_nuevo"], resultado.at[fila, "valor_base"], 100)]
+        for fila in resultado.index[resultado["etapa"].notna()]
+    }
+    pendientes = resultado.index[resultado["etapa"].isna()]
+
+    # Claves del BASE sin repetir, conservando la primera fila de cada una
+    base = pd.DataFrame({"clave": [normalizar_clave(v) for v in valores_base], "valor": valores_base})
+    base = base.drop_duplicates("clave", keep="first").reset_index(drop=True)
+    claves_base = base["clave"].tolist()
+    claves_nuevas = [normalizar_clave(v) for v in resultado.loc[pendientes, "valor_nuevo"]]
+
+    pares = pares_candidatos(claves_nuevas, claves_base, bandas, filas)
+    verificados = len(pares)
+    encontrados = set()
+    if len(pares):
+        scores = rf_process.cpdist(
+            [claves_nuevas[i] for i in pares["id_nuevo"]], [claves_base[i] for i in pares["id_base"]],
+            scorer=rf_fuzz.ratio, score_cutoff=umbral - 0.5, workers=-1
+        )
+        pares = pares.assign(score=scores)
+        pares = pares[np.rint(pares["score"]) >= umbral]
+        # Los k mejores por fila; ante empates, la primera fila del BASE
+        pares = pares.sort_values(["id_nuevo", "score", "id_base"], ascending=[True, False, True])
+        pares = pares.groupby("id_nuevo", sort=False).head(k)
+        for id_nuevo, grupo in pares.groupby("id_nuevo", sort=False):
+            fila = pendientes[id_nuevo]
+            resultado.at[fila, "etapa"] = "difusa"
+            por_fila[fila] = [
+                (resultado.at[fila, "valor_nuevo"], base.at[id_base, "valor"], int(round(score)))
+                for id_base, score in zip(grupo["id_base"], grupo["score"])
+            ]
+            encontrados.add(int(id_nuevo))
+
+    recall, muestra = (None, 0)
+    if tamano_muestra > 0:
+        recall, muestra = estimar_recall(claves_nuevas, claves_base, encontrados, umbral, tamano_muestra)
+
+    coincidencias = [c for fila in sorted(por_fila) for c in por_fila[fila]]
+    etapas = {
+        etapa: int((resultado["etapa"] == etapa).sum())
+        for etapa in ("exacta", "normalizada", "difusa")
+    }
+    etapas["pares_candidatos"] = verificados
+    etapas["recall_estimado"] = recall
+    etapas["muestra_recall"] = muestra
+    return coincidencias, etapas
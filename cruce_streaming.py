@@ -0,0 +1,195 @@
+"""
+Cruce en streaming para archivos CSV que no entran en memoria.
+
+El archivo NUEVO se lee por fragmentos (`pd.read_csv(chunksize=...)`) y solo la
+columna del campo clave; cada fragmento se cruza contra el índice del BASE y las
+coincidencias se agregan a un CSV en disco. La memoria queda acotada por el
+tamaño del fragmento más el del índice, sin importar el tamaño del archivo.
+
+Los archivos subidos con st.file_uploader ya están completos en memoria y
+limitados por el tamaño máximo de subida de Streamlit; para archivos de varios GB
+las funciones aceptan también rutas a archivos en el disco del servidor, que se
+leen directamente del disco.
+"""
+
+import csv
+import glob
+import os
+import time
+from typing import IO, Any, Callable, Dict, List, Optional, Union
+
+import pandas as pd
+
+from motor_cruce import CACHE_DIR, IndiceBloques, cruzar, pool_cruce
+from utils import detectar_formato_csv, leer_con_encoding_alternativo
+
+# Filas del NUEVO por fragmento
+TAMANO_FRAGMENTO_CSV = 100_000
+
+# Horas que se conservan los CSV de resultados en cache/ antes de borrarlos
+HORAS_RESULTADOS_STREAMING = 24
+
+Archivo = Union[str, IO[bytes]]
+
+
+def _abrir(archivo: Archivo) -> IO[bytes]:
+    """Devuelve un archivo binario posicionado al inicio (abre las rutas)."""
+    if isinstance(archivo, str):
+        return open(archivo, "rb")
+    archivo.seek(0)
+    return archivo
+
+
+def leer_encabezado(archivo: Archivo, encoding: str, separador: str) -> List[str]:
+    """
+    Lee solo los nombres de las columnas de un CSV.
+
+    Args:
+        archivo: Ruta o archivo binario
+        encoding: Encoding del archivo
+        separador: Separador de columnas
+
+    Returns:
+        List[str]: Nombres de columnas tal como aparecen en el archivo
+    """
+    columnas = list(pd.read_csv(_abrir(archivo), sep=separador, encoding=encoding, nrows=0).columns)
+    if not isinstance(archivo, str):
+        archivo.seek(0)
+    return columnas
+
+
+def leer_columna(archivo: Archivo, columna: str, encoding: str, separador: str,
+                 tamano_fragmento: int = TAMANO_FRAGMENTO_CSV) -> pd.Series:
+    """
+    Lee una única columna de un CSV por fragmentos.
+
+    Args:
+        archivo: Ruta o archivo binario
+        columna: Nombre de la columna en el archivo
+        encoding: Encoding del archivo
+        separador: Separador de columnas
+        tamano_fragmento: Filas por fragmento
+
+    Returns:
+        pd.Series: Valores de la columna
+    """
+    def leer(encoding):
+        fragmentos = pd.read_csv(_abrir(archivo), sep=separador, encoding=encoding, usecols=[columna],
+                                 dtype=object, chunksize=tamano_fragmento)
+        with fragmentos:
+            return pd.concat([f[columna] for f in fragmentos], ignore_index=True)
+
+    valores = leer_con_encoding_alternativo(archivo, encoding, leer)
+    if not isinstance(archivo, str):
+        archivo.seek(0)
+    return valores
+
+
+def limpiar_salidas_streaming(horas: float = HORAS_RESULTADOS_STREAMING) -> int:
+    """
+    Borra de cache/ los CSV de resultados de cruces en streaming más antiguos que `horas`.
+
+    Returns:
+        int: Archivos borrados
+    """
+    limite = time.time() - horas * 3600
+    borrados = 0
+    for ruta in glob.glob(os.path.join(CACHE_DIR, "cruce_streaming_*.csv")):
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+                borrados += 1
+        except OSError:
+            pass
+    return borrados
+
+
+def ruta_salida_streaming() -> str:
+    """Ruta nueva en cache/ para el CSV de resultados de un cruce en streaming (borra los antiguos)."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    limpiar_salidas_streaming()
+    return os.path.join(CACHE_DIR, f"cruce_streaming_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.csv")
+
+
+def cruzar_en_streaming(archivo_nuevo: Archivo, columna: str, indice: IndiceBloques, ruta_salida: str,
+                        umbral: int = 85, k: int = 1, workers: int = 1,
+                        encoding: Optional[str] = None, separador: Optional[str] = None,
+                        tamano_fragmento: int = TAMANO_FRAGMENTO_CSV,
+                        al_progresar: Optional[Callable[[int, float], Optional[bool]]] = None) -> Dict[str, Any]:
+    """
+    Cruza un CSV del NUEVO contra el índice del BASE fragmento por fragmento.
+
+    Args:
+        archivo_nuevo: Ruta o archivo binario del NUEVO (CSV)
+        columna: Nombre de la columna del campo clave en el NUEVO
+        indice: Índice del BASE (ver `motor_cruce.obtener_indice`)
+        ruta_salida: CSV donde se escriben las coincidencias a medida que se encuentran
+        umbral: Umbral de similitud (0-100)
+        k: Cantidad máxima de coincidencias por valor del NUEVO
+        workers: Procesos para el fuzzy matching (el mismo pool se usa en todos los fragmentos)
+        encoding: Encoding del NUEVO (se detecta si no se indica)
+        separador: Separador del NUEVO (se detecta si no se indica)
+        tamano_fragmento: Filas del NUEVO por fragmento
+        al_progresar: Función llamada tras cada fragmento con las filas procesadas y
+            la fracción del archivo leída; si devuelve False el cruce se detiene
+
+    Returns:
+        Dict[str, Any]: Filas procesadas (`filas`), filas con coincidencia
+        (`cruzadas`), coincidencias escritas (`coincidencias`), filas por etapa,
+        si se canceló (`cancelado`) y la ruta del CSV (`ruta`)
+    """
+    if encoding is None or separador is None:
+        encoding, separador = detectar_formato_csv(archivo_nuevo)
+
+    # Un único pool de procesos para todos los fragmentos. Si un fragmento no se puede
+    # decodificar, el cruce se repite desde el principio con otro encoding (el CSV de
+    # salida se vuelve a escribir completo)
+    with pool_cruce(indice, workers) as ejecutor:
+        return leer_con_encoding_alternativo(
+            archivo_nuevo, encoding,
+            lambda encoding: _cruzar_fragmentos(archivo_nuevo, columna, indice, ruta_salida, umbral, k, workers,
+                                                ejecutor, encoding, separador, tamano_fragmento, al_progresar))
+
+
+def _cruzar_fragmentos(archivo_nuevo: Archivo, columna: str, indice: IndiceBloques, ruta_salida: str,
+                       umbral: int, k: int, workers: int, ejecutor, encoding: str, separador: str,
+                       tamano_fragmento: int,
+                       al_progresar: Optional[Callable[[int, float], Optional[bool]]]) -> Dict[str, Any]:
+    """Cruza el NUEVO por fragmentos con un encoding dado (ver `cruzar_en_streaming`)."""
+    manejador = _abrir(archivo_nuevo)
+    manejador.seek(0, os.SEEK_END)
+    tamano = manejador.tell() or 1
+    manejador.seek(0)
+
+    totales = {"filas": 0, "cruzadas": 0, "coincidencias": 0, "exacta": 0, "normalizada": 0, "difusa": 0,
+               "cancelado": False, "ruta": ruta_salida}
+    try:
+        with open(ruta_salida, "w", newline="", encoding="utf-8") as salida:
+            escritor = csv.writer(salida)
+            escritor.writerow(["Valor Nuevo", "Valor Base", "Score"])
+
+            fragmentos = pd.read_csv(manejador, sep=separador, encoding=encoding, usecols=[columna],
+                                     dtype=object, chunksize=tamano_fragmento)
+            with fragmentos:
+                for fragmento in fragmentos:
+                    coincidencias, etapas = cruzar(fragmento[columna], indice, umbral=umbral, k=k, workers=workers,
+                                                   ejecutor=ejecutor)
+                    escritor.writerows(coincidencias)
+                    salida.flush()
+
+                    totales["filas"] += len(fragmento)
+                    totales["coincidencias"] += len(coincidencias)
+                    for etapa in ("exacta", "normalizada", "difusa"):
+                        totales[etapa] += etapas[etapa]
+                        totales["cruzadas"] += etapas[etapa]
+
+                    fraccion = min(manejador.tell() / tamano, 1.0)
+                    if al_progresar is not None and al_progresar(totales["filas"], fraccion) is False:
+                        totales["cancelado"] = True
+                        break
+    finally:
+        if isinstance(archivo_nuevo, str):
+            manejador.close()
+        else:
+            archivo_nuevo.seek(0)
+    return totales
@@ -0,0 +1,224 @@
+"""
+Motor de cruce TF-IDF sobre n-gramas de caracteres.
+
+Vectoriza las claves en matrices dispersas TF-IDF de n-gramas de caracteres y
+busca las mejores coincidencias por similitud coseno, multiplicando fragmentos
+de filas del NUEVO contra la matriz transpuesta del BASE. Es menos sensible que
+token_sort_ratio a las diferencias de longitud, por lo que funciona mejor con
+razones sociales largas.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from motor_cruce import cruzar_exactas, normalizar_clave
+
+# Tamaño de los n-gramas de caracteres (las claves se rellenan con un espacio a cada lado)
+TAMANO_NGRAMA_TFIDF = 3
+
+# Filas del NUEVO por multiplicación; acota la memoria de la matriz de similitudes
+FILAS_POR_PRODUCTO = 1000
+
+# Los n-gramas presentes en más de esta fracción de claves del BASE se consideran
+# comunes ("sociedad", "anonima"...) y no generan candidatos por sí solos
+FRACCION_NGRAMA_COMUN = 0.01
+
+
+def _ngramas_clave(clave: str) -> List[str]:
+    """Devuelve los n-gramas de caracteres de una clave rellenada con espacios."""
+    clave = f" {clave} "
+    return [clave[i:i + TAMANO_NGRAMA_TFIDF] for i in range(len(clave) - TAMANO_NGRAMA_TFIDF + 1)]
+
+
+class VectorizadorTfidf:
+    """
+    Vectorizador TF-IDF de n-gramas de caracteres con el vocabulario del BASE.
+
+    Los n-gramas que no aparecen en el BASE se ignoran al vectorizar el NUEVO:
+    no pueden aportar similitud con ninguna clave del BASE.
+
+    Args:
+        claves_base: Claves normalizadas del BASE
+    """
+
+    def __init__(self, claves_base: List[str]):
+        self.vocabulario: Dict[str, int] = {}
+        for clave in claves_base:
+            for ngrama in _ngramas_clave(clave):
+                self.vocabulario.setdefault(ngrama, len(self.vocabulario))
+
+        conteos = self._conteos(claves_base)
+        # idf suavizado: log((1 + n) / (1 + df)) + 1
+        df = np.bincount(conteos.indices, minlength=len(self.vocabulario))
+        self.idf = np.log((1 + len(claves_base)) / (1 + df)) + 1
+        self.matriz_base = self._ponderar(conteos)
+
+        # Matriz del BASE solo con los n-gramas poco frecuentes, para generar candidatos
+        self.comunes = df > FRACCION_NGRAMA_COMUN * len(claves_base)
+        self.matriz_base_rara = self._filtrar(self.matriz_base, ~self.comunes)
+        self.norma_comun_base = self._normas(self._filtrar(self.matriz_base, self.comunes))
+
+    def _conteos(self, claves: List[str]) -> sparse.csr_matrix:
+        """Matriz dispersa de frecuencias de n-gramas (filas = claves)."""
+        indices, indptr = [], [0]
+        for clave in claves:
+            indices.extend(self.vocabulario[g] for g in _ngramas_clave(clave) if g in self.vocabulario)
+            indptr.append(len(indices))
+        matriz = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr)),
+            shape=(len(claves), len(self.vocabulario))
+        )
+        matriz.sum_duplicates()
+        return matriz
+
+    def _ponderar(self, conteos: sparse.csr_matrix) -> sparse.csr_matrix:
+        """Aplica el idf y normaliza cada fila (norma L2) para que el producto sea el coseno."""
+        matriz = conteos @ sparse.diags(self.idf)
+        normas = self._normas(matriz)
+        normas[normas == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / normas) @ matriz)
+
+    def transformar(self, claves: List[str]) -> sparse.csr_matrix:
+        """
+        Vectoriza claves con el vocabulario y el idf del BASE.
+
+        Args:
+            claves: Claves normalizadas
+
+        Returns:
+            sparse.csr_matrix: Vectores TF-IDF normalizados (una fila por clave)
+        """
+        return self._ponderar(self._conteos(claves))
+
+    @staticmethod
+    def _normas(matriz: sparse.csr_matrix) -> np.ndarray:
+        """Norma L2 de cada fila."""
+        return np.sqrt(np.asarray(matriz.multiply(matriz).sum(axis=1)).ravel())
+
+    @staticmethod
+    def _filtrar(matriz: sparse.csr_matrix, columnas: np.ndarray) -> sparse.csr_matrix:
+        """Conserva solo las columnas (n-gramas) indicadas, sin cambiar la forma."""
+        filtrada = sparse.csr_matrix(matriz @ sparse.diags(columnas.astype(np.float64)))
+        filtrada.eliminate_zeros()
+        return filtrada
+
+    def mejores(self, consultas: sparse.csr_matrix, umbral: float, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Obtiene las k mejores similitudes coseno por fila que superan el umbral.
+
+        La parte común de cada vector aporta al coseno como mucho su norma, así que
+        si esa norma es menor que el umbral toda coincidencia válida comparte algún
+        n-grama poco frecuente: solo se puntúan esos candidatos. Las filas formadas
+        casi solo por n-gramas comunes se multiplican contra todo el BASE.
+
+        Args:
+            consultas: Vectores normalizados del NUEVO (de `transformar`)
+            umbral: Similitud coseno mínima (0-1)
+            k: Cantidad máxima de resultados por fila
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Filas de la consulta, ids del
+            BASE y similitudes, ordenados por fila y de mayor a menor similitud
+        """
+        norma_comun = self._normas(self._filtrar(consultas, self.comunes))
+        acotadas = norma_comun < umbral
+
+        # Filas acotadas: candidatos por n-gramas poco frecuentes. La parte común suma
+        # como mucho el producto de las normas comunes; solo los pares que con esa
+        # cota alcanzan el umbral se puntúan con el coseno exacto
+        candidatos = (self._filtrar(consultas, ~self.comunes)[acotadas] @ self.matriz_base_rara.T).tocoo()
+        filas = np.flatnonzero(acotadas)[candidatos.row]
+        ids = candidatos.col
+        cota = candidatos.data + norma_comun[filas] * self.norma_comun_base[ids]
+        posibles = cota >= umbral - 1e-9
+        filas, ids = filas[posibles], ids[posibles]
+        valores = np.asarray(consultas[filas].multiply(self.matriz_base[ids]).sum(axis=1)).ravel()
+
+        # Resto de filas: producto completo contra el BASE
+        if (~acotadas).any():
+            completas = (consultas[~acotadas] @ self.matriz_base.T).tocoo()
+            filas = np.concatenate([filas, np.flatnonzero(~acotadas)[completas.row]])
+            ids = np.concatenate([ids, completas.col])
+            valores = np.concatenate([valores, completas.data])
+
+        mascara = valores >= umbral
+        return _k_mejores(filas[mascara], ids[mascara], valores[mascara], k)
+
+
+def _k_mejores(filas: np.ndarray, ids: np.ndarray, valores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Ordena por fila y similitud descendente (empates: primera clave del BASE) y deja k por fila."""
+    orden = np.lexsort((ids, -valores, filas))
+    filas, ids, valores = filas[orden], ids[orden], valores[orden]
+
+    # Posición de cada resultado dentro de su fila
+    inicios = np.flatnonzero(np.r_[True, filas[1:] != filas[:-1]]) if len(filas) else np.array([], dtype=np.int64)
+    posicion = np.arange(len(filas)) - np.repeat(inicios, np.diff(np.r_[inicios, len(filas)]))
+    mascara = posicion < k
+    return filas[mascara], ids[mascara], valores[mascara]
+
+
+def cruzar_tfidf(valores_nuevos: Iterable[Any], valores_base: Iterable[Any], umbral: int = 85, k: int = 1,
+                 al_progresar: Optional[Callable[[int, int, List[Tuple[Any, Any, int]]], Optional[bool]]] = None
+                 ) -> Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]:
+    """
+    Cruce por similitud coseno TF-IDF: hash join exacto/normalizado y TF-IDF para el resto.
+
+    Args:
+        valores_nuevos: Valores del campo clave del archivo NUEVO
+        valores_base: Valores del campo clave del archivo BASE
+        umbral: Similitud coseno mínima, en escala 0-100
+        k: Cantidad máxima de coincidencias por valor del NUEVO
+        al_progresar: Función llamada tras cada fragmento con las filas procesadas,
+            el total y las coincidencias parciales; si devuelve False el cruce se detiene
+
+    Returns:
+        Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]: Coincidencias (valor
+        nuevo, valor base, score) en el orden del NUEVO y filas por etapa
+        (`exacta`, `normalizada`, `difusa` y `pendientes` si se canceló)
+    """
+    valores_nuevos = pd.Series(list(valores_nuevos), dtype=object)
+    valores_base = pd.Series(list(valores_base), dtype=object)
+
+    resultado = cruzar_exactas(valores_nuevos, valores_base)
+    por_fila: Dict[int, List[Tuple[Any, Any, int]]] = {
+        fila: [(resultado.at[fila, "valor_nuevo"], resultado.at[fila, "valor_base"], 100)]
+        for fila in resultado.index[resultado["etapa"].notna()]
+    }
+    pendientes = resultado.index[resultado["etapa"].isna()]
+
+    # Claves del BASE sin repetir, conservando la primera fila de cada una
+    base = pd.DataFrame({"clave": [normalizar_clave(v) for v in valores_base], "valor": valores_base})
+    base = base.drop_duplicates("clave", keep="first").reset_index(drop=True)
+    vectorizador = VectorizadorTfidf(base["clave"].tolist())
+    claves_nuevas = [normalizar_clave(v) for v in resultado.loc[pendientes, "valor_nuevo"]]
+
+    # Coincidencias parciales para el progreso: se agregan las de cada fragmento
+    # (el orden del NUEVO se arma una sola vez, al final)
+    parciales = [c for fila in sorted(por_fila) for c in por_fila[fila]]
+
+    procesadas = len(valores_nuevos) - len(pendientes)
+    sin_procesar = 0
+    for inicio in range(0, len(claves_nuevas), FILAS_POR_PRODUCTO):
+        consultas = vectorizador.transformar(claves_nuevas[inicio:inicio + FILAS_POR_PRODUCTO])
+        filas, ids, valores = vectorizador.mejores(consultas, umbral / 100, k)
+        for fila_lote, id_base, valor in zip(filas, ids, valores):
+            fila = pendientes[inicio + fila_lote]
+            resultado.at[fila, "etapa"] = "difusa"
+            coincidencia = (resultado.at[fila, "valor_nuevo"], base.at[id_base, "valor"], min(int(round(valor * 100)), 100))
+            por_fila.setdefault(fila, []).append(coincidencia)
+            parciales.append(coincidencia)
+
+        procesadas += consultas.shape[0]
+        if al_progresar is not None and al_progresar(procesadas, len(valores_nuevos), parciales) is False:
+            sin_procesar = len(claves_nuevas) - inicio - consultas.shape[0]
+            break
+
+    etapas = {
+        etapa: int((resultado["etapa"] == etapa).sum())
+        for etapa in ("exacta", "normalizada", "difusa")
+    }
+    etapas["pendientes"] = sin_procesar
+    return [c for fila in sorted(por_fila) for c in por_fila[fila]], etapas
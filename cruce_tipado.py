@@ -0,0 +1,191 @@
+"""
+Cruce por tolerancia para campos clave numéricos y de fecha.
+
+Cuando el campo clave es numérico (IDs, importes) o una fecha, convertirlo a
+texto y aplicar fuzzy matching es lento y no tiene sentido: 1000 y 1001 se
+parecen como texto igual que 1000 y 9000. Estos modos ordenan el BASE una vez y
+buscan con `searchsorted` los valores dentro de la tolerancia (|a - b| <= eps) o
+de la ventana de días (± N días).
+"""
+
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.api import types as tipos_pd
+
+# Fracción mínima de valores de una columna de texto que deben poder leerse como
+# fecha para tratarla como fecha
+FRACCION_MINIMA_FECHAS = 0.95
+
+# Valores de texto analizados para detectar fechas
+MUESTRA_FECHAS = 1000
+
+NANOSEGUNDOS_POR_DIA = 86_400 * 10**9
+
+
+def _a_fechas(valores: pd.Series) -> pd.Series:
+    """
+    Convierte a datetime64; lo que no es fecha queda NaT. Las fechas ISO (año
+    primero) se leen como tales y el resto con el día primero (dd/mm/aaaa).
+    """
+    if tipos_pd.is_datetime64_any_dtype(valores):
+        return valores
+    iso = pd.to_datetime(valores, errors="coerce", format="ISO8601")
+    return iso.fillna(pd.to_datetime(valores.where(iso.isna()), errors="coerce", dayfirst=True, format="mixed"))
+
+
+def _parece_fecha(valores: pd.Series) -> bool:
+    """Indica si una columna de texto contiene fechas (no números sueltos)."""
+    muestra = valores.dropna().astype(str).head(MUESTRA_FECHAS)
+    if muestra.empty or muestra.str.fullmatch(r"\s*[-+]?\d+([.,]\d+)?\s*").any():
+        return False
+    return _a_fechas(muestra).notna().mean() >= FRACCION_MINIMA_FECHAS
+
+
+def detectar_tipo(valores_nuevos: pd.Series, valores_base: pd.Series) -> str:
+    """
+    Elige el modo de cruce según el tipo de dato del campo clave en ambos archivos.
+
+    Args:
+        valores_nuevos: Valores del campo clave del archivo NUEVO
+        valores_base: Valores del campo clave del archivo BASE
+
+    Returns:
+        str: "numerica", "fecha" o "texto"
+    """
+    def tipo(valores):
+        # Las columnas compactadas como category se evalúan por el tipo de sus valores
+        if isinstance(valores.dtype, pd.CategoricalDtype):
+            valores = valores.astype(valores.cat.categories.dtype)
+        if tipos_pd.is_bool_dtype(valores):
+            return "texto"
+        if tipos_pd.is_numeric_dtype(valores):
+            return "numerica"
+        if tipos_pd.is_datetime64_any_dtype(valores):
+            return "fecha"
+        if (tipos_pd.is_object_dtype(valores) or tipos_pd.is_string_dtype(valores)) and _parece_fecha(valores):
+            return "fecha"
+        return "texto"
+
+    tipo_nuevo = tipo(valores_nuevos)
+    return tipo_nuevo if tipo_nuevo == tipo(valores_base) else "texto"
+
+
+def _cruzar_ordenado(claves_nuevas: np.ndarray, claves_base: np.ndarray, tolerancia: float,
+                     k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Busca los k valores del BASE más cercanos a cada valor del NUEVO dentro de la tolerancia.
+
+    Los k más cercanos a un valor están entre los k anteriores y los k posteriores
+    a su posición de inserción en el BASE ordenado, así que basta con mirar esa
+    ventana de 2k candidatos por fila.
+
+    Args:
+        claves_nuevas: Valores del NUEVO (float64, NaN si no tiene valor)
+        claves_base: Valores del BASE sin repetir (float64, sin NaN)
+        tolerancia: Distancia máxima admitida
+        k: Cantidad máxima de coincidencias por valor
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Filas del NUEVO, ids del BASE y
+        distancias, ordenados por fila y distancia (empates: primera fila del BASE)
+    """
+    if len(claves_base) == 0 or len(claves_nuevas) == 0:
+        vacio = np.array([], dtype=np.int64)
+        return vacio, vacio, np.array([], dtype=np.float64)
+
+    orden = np.argsort(claves_base, kind="stable")
+    ordenadas = claves_base[orden]
+    posiciones = np.searchsorted(ordenadas, claves_nuevas)
+
+    ventana = posiciones[:, None] + np.arange(-k, k)[None, :]
+    validas = (ventana >= 0) & (ventana < len(ordenadas)) & ~np.isnan(claves_nuevas)[:, None]
+    ventana = np.clip(ventana, 0, len(ordenadas) - 1)
+    distancias = np.abs(ordenadas[ventana] - claves_nuevas[:, None])
+    validas &= distancias <= tolerancia
+
+    filas = np.broadcast_to(np.arange(len(claves_nuevas))[:, None], ventana.shape)[validas]
+    ids = orden[ventana[validas]]
+    distancias = distancias[validas]
+
+    orden_resultado = np.lexsort((ids, distancias, filas))
+    filas, ids, distancias = filas[orden_resultado], ids[orden_resultado], distancias[orden_resultado]
+    inicios = np.flatnonzero(np.r_[True, filas[1:] != filas[:-1]]) if len(filas) else np.array([], dtype=np.int64)
+    posicion = np.arange(len(filas)) - np.repeat(inicios, np.diff(np.r_[inicios, len(filas)]))
+    mascara = posicion < k
+    return filas[mascara], ids[mascara], distancias[mascara]
+
+
+def _cruzar_claves(valores_nuevos: pd.Series, valores_base: pd.Series, claves_nuevas: np.ndarray,
+                   claves_base: np.ndarray, tolerancia: float, k: int) -> Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]:
+    """Cruza claves numéricas ya convertidas y arma las coincidencias con los valores originales."""
+    # Una fila del BASE por valor (la primera en que aparece), como en el resto de los motores
+    base = pd.DataFrame({"clave": claves_base, "valor": valores_base.to_numpy()})
+    base = base.dropna(subset=["clave"]).drop_duplicates("clave", keep="first").reset_index(drop=True)
+
+    filas, ids, distancias = _cruzar_ordenado(claves_nuevas, base["clave"].to_numpy(dtype=np.float64), tolerancia, k)
+    # Score 100 para valores iguales y proporcional a la cercanía dentro de la tolerancia
+    scores = np.where(distancias == 0, 100,
+                      np.floor(100 * (1 - distancias / tolerancia) if tolerancia > 0 else 0)).astype(np.int64)
+
+    valores = valores_nuevos.to_numpy()
+    valores_base_unicos = base["valor"].to_numpy()
+    coincidencias = [(valores[f], valores_base_unicos[i], int(s)) for f, i, s in zip(filas, ids, scores)]
+
+    primeras = np.r_[True, filas[1:] != filas[:-1]] if len(filas) else np.array([], dtype=bool)
+    etapas = {
+        "exacta": int((distancias[primeras] == 0).sum()),
+        "tolerancia": int((distancias[primeras] > 0).sum()),
+    }
+    return coincidencias, etapas
+
+
+def cruzar_numerico(valores_nuevos: Iterable[Any], valores_base: Iterable[Any], tolerancia: float = 0.0,
+                    k: int = 1) -> Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]:
+    """
+    Cruza un campo clave numérico admitiendo |nuevo - base| <= tolerancia.
+
+    Args:
+        valores_nuevos: Valores del campo clave del archivo NUEVO
+        valores_base: Valores del campo clave del archivo BASE
+        tolerancia: Diferencia máxima admitida (0 para igualdad exacta)
+        k: Cantidad máxima de coincidencias por valor del NUEVO, de la más cercana a la más lejana
+
+    Returns:
+        Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]: Coincidencias (valor
+        nuevo, valor base, score) en el orden del NUEVO y filas por etapa
+        (`exacta` y `tolerancia`). El score es 100 para valores iguales y baja
+        linealmente hasta 0 en el límite de la tolerancia
+    """
+    valores_nuevos = pd.Series(list(valores_nuevos), dtype=object)
+    valores_base = pd.Series(list(valores_base), dtype=object)
+    claves_nuevas = pd.to_numeric(valores_nuevos, errors="coerce").to_numpy(dtype=np.float64)
+    claves_base = pd.to_numeric(valores_base, errors="coerce").to_numpy(dtype=np.float64)
+    return _cruzar_claves(valores_nuevos, valores_base, claves_nuevas, claves_base, float(tolerancia), k)
+
+
+def cruzar_fechas(valores_nuevos: Iterable[Any], valores_base: Iterable[Any], dias: int = 0,
+                  k: int = 1) -> Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]:
+    """
+    Cruza un campo clave de fecha dentro de una ventana de ± días.
+
+    Args:
+        valores_nuevos: Valores del campo clave del archivo NUEVO
+        valores_base: Valores del campo clave del archivo BASE
+        dias: Días de diferencia admitidos (0 para la misma fecha y hora)
+        k: Cantidad máxima de coincidencias por valor del NUEVO, de la más cercana a la más lejana
+
+    Returns:
+        Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]: Coincidencias y filas por
+        etapa, con el mismo formato que `cruzar_numerico`
+    """
+    valores_nuevos = pd.Series(list(valores_nuevos), dtype=object)
+    valores_base = pd.Series(list(valores_base), dtype=object)
+
+    def a_nanosegundos(valores):
+        fechas = _a_fechas(valores)
+        return np.where(fechas.isna(), np.nan, fechas.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64))
+
+    return _cruzar_claves(valores_nuevos, valores_base, a_nanosegundos(valores_nuevos), a_nanosegundos(valores_base),
+                          float(dias) * NANOSEGUNDOS_POR_DIA, k)
@@ -1,14 +1,14 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
-from utils import read_flexible_file
+from almacen_datasets import elegir_datos
 
 def run_dashboard():
     st.title("📈 Visualización de Datos")
 
-    uploaded_file = st.file_uploader("📁 Subí la base", type=["csv", "xls", "xlsx"])
-    if uploaded_file:
-        df = read_flexible_file(uploaded_file)
+    # Un archivo nuevo o un dataset ya cargado en otra página
+    nombre, df = elegir_datos("📁 Subí la base", key="dashboard")
+    if df is not None:
         
         # Mostrar estadísticas básicas
         st.subheader("📊 Estadísticas básicas")
@@ -1,13 +1,13 @@
 import streamlit as st
 import pandas as pd
-from utils import read_flexible_file
+from almacen_datasets import elegir_datos
 
 def run_editor():
     st.title("🛠️ Edición de Datos")
 
-    uploaded_file = st.file_uploader("📁 Cargá CSV o Excel", type=["csv", "xls", "xlsx"])
-    if uploaded_file:
-        df = read_flexible_file(uploaded_file)
+    # Un archivo nuevo o un dataset ya cargado en otra página
+    nombre, df = elegir_datos("📁 Cargá CSV o Excel", key="editor")
+    if df is not None:
         
         # Opciones de visualización
         st.subheader("Vista previa de datos")
@@ -46,6 +46,8 @@ def run_editor():
                 nuevo_valor = st.text_input("Nuevo valor")
                 
                 if st.button("Actualizar celda"):
+                    # Las columnas de un dataset mapeado son de solo lectura: se edita una copia de la columna
+                    df[columna] = df[columna].copy()
                     df.at[fila, columna] = nuevo_valor
                     st.success(f"Fila {fila}, columna {columna} actualizada.")
         
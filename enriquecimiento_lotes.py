@@ -0,0 +1,221 @@
+"""
+Enriquecimiento con IA por lotes de filas.
+
+En lugar de mandar todas las filas en un único prompt (que puede superar el
+contexto del modelo y espera una sola respuesta larga), el DataFrame se divide en
+lotes de filas según un presupuesto de tokens. Los lotes se envían en paralelo
+con un límite de concurrencia, cada uno pide la salida como CSV y se reintenta
+por separado si la respuesta no se puede leer. Cada fila del
+lote lleva un número (`_fila`) que el modelo debe devolver sin cambios: si la
+respuesta pierde, duplica o reordena filas, o le faltan columnas, el lote se
+reintenta y, si sigue fallando, se informa como error en lugar de desalinear el
+resultado. Al final las respuestas se unen, en el orden original, en un único
+DataFrame.
+"""
+
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from limitador_llm import espera_backoff
+
+# Estimación de tokens: caracteres por token (aproximado, sin depender del tokenizador)
+CARACTERES_POR_TOKEN = 4
+
+# Tokens de datos por lote (sin contar las instrucciones)
+PRESUPUESTO_TOKENS_LOTE = 2000
+
+# Lotes enviados a la vez
+CONCURRENCIA_LOTES = 4
+
+# Reintentos por lote cuando la respuesta no se puede leer o no corresponde al lote
+# (los errores de la llamada, como los 429, no: ya se reintentan en el cliente,
+# ver `limitador_llm`)
+REINTENTOS_LOTE = 2
+
+# Columna con el número de fila dentro del lote, para validar la respuesta
+COLUMNA_FILA = "_fila"
+
+INSTRUCCION_FORMATO_LOTE = (
+    "Devolvé únicamente los datos procesados en formato CSV separado por comas, con una fila de "
+    "encabezado, sin explicaciones ni bloques de código. Mantené una fila de salida por cada fila "
+    "de entrada y en el mismo orden, conservá todas las columnas originales con sus mismos nombres "
+    f"y devolvé la columna {COLUMNA_FILA} sin modificarla."
+)
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimación rápida de la cantidad de tokens de un texto."""
+    return len(texto) // CARACTERES_POR_TOKEN + 1
+
+
+def dividir_en_lotes(df: pd.DataFrame, presupuesto_tokens: int = PRESUPUESTO_TOKENS_LOTE) -> List[pd.DataFrame]:
+    """
+    Divide un DataFrame en lotes de filas consecutivas que entran en el presupuesto de tokens.
+
+    Args:
+        df: Datos a procesar
+        presupuesto_tokens: Tokens máximos de datos por lote (cada lote tiene al
+            menos una fila, aunque la fila sola supere el presupuesto)
+
+    Returns:
+        List[pd.DataFrame]: Lotes en el orden del DataFrame
+    """
+    if df.empty:
+        return []
+    # Tokens de cada fila como línea CSV (valores + separadores) y del encabezado
+    tokens_filas = (df.astype(str).apply(lambda fila: len(",".join(fila)) + 1, axis=1)
+                    // CARACTERES_POR_TOKEN + 1).to_numpy()
+    disponible = max(presupuesto_tokens - estimar_tokens(",".join(map(str, df.columns))), 1)
+
+    lotes, inicio, acumulado = [], 0, 0
+    for i, tokens in enumerate(tokens_filas):
+        if i > inicio and acumulado + tokens > disponible:
+            lotes.append(df.iloc[inicio:i])
+            inicio, acumulado = i, 0
+        acumulado += tokens
+    lotes.append(df.iloc[inicio:])
+    return lotes
+
+
+def extraer_csv(texto: str) -> pd.DataFrame:
+    """
+    Lee como DataFrame el CSV de una respuesta del modelo.
+
+    Args:
+        texto: Respuesta del modelo (puede venir dentro de un bloque de código)
+
+    Returns:
+        pd.DataFrame: Filas de la respuesta
+
+    Raises:
+        ValueError: Si la respuesta no contiene un CSV legible
+    """
+    if "```" in texto:
+        # Contenido del primer bloque de código, sin la etiqueta de lenguaje (```csv)
+        bloque = texto.split("```", 2)[1]
+        etiqueta, _, resto = bloque.partition("\n")
+        texto = resto if etiqueta.strip().lower() in ("", "csv", "text") else bloque
+    texto = texto.strip()
+    if not texto:
+        raise ValueError("La respuesta está vacía")
+    try:
+        return pd.read_csv(io.StringIO(texto))
+    except Exception as e:
+        raise ValueError(f"La respuesta no es un CSV válido: {e}")
+
+
+def validar_lote(salida: pd.DataFrame, lote: pd.DataFrame) -> pd.DataFrame:
+    """
+    Comprueba que la respuesta de un lote corresponde fila por fila a su entrada.
+
+    Args:
+        salida: Respuesta del modelo, con la columna COLUMNA_FILA
+        lote: Filas enviadas
+
+    Returns:
+        pd.DataFrame: La respuesta sin COLUMNA_FILA, con las columnas originales primero
+
+    Raises:
+        ValueError: Si faltan columnas, la cantidad de filas no coincide o las
+            filas están duplicadas o reordenadas
+    """
+    faltantes = [c for c in [COLUMNA_FILA, *map(str, lote.columns)] if c not in salida.columns]
+    if faltantes:
+        raise ValueError(f"A la respuesta le faltan columnas: {', '.join(faltantes)}")
+    if len(salida) != len(lote):
+        raise ValueError(f"La respuesta tiene {len(salida)} filas y el lote {len(lote)}")
+    filas = pd.to_numeric(salida[COLUMNA_FILA], errors="coerce").to_numpy()
+    if not (filas == np.arange(len(lote))).all():
+        raise ValueError("La respuesta tiene filas duplicadas, reordenadas o con otro número de fila")
+    originales = list(map(str, lote.columns))
+    return salida[originales + [c for c in salida.columns if c not in originales and c != COLUMNA_FILA]]
+
+
+def _procesar_lote(cliente, modelo: str, instruccion: str, lote: pd.DataFrame, temperatura: float,
+                   reintentos: int) -> pd.DataFrame:
+    """
+    Envía un lote y lee y valida su respuesta, reintentando si no se puede leer o no
+    corresponde al lote. Los errores de la llamada se propagan sin reintentar.
+    """
+    entrada = lote.rename(columns=str)
+    entrada.insert(0, COLUMNA_FILA, range(len(lote)))
+    prompt = f"{instruccion}\n\n{INSTRUCCION_FORMATO_LOTE}\n\nDATOS:\n{entrada.to_csv(index=False)}"
+    for intento in range(reintentos + 1):
+        respuesta = cliente.chat.completions.create(
+            model=modelo,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperatura,
+        )
+        try:
+            return validar_lote(extraer_csv(respuesta.choices[0].message.content or ""), lote)
+        except ValueError:
+            if intento == reintentos:
+                raise
+            time.sleep(espera_backoff(intento + 1))
+
+
+def enriquecer_por_lotes(cliente, modelo: str, instruccion: str, df: pd.DataFrame,
+                         presupuesto_tokens: int = PRESUPUESTO_TOKENS_LOTE,
+                         concurrencia: int = CONCURRENCIA_LOTES, reintentos: int = REINTENTOS_LOTE,
+                         temperatura: float = 0.3,
+                         al_progresar: Optional[Callable[[int, int], None]] = None
+                         ) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """
+    Limpia o enriquece un DataFrame con IA, por lotes de filas enviados en paralelo.
+
+    Args:
+        cliente: Cliente del SDK de OpenAI (ver `cliente_llm.cliente_openai`)
+        modelo: Modelo a usar
+        instruccion: Instrucciones para el modelo
+        df: Datos a procesar
+        presupuesto_tokens: Tokens máximos de datos por lote
+        concurrencia: Lotes enviados a la vez
+        reintentos: Reintentos por lote si la respuesta no es un CSV que corresponda
+            fila por fila al lote (ver `validar_lote`)
+        temperatura: Temperatura para la generación
+        al_progresar: Función llamada (en el hilo que llama) cada vez que termina un
+            lote, con los lotes terminados y el total
+
+    Returns:
+        Tuple[pd.DataFrame, List[Dict[str, Any]]]: Resultado de todos los lotes
+        procesados, en el orden original, y los lotes que fallaron (`lote`,
+        `filas` como (inicio, fin) y `error`)
+    """
+    lotes = dividir_en_lotes(df, presupuesto_tokens)
+    resultados: Dict[int, pd.DataFrame] = {}
+    errores: List[Dict[str, Any]] = []
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrencia)) as ejecutor:
+        futuros = {
+            ejecutor.submit(_procesar_lote, cliente, modelo, instruccion, lote, temperatura, reintentos): i
+            for i, lote in enumerate(lotes)
+        }
+        for terminados, futuro in enumerate(as_completed(futuros), 1):
+            i = futuros[futuro]
+            try:
+                resultados[i] = futuro.result()
+            except Exception as e:
+                inicio = sum(len(lote) for lote in lotes[:i])
+                errores.append({"lote": i + 1, "filas": (inicio, inicio + len(lotes[i])), "error": str(e)})
+            if al_progresar is not None:
+                al_progresar(terminados, len(lotes))
+
+    # Los lotes que agregaron columnas distintas a las de la mayoría no se pueden unir
+    encabezados = pd.Series({i: tuple(r.columns) for i, r in resultados.items()}, dtype=object)
+    if len(encabezados):
+        comun = encabezados.value_counts().index[0]
+        for i in encabezados.index[encabezados.map(lambda e: e != comun)]:
+            del resultados[i]
+            inicio = sum(len(lote) for lote in lotes[:i])
+            errores.append({"lote": i + 1, "filas": (inicio, inicio + len(lotes[i])),
+                            "error": "La respuesta tiene columnas distintas a las de los demás lotes"})
+
+    partes = [resultados[i] for i in sorted(resultados)]
+    resultado = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+    errores.sort(key=lambda error: error["lote"])
+    return resultado, errores
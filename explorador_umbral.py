@@ -0,0 +1,85 @@
+"""
+Explorador de umbral para el cruce de datos.
+
+El cruce se ejecuta una sola vez con un umbral bajo y se conserva el mejor score
+de cada registro del NUEVO. A partir de eso se obtiene la curva de registros
+cruzados según el umbral y las coincidencias de cualquier umbral más alto, sin
+volver a puntuar: las k mejores coincidencias por encima de un umbral son las de
+la pasada que superan ese umbral.
+"""
+
+from typing import Any, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Umbral con el que se ejecuta la pasada del explorador (mínimo que se puede explorar)
+UMBRAL_MINIMO_EXPLORACION = 60
+
+
+class ExploradorUmbral:
+    """
+    Resultados de una pasada de cruce que se pueden filtrar por umbral.
+
+    Los motores devuelven las coincidencias por valor del NUEVO y valores
+    iguales obtienen siempre las mismas coincidencias, así que el mejor score de
+    cada registro se obtiene del de su valor.
+
+    Args:
+        coincidencias: Coincidencias (valor nuevo, valor base, score) de la pasada
+        valores_nuevos: Valores del NUEVO cruzados (uno por registro)
+        umbral_minimo: Umbral con el que se ejecutó la pasada
+    """
+
+    def __init__(self, coincidencias: List[Tuple[Any, Any, int]], valores_nuevos: Iterable[Any],
+                 umbral_minimo: int = UMBRAL_MINIMO_EXPLORACION):
+        self.coincidencias = coincidencias
+        self.umbral_minimo = umbral_minimo
+        self.scores = np.array([score for _, _, score in coincidencias], dtype=np.int64)
+
+        mejores = {}
+        for valor, _, score in coincidencias:
+            clave = str(valor)
+            if score > mejores.get(clave, -1):
+                mejores[clave] = score
+
+        conteos = pd.Series(list(valores_nuevos), dtype=object).map(str).value_counts()
+        self.total = int(conteos.sum())
+        mejor_por_valor = np.array([mejores.get(clave, -1) for clave in conteos.index], dtype=np.int64)
+        # Mejor score de cada registro (-1 sin coincidencia), ordenado para contar con searchsorted
+        self._mejores_ordenados = np.sort(np.repeat(mejor_por_valor, conteos.to_numpy()))
+        self._scores_ordenados = np.sort(self.scores)
+
+    def registros(self, umbral: int) -> int:
+        """Registros del NUEVO con al menos una coincidencia de score >= umbral."""
+        return self.total - int(np.searchsorted(self._mejores_ordenados, umbral, side="left"))
+
+    def filtrar(self, umbral: int) -> List[Tuple[Any, Any, int]]:
+        """
+        Coincidencias con score >= umbral, en el orden de la pasada.
+
+        Args:
+            umbral: Umbral de similitud (no menor que el de la pasada)
+
+        Returns:
+            List[Tuple[Any, Any, int]]: Coincidencias filtradas
+        """
+        return [self.coincidencias[i] for i in np.flatnonzero(self.scores >= umbral)]
+
+    def curva(self) -> pd.DataFrame:
+        """
+        Registros cruzados y coincidencias para cada umbral explorable.
+
+        Returns:
+            pd.DataFrame: Columnas `Umbral`, `Registros cruzados`, `% cruzado` y
+            `Coincidencias`, una fila por umbral desde el mínimo hasta 100
+        """
+        umbrales = np.arange(self.umbral_minimo, 101)
+        registros = self.total - np.searchsorted(self._mejores_ordenados, umbrales, side="left")
+        coincidencias = len(self._scores_ordenados) - np.searchsorted(self._scores_ordenados, umbrales, side="left")
+        return pd.DataFrame({
+            "Umbral": umbrales,
+            "Registros cruzados": registros,
+            "% cruzado": registros / max(self.total, 1) * 100,
+            "Coincidencias": coincidencias,
+        })
@@ -1,14 +1,14 @@
 import streamlit as st
 import pandas as pd
 import io
-from utils import read_flexible_file
+from almacen_datasets import elegir_datos
 
 def run_exportador():
     st.title("📁 Exportador de Datos")
 
-    uploaded_file = st.file_uploader("📁 Base para exportar", type=["csv", "xls", "xlsx"])
-    if uploaded_file:
-        df = read_flexible_file(uploaded_file)
+    # Un archivo nuevo o un dataset ya cargado en otra página
+    nombre, df = elegir_datos("📁 Base para exportar", key="exportador")
+    if df is not None:
         
         # Opciones de filtrado
         st.subheader("Filtrar datos")
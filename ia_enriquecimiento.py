@@ -1,6 +1,7 @@
 import streamlit as st
-from openai import OpenAI
-from utils import get_api_key, read_flexible_file
+from cliente_llm import cliente_openai
+from enriquecimiento_lotes import enriquecer_por_lotes, PRESUPUESTO_TOKENS_LOTE, CONCURRENCIA_LOTES
+from utils import get_api_key, read_flexible_file, seleccionar_hoja_excel
 import pandas as pd
 import io
 
@@ -26,8 +27,8 @@ def run_ia_enriquecimiento():
             st.session_state["openai_api_key"] = api_key
             st.success("✅ Clave API guardada para esta sesión.")
     
-    # Configuración
-    cliente = OpenAI(api_key=api_key)
+    # Configuración: el cliente usa el pool de conexiones compartido del proceso
+    cliente = cliente_openai(api_key)
     modelo = st.selectbox("Modelo de IA:", ["gpt-3.5-turbo", "gpt-4", "gpt-4o"])
     
     # Instrucciones personalizadas
@@ -35,6 +36,9 @@ def run_ia_enriquecimiento():
     instruccion_default = "Limpia y estructura profesionalmente los siguientes datos para que estén listos para importar a un sistema."
     instruccion = st.text_area("Instrucciones personalizadas:", instruccion_default, height=100)
     
+    # Datos a procesar por lotes (solo para archivos CSV/Excel)
+    df_lotes = None
+    
     # Opciones de entrada: Archivo o texto manual
     entrada_tipo = st.radio("Selecciona el origen de los datos:", ["Cargar archivo", "Ingresar datos manualmente"])
     
@@ -53,23 +57,43 @@ def run_ia_enriquecimiento():
                     entrada = texto_archivo
                 else:
                     # Para archivos CSV, Excel
-                    df = read_flexible_file(uploaded_file)
+                    hoja, columnas = seleccionar_hoja_excel(uploaded_file, key="enriquecimiento")
+                    df = read_flexible_file(uploaded_file, hoja=hoja, columnas=columnas)
                     st.subheader("Vista previa del archivo:")
                     st.dataframe(df.head(10))
                     
+                    # Por lotes: el DataFrame se divide según un presupuesto de tokens y los
+                    # lotes se envían en paralelo, en lugar de un único prompt con todas las filas
+                    por_lotes = st.checkbox("Procesar por lotes en paralelo", value=True,
+                                            help="Divide las filas en lotes que entran en el contexto del modelo, los envía a la vez "
+                                                 "y une las respuestas en una sola tabla. Cada lote se reintenta por separado si falla.")
+                    
                     # Opciones de preprocesamiento
                     col1, col2 = st.columns(2)
                     with col1:
-                        include_headers = st.checkbox("Incluir encabezados", value=True)
+                        include_headers = st.checkbox("Incluir encabezados", value=True, disabled=por_lotes)
                     with col2:
-                        max_rows = st.number_input("Máximo de filas a procesar", min_value=10, max_value=1000, value=100)
+                        max_rows = st.number_input("Máximo de filas a procesar", min_value=10,
+                                                   max_value=100000 if por_lotes else 1000, value=100)
                     
-                    # Convertir DataFrame a texto
+                    if por_lotes:
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            presupuesto_tokens = st.number_input("Tokens de datos por lote", min_value=200, max_value=50000,
+                                                                 value=PRESUPUESTO_TOKENS_LOTE, step=500)
+                        with col2:
+                            concurrencia = st.number_input("Lotes en paralelo", min_value=1, max_value=16,
+                                                           value=CONCURRENCIA_LOTES)
+                        df_lotes = df.head(max_rows)
+                    
+                    # Convertir DataFrame a texto (por lotes solo se usa para el historial:
+                    # cada lote se serializa por separado)
+                    filas_texto = df.head(min(max_rows, 20) if por_lotes else max_rows)
                     buffer = io.StringIO()
                     if include_headers:
-                        df.head(max_rows).to_csv(buffer, index=False)
+                        filas_texto.to_csv(buffer, index=False)
                     else:
-                        df.head(max_rows).to_csv(buffer, index=False, header=False)
+                        filas_texto.to_csv(buffer, index=False, header=False)
                     entrada = buffer.getvalue()
                 
                 # Instrucciones específicas para este archivo
@@ -100,7 +124,9 @@ def run_ia_enriquecimiento():
                               placeholder="Ejemplo: Juan Perez - gerente, 38 años, Bs As\nMaria Gomez 45a coordinadora CABA\n...")
     
     # Formato de salida
-    formato_salida = st.selectbox("Formato de salida deseado:", ["CSV", "JSON", "Excel", "Tabla", "Auto-detectar"])
+    formato_salida = st.selectbox("Formato de salida deseado:", ["CSV", "JSON", "Excel", "Tabla", "Auto-detectar"],
+                                  disabled=df_lotes is not None,
+                                  help="Al procesar por lotes la salida siempre es una tabla (CSV).")
     
     # Botón de procesamiento
     procesar_btn = st.button("Limpiar y enriquecer con IA")
@@ -108,6 +134,37 @@ def run_ia_enriquecimiento():
     if procesar_btn:
         if not entrada or entrada.strip() == "":
             st.warning("Por favor, ingresa datos o carga un archivo para procesar.")
+        elif df_lotes is not None:
+            progreso = st.progress(0.0, text="Procesando lotes con inteligencia artificial...")
+            
+            def al_progresar(terminados, total):
+                progreso.progress(terminados / total, text=f"Lotes procesados: {terminados} de {total}")
+            
+            df_result, errores = enriquecer_por_lotes(cliente, modelo, instruccion, df_lotes,
+                                                      presupuesto_tokens=presupuesto_tokens, concurrencia=concurrencia,
+                                                      al_progresar=al_progresar)
+            progreso.empty()
+            
+            if errores:
+                st.warning(f"⚠️ {len(errores)} lote(s) fallaron tras los reintentos; sus filas no están en el resultado.")
+                with st.expander("Ver lotes con error"):
+                    for error in errores:
+                        st.write(f"Lote {error['lote']} (filas {error['filas'][0]}-{error['filas'][1] - 1}): {error['error']}")
+            
+            if not df_result.empty:
+                salida = df_result.to_csv(index=False)
+                st.success(f"Resultado generado por IA: {len(df_result):,} filas")
+                st.dataframe(df_result)
+                st.download_button("📥 Descargar CSV", salida, "datos_estructurados.csv", "text/csv")
+                
+                # Guardar en historial
+                if 'historial_ia_enriq' not in st.session_state:
+                    st.session_state.historial_ia_enriq = []
+                st.session_state.historial_ia_enriq.append({
+                    "entrada": entrada.strip()[:500] + ("..." if len(entrada.strip()) > 500 else ""),
+                    "salida": salida,
+                    "modelo": modelo
+                })
         else:
             with st.spinner("Procesando con inteligencia artificial..."):
                 # Construir el prompt completo
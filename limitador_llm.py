@@ -0,0 +1,334 @@
+"""
+Límite de uso de las APIs de modelos de lenguaje, compartido por todas las llamadas.
+
+Cada proveedor (redpill, openai) tiene dos cubetas de tokens, una de peticiones
+por minuto y otra de tokens por minuto, y un límite de peticiones simultáneas
+que se ajusta solo (AIMD): sube de a poco con cada respuesta correcta y se reduce
+a la mitad cuando la API responde 429. Ante un 429 todas las llamadas al
+proveedor esperan lo que indica `Retry-After` y la petición se reintenta con
+backoff exponencial con jitter, así los trabajos masivos van al máximo ritmo que
+la API sostiene en lugar de fallar.
+
+El límite se aplica en el transporte del cliente HTTP compartido
+(ver `cliente_llm`), así que cubre también al SDK de OpenAI.
+"""
+
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+# Límites por proveedor si no están configurados en Administración
+LIMITES_POR_DEFECTO = {
+    "redpill": {"rpm": 60, "tpm": 100_000},
+    "openai": {"rpm": 500, "tpm": 200_000},
+}
+
+# Peticiones simultáneas por proveedor: al empezar y como máximo
+CONCURRENCIA_INICIAL = 4
+CONCURRENCIA_MAXIMA = 16
+
+# Tiempo mínimo entre dos reducciones de la concurrencia (los 429 de una misma
+# ráfaga cuentan como uno solo)
+SEGUNDOS_ENTRE_REDUCCIONES = 1.0
+
+# Reintentos ante un 429 y límites del backoff exponencial
+REINTENTOS_429 = 5
+SEGUNDOS_BACKOFF_BASE = 1.0
+SEGUNDOS_BACKOFF_MAXIMO = 60.0
+
+# Tokens de respuesta supuestos cuando la petición no indica max_tokens
+TOKENS_RESPUESTA_POR_DEFECTO = 500
+
+CARACTERES_POR_TOKEN = 4
+
+_limitadores: Dict[str, "LimitadorProveedor"] = {}
+_bloqueo = threading.Lock()
+
+
+class CubetaTokens:
+    """
+    Cubeta de tokens que se rellena a ritmo constante (capacidad por minuto).
+
+    Args:
+        por_minuto: Capacidad de la cubeta y cantidad que se repone por minuto
+    """
+
+    def __init__(self, por_minuto: float):
+        self.capacidad = float(por_minuto)
+        self.tasa = self.capacidad / 60.0
+        self.nivel = self.capacidad
+        self.ultimo = time.monotonic()
+        self._bloqueo = threading.Lock()
+
+    def esperar(self, cantidad: float) -> None:
+        """Espera hasta poder consumir `cantidad` y la descuenta (puede quedar en deuda si supera la capacidad)."""
+        while True:
+            with self._bloqueo:
+                ahora = time.monotonic()
+                self.nivel = min(self.capacidad, self.nivel + (ahora - self.ultimo) * self.tasa)
+                self.ultimo = ahora
+                necesario = min(cantidad, self.capacidad)
+                if self.nivel >= necesario:
+                    self.nivel -= cantidad
+                    return
+                espera = (necesario - self.nivel) / self.tasa
+            time.sleep(espera)
+
+
+class ConcurrenciaAdaptativa:
+    """
+    Límite de peticiones simultáneas con aumento aditivo y reducción multiplicativa.
+
+    Args:
+        inicial: Límite al empezar
+        maxima: Límite máximo
+    """
+
+    def __init__(self, inicial: int = CONCURRENCIA_INICIAL, maxima: int = CONCURRENCIA_MAXIMA):
+        self.limite = float(inicial)
+        self.maxima = maxima
+        self.en_curso = 0
+        self._ultima_reduccion = 0.0
+        self._condicion = threading.Condition()
+
+    def adquirir(self) -> None:
+        """Espera un lugar libre y lo ocupa."""
+        with self._condicion:
+            while self.en_curso >= int(self.limite):
+                self._condicion.wait()
+            self.en_curso += 1
+
+    def liberar(self) -> None:
+        """Libera un lugar ocupado."""
+        with self._condicion:
+            self.en_curso -= 1
+            self._condicion.notify()
+
+    def exito(self) -> None:
+        """Aumento aditivo: alrededor de +1 por cada `limite` respuestas correctas."""
+        with self._condicion:
+            anterior = int(self.limite)
+            self.limite = min(self.maxima, self.limite + 1.0 / self.limite)
+            if int(self.limite) > anterior:
+                self._condicion.notify()
+
+    def saturacion(self) -> None:
+        """Reducción multiplicativa: la mitad, como mínimo 1."""
+        with self._condicion:
+            ahora = time.monotonic()
+            if ahora - self._ultima_reduccion >= SEGUNDOS_ENTRE_REDUCCIONES:
+                self.limite = max(1.0, self.limite / 2)
+                self._ultima_reduccion = ahora
+
+
+class LimitadorProveedor:
+    """
+    Límites de un proveedor: peticiones y tokens por minuto, concurrencia adaptativa
+    y pausa común tras un `Retry-After`.
+
+    Args:
+        rpm: Peticiones por minuto
+        tpm: Tokens por minuto (prompt más respuesta estimada)
+    """
+
+    def __init__(self, rpm: float, tpm: float):
+        self.peticiones = CubetaTokens(rpm)
+        self.tokens = CubetaTokens(tpm)
+        self.concurrencia = ConcurrenciaAdaptativa()
+        self._pausa_hasta = 0.0
+
+    def adquirir(self, tokens: float) -> None:
+        """Espera la pausa común, un lugar de concurrencia y el cupo de peticiones y tokens."""
+        espera = self._pausa_hasta - time.monotonic()
+        if espera > 0:
+            # Jitter para que las llamadas en pausa no vuelvan todas en el mismo instante
+            time.sleep(espera + random.uniform(0, SEGUNDOS_BACKOFF_BASE))
+        self.concurrencia.adquirir()
+        try:
+            self.peticiones.esperar(1)
+            self.tokens.esperar(tokens)
+        except BaseException:
+            self.concurrencia.liberar()
+            raise
+
+    def liberar(self) -> None:
+        """Libera el lugar de concurrencia de una petición terminada."""
+        self.concurrencia.liberar()
+
+    def registrar_exito(self) -> None:
+        """Registra una respuesta correcta."""
+        self.concurrencia.exito()
+
+    def registrar_saturacion(self, retry_after: Optional[float] = None) -> None:
+        """Registra un 429: reduce la concurrencia y, si la API lo indica, pausa al proveedor."""
+        self.concurrencia.saturacion()
+        if retry_after:
+            self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + retry_after)
+
+
+def limites_configurados(proveedor: str) -> Dict[str, float]:
+    """
+    Peticiones (`rpm`) y tokens (`tpm`) por minuto de un proveedor.
+
+    Se leen de la configuración (general → limites_llm) y, si no están, de
+    LIMITES_POR_DEFECTO.
+    """
+    limites = dict(LIMITES_POR_DEFECTO.get(proveedor, LIMITES_POR_DEFECTO["redpill"]))
+    try:
+        from config_manager import load_config
+        limites.update(load_config().get("general", {}).get("limites_llm", {}).get(proveedor, {}))
+    except Exception:
+        pass
+    return limites
+
+
+def proveedor_de_url(url: str) -> str:
+    """Proveedor al que corresponde una URL (los endpoints que no son de OpenAI cuentan como redpill)."""
+    return "openai" if "openai" in (urlparse(url).hostname or "") else "redpill"
+
+
+def obtener_limitador(proveedor: str) -> LimitadorProveedor:
+    """Limitador compartido de un proveedor, creado con sus límites la primera vez."""
+    limitador = _limitadores.get(proveedor)
+    if limitador is None:
+        with _bloqueo:
+            limitador = _limitadores.get(proveedor)
+            if limitador is None:
+                limites = limites_configurados(proveedor)
+                limitador = LimitadorProveedor(limites["rpm"], limites["tpm"])
+                _limitadores[proveedor] = limitador
+    return limitador
+
+
+def reiniciar_limitadores() -> None:
+    """Descarta los limitadores para que los próximos usen la configuración actual."""
+    with _bloqueo:
+        _limitadores.clear()
+
+
+def segundos_retry_after(encabezados: httpx.Headers) -> Optional[float]:
+    """
+    Segundos de espera indicados por la API en un 429.
+
+    Admite `retry-after-ms`, `Retry-After` en segundos y `Retry-After` como fecha HTTP.
+    """
+    if "retry-after-ms" in encabezados:
+        try:
+            return max(float(encabezados["retry-after-ms"]) / 1000, 0.0)
+        except ValueError:
+            pass
+    valor = encabezados.get("retry-after")
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(valor).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def espera_backoff(intento: int, retry_after: Optional[float] = None) -> float:
+    """
+    Segundos a esperar antes de reintentar.
+
+    Args:
+        intento: Número de reintento (desde 0)
+        retry_after: Espera indicada por la API, si la hay
+
+    Returns:
+        float: La espera indicada más un jitter chico o, sin indicación, un
+        backoff exponencial con jitter completo
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, SEGUNDOS_BACKOFF_BASE)
+    return random.uniform(0, min(SEGUNDOS_BACKOFF_MAXIMO, SEGUNDOS_BACKOFF_BASE * 2 ** intento))
+
+
+def estimar_tokens_peticion(peticion: httpx.Request) -> float:
+    """Tokens estimados de una petición: prompt (por caracteres) más la respuesta máxima pedida."""
+    try:
+        cuerpo = peticion.content
+    except httpx.RequestNotRead:
+        return TOKENS_RESPUESTA_POR_DEFECTO
+    try:
+        max_tokens = json.loads(cuerpo).get("max_tokens") or TOKENS_RESPUESTA_POR_DEFECTO
+    except (ValueError, AttributeError):
+        max_tokens = TOKENS_RESPUESTA_POR_DEFECTO
+    return len(cuerpo) / CARACTERES_POR_TOKEN + max_tokens
+
+
+class _FlujoConLiberacion(httpx.SyncByteStream):
+    """Cuerpo de una respuesta que libera el lugar de concurrencia al cerrarse."""
+
+    def __init__(self, flujo: httpx.SyncByteStream, liberar):
+        self._flujo = flujo
+        self._liberar = liberar
+
+    def __iter__(self):
+        yield from self._flujo
+
+    def close(self) -> None:
+        try:
+            self._flujo.close()
+        finally:
+            if self._liberar is not None:
+                liberar, self._liberar = self._liberar, None
+                liberar()
+
+
+class TransporteLimitado(httpx.BaseTransport):
+    """
+    Transporte de httpx que aplica el limitador del proveedor a cada petición y
+    reintenta los 429.
+
+    Args:
+        transporte: Transporte que envía las peticiones
+    """
+
+    def __init__(self, transporte: httpx.BaseTransport):
+        self._transporte = transporte
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        limitador = obtener_limitador(proveedor_de_url(str(request.url)))
+        tokens = estimar_tokens_peticion(request)
+        for intento in range(REINTENTOS_429 + 1):
+            limitador.adquirir(tokens)
+            try:
+                respuesta = self._transporte.handle_request(request)
+            except BaseException:
+                limitador.liberar()
+                raise
+
+            if respuesta.status_code == 429 and intento < REINTENTOS_429:
+                retry_after = segundos_retry_after(respuesta.headers)
+                respuesta.close()
+                limitador.liberar()
+                limitador.registrar_saturacion(retry_after)
+                time.sleep(espera_backoff(intento, retry_after))
+                continue
+
+            if respuesta.status_code == 429:
+                # Último intento: el 429 llega al que llama, pero la concurrencia igual se reduce
+                limitador.registrar_saturacion(segundos_retry_after(respuesta.headers))
+            elif respuesta.status_code < 400:
+                limitador.registrar_exito()
+            # El lugar se libera cuando se termina de leer la respuesta (importa en streaming)
+            return httpx.Response(
+                status_code=respuesta.status_code,
+                headers=respuesta.headers,
+                stream=_FlujoConLiberacion(respuesta.stream, limitador.liberar),
+                extensions=respuesta.extensions,
+                request=request,
+            )
+
+    def close(self) -> None:
+        self._transporte.close()
@@ -6,12 +6,21 @@ import os
 import warnings
 import requests
 from typing import Optional
-from utils import read_flexible_file, are_similar, normalize_column_names, get_api_key, get_api_url
+from utils import read_flexible_file, are_similar, normalize_column_names, get_api_key, get_api_url, huella_archivo, detectar_formato_csv, seleccionar_hoja_excel, leer_muestra, filas_totales
+from motor_cruce import cruzar, cruzar_compuesto, obtener_indice, cargar_resultados, guardar_resultados, etiquetas_filas
+from explorador_umbral import ExploradorUmbral, UMBRAL_MINIMO_EXPLORACION
+from cruce_lsh import cruzar_lsh, umbral_jaccard
+from cruce_tfidf import cruzar_tfidf
+from cruce_espanol import cruzar_espanol
+from cruce_tipado import detectar_tipo, cruzar_numerico, cruzar_fechas
+from cruce_streaming import leer_encabezado, leer_columna, cruzar_en_streaming, ruta_salida_streaming
+from almacen_datasets import registrar_archivo, registrar_dataset
 from api_proxy import make_api_request_proxy
 # Usar la versión corregida del archivo api_context
 from api_context_fixed import make_api_request_contexto, make_api_request_agente, guardar_dataframes_en_sesion
 # Importar el arreglo para la API key
 from api_fix import ensure_api_key_exists
+from config_manager import load_config
 
 # Configuración de la página
 st.set_page_config(
@@ -95,19 +104,120 @@ if navegacion == "🔄 Cruce Inteligente":
         uploaded_file_1 = st.file_uploader("Subir archivo BASE", type=["csv", "xls", "xlsx"],
                                           accept_multiple_files=False,
                                           key="upload_base")
+        if uploaded_file_1:
+            hoja_base, columnas_base_excel = seleccionar_hoja_excel(uploaded_file_1, key="base")
     
     with col2:
         st.markdown("### 📄 Archivo NUEVO (a cruzar)")
         uploaded_file_2 = st.file_uploader("Subir archivo NUEVO", type=["csv", "xls", "xlsx"],
                                           accept_multiple_files=False,
                                           key="upload_nuevo")
+        if uploaded_file_2:
+            hoja_nuevo, columnas_nuevo_excel = seleccionar_hoja_excel(uploaded_file_2, key="nuevo")
     
-    if uploaded_file_1 and uploaded_file_2:
-        with st.spinner("Cargando archivos..."):
-            base_df = read_flexible_file(uploaded_file_1)
-            new_df = read_flexible_file(uploaded_file_2)
+    modo_streaming = st.checkbox(
+        "Modo streaming para archivos muy grandes (solo CSV)",
+        help="Lee el archivo NUEVO por fragmentos y escribe los resultados en disco a medida que se encuentran, "
+             "sin cargar los archivos completos en memoria."
+    )
+    
+    archivo_base, archivo_nuevo = uploaded_file_1, uploaded_file_2
+    if modo_streaming:
+        # Los archivos subidos quedan completos en memoria y limitados por el tamaño
+        # máximo de subida; las rutas del servidor se leen directamente del disco
+        origen_streaming = st.radio(
+            "Origen de los archivos", ["Archivos subidos", "Rutas en el servidor"], horizontal=True,
+            help="Para archivos de varios GB, indica la ruta de los CSV en el disco del servidor: se leen por "
+                 "fragmentos sin subirlos ni cargarlos en memoria."
+        )
+        if origen_streaming == "Rutas en el servidor":
+            archivo_base = st.text_input("Ruta del CSV BASE en el servidor").strip() or None
+            archivo_nuevo = st.text_input("Ruta del CSV NUEVO en el servidor").strip() or None
+            for ruta in (archivo_base, archivo_nuevo):
+                if ruta and not os.path.isfile(ruta):
+                    st.error(f"❌ No se encontró el archivo: {ruta}")
+                    st.stop()
+    
+    if archivo_base and archivo_nuevo and modo_streaming:
+        nombre_base, nombre_nuevo = (os.path.basename(f) if isinstance(f, str) else f.name
+                                     for f in (archivo_base, archivo_nuevo))
+        if not all(nombre.lower().endswith(".csv") for nombre in (nombre_base, nombre_nuevo)):
+            st.error("❌ El modo streaming solo admite archivos CSV.")
+            st.stop()
+        
+        # Solo se leen los encabezados; las columnas se normalizan igual que en el modo normal
+        formato_base = detectar_formato_csv(archivo_base)
+        formato_nuevo = detectar_formato_csv(archivo_nuevo)
+        encabezado_base = leer_encabezado(archivo_base, *formato_base)
+        encabezado_nuevo = leer_encabezado(archivo_nuevo, *formato_nuevo)
+        columnas_base = dict(zip(normalize_column_names(encabezado_base), encabezado_base))
+        columnas_nuevo = dict(zip(normalize_column_names(encabezado_nuevo), encabezado_nuevo))
+        
+        st.markdown("<h3 class='section-header'>🔑 Selección de campo clave</h3>", unsafe_allow_html=True)
+        campo_clave = st.selectbox("Selecciona el campo para el cruce de datos:", list(columnas_nuevo))
+        if campo_clave not in columnas_base:
+            st.error(f"❌ La columna '{campo_clave}' no existe en el archivo BASE.")
+            st.stop()
+        st.session_state["campo_clave"] = campo_clave
+        umbral = st.slider("Umbral de similitud", min_value=50, max_value=100, value=85,
+                           help="Score mínimo (0-100) para considerar que dos registros coinciden.")
+        k_coincidencias = st.number_input(
+            "Coincidencias por registro (top-k)", min_value=1, max_value=10, value=1,
+            help="Cantidad máxima de registros del BASE que se devuelven por cada registro del NUEVO, de mejor a peor score."
+        )
+        
+        if st.button("Realizar cruce de datos", key="realizar_cruce_streaming"):
+            workers = load_config().get("general", {}).get("cruce_workers", 1)
+            
+            with st.spinner("Construyendo el índice del BASE..."):
+                hash_base = huella_archivo(archivo_base)
+                valores_base = leer_columna(archivo_base, columnas_base[campo_clave], *formato_base)
+                indice_base, indice_reutilizado = obtener_indice(hash_base, campo_clave, valores_base)
+                del valores_base
+            
+            progreso = st.progress(0.0, text="Buscando coincidencias...")
+            st.button("⏹️ Cancelar cruce", key="cancelar_cruce")
+            
+            def al_progresar_streaming(filas, fraccion):
+                progreso.progress(fraccion, text=f"Procesadas {filas:,} filas ({fraccion*100:.0f}% del archivo)")
+            
+            totales = cruzar_en_streaming(archivo_nuevo, columnas_nuevo[campo_clave], indice_base,
+                                          ruta_salida_streaming(), umbral=umbral, k=k_coincidencias, workers=workers,
+                                          encoding=formato_nuevo[0], separador=formato_nuevo[1],
+                                          al_progresar=al_progresar_streaming)
+            progreso.empty()
+            
+            st.markdown(f"""
+            <div class='success-box'>
+                <h3>✅ Cruce completado</h3>
+                <p>Se encontraron coincidencias para {totales['cruzadas']:,} de {totales['filas']:,} registros ({totales['cruzadas']/max(totales['filas'], 1)*100:.1f}%).</p>
+                <p>Exactas: {totales['exacta']:,} | Normalizadas: {totales['normalizada']:,} | Difusas: {totales['difusa']:,}</p>
+                <p>Índice del BASE: {'reutilizado desde caché' if indice_reutilizado else 'construido y guardado en caché'}</p>
+                <p>Resultados guardados en: <code>{totales['ruta']}</code></p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            # Solo se muestra el comienzo del archivo de resultados
+            st.markdown("<h3 class='section-header'>🔍 Resultados del cruce (primeras 1.000 filas)</h3>", unsafe_allow_html=True)
+            st.dataframe(pd.read_csv(totales['ruta'], nrows=1000), use_container_width=True)
+            with open(totales['ruta'], "rb") as resultados:
+                st.download_button(
+                    label="📥 Exportar resultados",
+                    data=resultados,
+                    file_name=f"resultados_cruce_{nombre_base}_{nombre_nuevo}.csv",
+                    mime="text/csv"
+                )
+    
+    elif uploaded_file_1 and uploaded_file_2 and not modo_streaming:
+        with st.spinner("Leyendo estructura de los archivos..."):
+            # Primera fase: encabezado y primeras filas para la vista previa y la
+            # selección de campos; los archivos completos se cargan al realizar el cruce
+            base_df = leer_muestra(uploaded_file_1, hoja=hoja_base, columnas=columnas_base_excel)
+            new_df = leer_muestra(uploaded_file_2, hoja=hoja_nuevo, columnas=columnas_nuevo_excel)
 
-            # Normalizar columnas
+            # Normalizar columnas, recordando el nombre original para la carga completa
+            columnas_base = dict(zip(normalize_column_names(base_df.columns), base_df.columns))
+            columnas_nuevo = dict(zip(normalize_column_names(new_df.columns), new_df.columns))
             new_df.columns = normalize_column_names(new_df.columns)
             base_df.columns = normalize_column_names(base_df.columns)
 
@@ -120,52 +230,305 @@ if navegacion == "🔄 Cruce Inteligente":
         
         with col1:
             st.markdown(f"**Archivo BASE:** {uploaded_file_1.name}")
-            st.write(f"Filas: {len(base_df):,} | Columnas: {len(base_df.columns):,}")
+            st.write(f"Filas: {filas_totales(base_df):,} | Columnas: {len(base_df.columns):,}")
             with st.expander("Ver muestra"):
                 st.dataframe(base_df.head(5), use_container_width=True)
         
         with col2:
             st.markdown(f"**Archivo NUEVO:** {uploaded_file_2.name}")
-            st.write(f"Filas: {len(new_df):,} | Columnas: {len(new_df.columns):,}")
+            st.write(f"Filas: {filas_totales(new_df):,} | Columnas: {len(new_df.columns):,}")
             with st.expander("Ver muestra"):
                 st.dataframe(new_df.head(5), use_container_width=True)
         
         st.markdown("<h3 class='section-header'>🔑 Selección de campo clave</h3>", unsafe_allow_html=True)
         
-        campo_clave = st.selectbox("Selecciona el campo para el cruce de datos:", new_df.columns)
-        if campo_clave not in base_df.columns:
-            st.error(f"❌ La columna '{campo_clave}' no existe en el archivo BASE.")
-            st.stop()
+        tipo_clave = st.radio("Tipo de clave", ["Campo único", "Clave compuesta"], horizontal=True)
+        
+        if tipo_clave == "Campo único":
+            campo_clave = st.selectbox("Selecciona el campo para el cruce de datos:", new_df.columns)
+            if campo_clave not in base_df.columns:
+                st.error(f"❌ La columna '{campo_clave}' no existe en el archivo BASE.")
+                st.stop()
+        else:
+            # Clave compuesta: columnas presentes en ambos archivos, cada una con su comparación
+            columnas_comunes = [c for c in new_df.columns if c in base_df.columns]
+            seleccion = st.multiselect("Selecciona las columnas de la clave compuesta:", columnas_comunes)
+            if not seleccion:
+                st.info("Selecciona al menos una columna para la clave compuesta.")
+                st.stop()
+            
+            tipos_columna = {"Exacta (bloqueo)": "exacta", "Difusa (texto)": "difusa", "Numérica (tolerancia)": "numerica"}
+            columnas_clave = []
+            for columna in seleccion:
+                col1, col2, col3 = st.columns([2, 1, 1])
+                with col1:
+                    tipo = st.selectbox(f"Comparación para '{columna}'", list(tipos_columna), key=f"tipo_{columna}")
+                with col2:
+                    peso = st.number_input("Peso", min_value=0.1, value=1.0, step=0.5, key=f"peso_{columna}",
+                                           disabled=tipos_columna[tipo] == "exacta")
+                with col3:
+                    tolerancia = st.number_input("Tolerancia", min_value=0.0, value=0.0, key=f"tolerancia_{columna}",
+                                                 disabled=tipos_columna[tipo] != "numerica")
+                columnas_clave.append({"columna": columna, "tipo": tipos_columna[tipo], "peso": peso, "tolerancia": tolerancia})
+            
+            # El score es el promedio ponderado de las columnas difusas y numéricas
+            puntuadas = [c for c in columnas_clave if c["tipo"] != "exacta"]
+            if puntuadas and sum(c["peso"] for c in puntuadas) <= 0:
+                st.error("❌ La suma de los pesos de las columnas difusas y numéricas debe ser mayor que 0.")
+                st.stop()
+            if not any(c["tipo"] == "exacta" for c in columnas_clave):
+                st.warning("⚠️ Sin columnas exactas no hay bloques: se compararán todas las filas del NUEVO contra todas las del BASE.")
+            campo_clave = " + ".join(seleccion)
         
         # Guardar campo clave en sesión
         st.session_state["campo_clave"] = campo_clave
         
+        # Si se canceló un cruce en curso, informar las coincidencias parciales
+        if st.session_state.get("cancelar_cruce"):
+            st.warning(f"⏹️ Cruce cancelado. Se conservan {len(st.session_state.get('coincidencias', [])):,} coincidencias parciales.")
+        
+        umbral = st.slider("Umbral de similitud", min_value=50, max_value=100, value=85,
+                           help="Score mínimo (0-100) para considerar que dos registros coinciden.")
+        explorar_umbral = st.checkbox(
+            "Explorador de umbral", value=False,
+            help=f"Puntúa una sola vez con umbral {UMBRAL_MINIMO_EXPLORACION} y luego filtra los resultados al mover el umbral, "
+                 "sin volver a ejecutar el cruce."
+        )
+        
+        k_coincidencias = st.number_input(
+            "Coincidencias por registro (top-k)", min_value=1, max_value=10, value=1,
+            help="Cantidad máxima de registros del BASE que se devuelven por cada registro del NUEVO, de mejor a peor score."
+        )
+        
+        if tipo_clave == "Campo único":
+            # Los campos numéricos y de fecha se cruzan por tolerancia, no como texto
+            tipo_campo = detectar_tipo(new_df[campo_clave], base_df[campo_clave])
+            if tipo_campo != "texto" and st.checkbox(f"Tratar '{campo_clave}' como texto", value=False,
+                                                     help="Usa el fuzzy matching de texto en lugar del cruce por tolerancia."):
+                tipo_campo = "texto"
+        
+        if tipo_clave == "Campo único" and tipo_campo == "numerica":
+            motor = "numerica"
+            st.info(f"🔢 '{campo_clave}' es numérico: se cruza por tolerancia (|nuevo - base| ≤ tolerancia).")
+            tolerancia = st.number_input("Tolerancia", min_value=0.0, value=0.0,
+                                         help="Diferencia máxima admitida entre valores. Con 0 solo cruzan valores iguales.")
+        elif tipo_clave == "Campo único" and tipo_campo == "fecha":
+            motor = "fecha"
+            st.info(f"📅 '{campo_clave}' es una fecha: se cruza dentro de una ventana de días.")
+            dias = st.number_input("Ventana en días (±)", min_value=0, value=0, step=1,
+                                   help="Días de diferencia admitidos entre fechas. Con 0 solo cruzan fechas iguales.")
+        elif tipo_clave == "Campo único":
+            motores = {"Índice de bloques (exacto)": "bloques", "MinHash/LSH (aproximado)": "lsh",
+                       "TF-IDF de n-gramas (coseno)": "tfidf",
+                       "Nombres y direcciones en español (fonético)": "espanol"}
+            motor = motores[st.selectbox(
+                "Motor de cruce", list(motores),
+                help="El modo aproximado compara solo los pares que comparten algún bucket LSH: es mucho más rápido con archivos muy grandes, a cambio de perder algunas coincidencias. "
+                     "TF-IDF puntúa por similitud coseno de n-gramas de caracteres y funciona mejor con razones sociales largas. "
+                     "El modo en español expande abreviaturas (Av., Bs As, CABA...) y agrupa grafías que suenan igual."
+            )]
+            if motor == "lsh":
+                col1, col2 = st.columns(2)
+                with col1:
+                    bandas = st.number_input("Bandas LSH", min_value=1, max_value=64, value=16,
+                                             help="Más bandas encuentran más coincidencias (más recall) pero generan más pares a verificar.")
+                with col2:
+                    filas = st.number_input("Filas por banda", min_value=1, max_value=16, value=4,
+                                            help="Más filas por banda reducen los pares a verificar pero pierden coincidencias.")
+                st.caption(f"Los pares con similitud de Jaccard (trigramas) mayor a ~{umbral_jaccard(bandas, filas):.2f} "
+                           f"tienen más del 50% de probabilidad de ser comparados.")
+        
+        if tipo_clave == "Campo único":
+            cruce_incremental = st.checkbox(
+                "Cruce incremental", value=motor == "bloques", disabled=motor != "bloques",
+                help="Reutiliza los resultados de cruces anteriores contra el mismo archivo BASE y solo calcula las filas nuevas o modificadas."
+            )
+        
         if st.button("Realizar cruce de datos", key="realizar_cruce"):
-            with st.spinner("Buscando coincidencias..."):
-                coincidencias = []
-                for _, fila in new_df.iterrows():
-                    val = fila[campo_clave]
-                    for _, bfila in base_df.iterrows():
-                        if are_similar(val, bfila[campo_clave]):
-                            coincidencias.append((val, bfila[campo_clave]))
-                            break
-
-                # Guardar coincidencias en sesión
-                st.session_state["coincidencias"] = coincidencias
+            # Procesos para el fuzzy matching (configurable en Administración)
+            workers = load_config().get("general", {}).get("cruce_workers", 1)
+            
+            # Segunda fase: archivos completos, solo con las columnas que usa el cruce
+            columnas_cruce = seleccion if tipo_clave == "Clave compuesta" else [campo_clave]
+            with st.spinner("Cargando las columnas del cruce..."):
+                # Lectura con pyarrow y tipos compactos (category, enteros/float más chicos)
+                base_df = read_flexible_file(uploaded_file_1, compactar=True, hoja=hoja_base,
+                                             columnas=[columnas_base[c] for c in columnas_cruce])
+                new_df = read_flexible_file(uploaded_file_2, compactar=True, hoja=hoja_nuevo,
+                                            columnas=[columnas_nuevo[c] for c in columnas_cruce])
+                base_df.columns = normalize_column_names(base_df.columns)
+                new_df.columns = normalize_column_names(new_df.columns)
+            # El asistente conserva las muestras, ahora con el total exacto de filas
+            st.session_state["base_df"].attrs["filas_totales"] = len(base_df)
+            st.session_state["new_df"].attrs["filas_totales"] = len(new_df)
+            
+            # Los archivos completos quedan disponibles para las demás páginas; se
+            # registran en diferido (solo se parsean si alguna página los abre), así
+            # el cruce lee únicamente las columnas que usa
+            with st.spinner("Registrando los archivos para las demás páginas..."):
+                registrar_archivo(f"BASE - {uploaded_file_1.name}", uploaded_file_1, hoja_base, columnas_base_excel,
+                                  diferido=True)
+                registrar_archivo(f"NUEVO - {uploaded_file_2.name}", uploaded_file_2, hoja_nuevo, columnas_nuevo_excel,
+                                  diferido=True)
+            
+            # Con el explorador se puntúa una vez con el umbral más bajo explorable
+            umbral_pasada = min(UMBRAL_MINIMO_EXPLORACION, umbral) if explorar_umbral else umbral
+            
+            progreso = st.progress(0.0, text="Buscando coincidencias...")
+            st.button("⏹️ Cancelar cruce", key="cancelar_cruce")
             
+            def al_progresar(procesadas, total, parciales):
+                # Las coincidencias parciales quedan en sesión aunque se cancele el cruce
+                st.session_state["coincidencias"] = parciales
+                progreso.progress(procesadas / total if total else 1.0,
+                                  text=f"Procesadas {procesadas:,} de {total:,} filas")
+            
+            if tipo_clave == "Clave compuesta":
+                # Las columnas exactas forman bloques; las demás se puntúan dentro de cada bloque
+                coincidencias, etapas = cruzar_compuesto(new_df, base_df, columnas_clave, umbral=umbral_pasada, k=k_coincidencias,
+                                                         al_progresar=al_progresar)
+                registros_cruzados = etapas['compuesta']
+                detalles = [
+                    f"Bloques comparados: {etapas['bloques']:,} | Pares puntuados: {etapas['pares']:,}"
+                ]
+            elif motor == "numerica":
+                # Búsqueda ordenada (searchsorted) de los valores dentro de la tolerancia
+                coincidencias, etapas = cruzar_numerico(new_df[campo_clave], base_df[campo_clave],
+                                                        tolerancia=tolerancia, k=k_coincidencias)
+                registros_cruzados = etapas['exacta'] + etapas['tolerancia']
+                detalles = [
+                    f"Valores iguales: {etapas['exacta']:,} | Dentro de la tolerancia (±{tolerancia:g}): {etapas['tolerancia']:,}",
+                ]
+            elif motor == "fecha":
+                coincidencias, etapas = cruzar_fechas(new_df[campo_clave], base_df[campo_clave],
+                                                      dias=dias, k=k_coincidencias)
+                registros_cruzados = etapas['exacta'] + etapas['tolerancia']
+                detalles = [
+                    f"Misma fecha: {etapas['exacta']:,} | Dentro de la ventana (±{dias} días): {etapas['tolerancia']:,}",
+                ]
+            elif motor == "lsh":
+                # MinHash/LSH: solo se verifican los pares que comparten algún bucket
+                with st.spinner("Buscando coincidencias aproximadas (MinHash/LSH)..."):
+                    coincidencias, etapas = cruzar_lsh(new_df[campo_clave], base_df[campo_clave], umbral=umbral_pasada, k=k_coincidencias,
+                                                       bandas=bandas, filas=filas)
+                registros_cruzados = etapas['exacta'] + etapas['normalizada'] + etapas['difusa']
+                if etapas['recall_estimado'] is None:
+                    recall = "no estimado (la muestra no tiene coincidencias)"
+                else:
+                    recall = f"{etapas['recall_estimado']*100:.1f}% (muestra de {etapas['muestra_recall']:,} filas con coincidencia)"
+                detalles = [
+                    f"Exactas: {etapas['exacta']:,} | Normalizadas: {etapas['normalizada']:,} | Difusas: {etapas['difusa']:,}",
+                    f"Bandas: {bandas} | Filas por banda: {filas} | Pares candidatos verificados: {etapas['pares_candidatos']:,}",
+                    f"Recall estimado frente a la búsqueda exhaustiva: {recall}",
+                ]
+            elif motor == "tfidf":
+                # Similitud coseno entre vectores TF-IDF de n-gramas de caracteres
+                coincidencias, etapas = cruzar_tfidf(new_df[campo_clave], base_df[campo_clave], umbral=umbral_pasada, k=k_coincidencias,
+                                                     al_progresar=al_progresar)
+                registros_cruzados = etapas['exacta'] + etapas['normalizada'] + etapas['difusa']
+                detalles = [
+                    f"Exactas: {etapas['exacta']:,} | Normalizadas: {etapas['normalizada']:,} | Por similitud coseno: {etapas['difusa']:,}",
+                ]
+            elif motor == "espanol":
+                # Claves normalizadas y fonéticas precalculadas una vez por columna
+                coincidencias, etapas = cruzar_espanol(new_df[campo_clave], base_df[campo_clave], umbral=umbral_pasada, k=k_coincidencias,
+                                                       al_progresar=al_progresar)
+                registros_cruzados = etapas['exacta'] + etapas['normalizada'] + etapas['fonetica'] + etapas['difusa']
+                detalles = [
+                    f"Exactas: {etapas['exacta']:,} | Normalizadas: {etapas['normalizada']:,} | "
+                    f"Fonéticas: {etapas['fonetica']:,} | Difusas: {etapas['difusa']:,}",
+                ]
+            else:
+                # El índice del BASE se guarda en caché según el contenido del archivo
+                # (y la hoja y columnas elegidas), así los cruces siguientes contra el
+                # mismo BASE no lo reconstruyen
+                hash_base = huella_archivo(uploaded_file_1, hoja_base, columnas_base_excel)
+                indice_base, indice_reutilizado = obtener_indice(hash_base, campo_clave, base_df[campo_clave])
+                
+                # Resultados por fila de cruces anteriores contra el mismo BASE
+                resultados_previos = cargar_resultados(hash_base, campo_clave, umbral_pasada, k_coincidencias) if cruce_incremental else None
+                
+                # Primero coincidencias exactas/normalizadas (hash join) y luego fuzzy
+                # matching con índice de bloques solo para las filas restantes
+                coincidencias, etapas = cruzar(new_df[campo_clave], indice_base, umbral=umbral_pasada, k=k_coincidencias,
+                                               workers=workers, al_progresar=al_progresar,
+                                               resultados_previos=resultados_previos)
+                if cruce_incremental:
+                    guardar_resultados(resultados_previos, hash_base, campo_clave, umbral_pasada, k_coincidencias)
+                registros_cruzados = etapas['exacta'] + etapas['normalizada'] + etapas['difusa']
+                detalles = [
+                    f"Exactas: {etapas['exacta']:,} | Normalizadas: {etapas['normalizada']:,} | Difusas: {etapas['difusa']:,}",
+                    f"Filas reutilizadas de cruces anteriores: {etapas['reutilizadas']:,} | Filas recalculadas: {etapas['recalculadas']:,}",
+                    f"Índice del BASE: {'reutilizado desde caché' if indice_reutilizado else 'construido y guardado en caché'}",
+                ]
+            progreso.empty()
+            if "memoria" in base_df.attrs and "memoria" in new_df.attrs:
+                memoria = {clave: (base_df.attrs["memoria"][clave] + new_df.attrs["memoria"][clave]) / 1024**2
+                           for clave in ("antes", "despues")}
+                detalles.append(f"Memoria de las columnas cargadas: {memoria['despues']:,.1f} MB "
+                                f"(antes de compactar: {memoria['antes']:,.1f} MB)")
+            
+            # Los resultados quedan en sesión para poder refiltrarlos al mover el umbral
+            # Los cruces por tolerancia no usan el umbral de similitud
+            cruce_por_tolerancia = tipo_clave == "Campo único" and motor in ("numerica", "fecha")
+            if explorar_umbral and not cruce_por_tolerancia:
+                valores_cruzados = (etiquetas_filas(new_df, seleccion) if tipo_clave == "Clave compuesta"
+                                    else new_df[campo_clave])
+                explorador = ExploradorUmbral(coincidencias, valores_cruzados, umbral_pasada)
+            else:
+                explorador = None
+            st.session_state["resultado_cruce"] = {
+                "archivos": (uploaded_file_1.name, uploaded_file_2.name, campo_clave),
+                "coincidencias": coincidencias,
+                "registros_cruzados": registros_cruzados,
+                "detalles": detalles,
+                "umbral": None if cruce_por_tolerancia else umbral_pasada,
+                "explorador": explorador,
+                "filas_nuevo": len(new_df),
+            }
+        
+        resultado_cruce = st.session_state.get("resultado_cruce")
+        if resultado_cruce and resultado_cruce["archivos"] == (uploaded_file_1.name, uploaded_file_2.name, campo_clave):
+            explorador = resultado_cruce["explorador"]
+            detalles = list(resultado_cruce["detalles"])
+            if explorador is not None and umbral >= explorador.umbral_minimo:
+                # Se filtra la pasada ya puntuada: no se vuelve a ejecutar el cruce
+                coincidencias = explorador.filtrar(umbral)
+                registros_cruzados = explorador.registros(umbral)
+                detalles.append(f"Umbral aplicado: {umbral} (conteos por etapa calculados con umbral {explorador.umbral_minimo})")
+            else:
+                coincidencias = resultado_cruce["coincidencias"]
+                registros_cruzados = resultado_cruce["registros_cruzados"]
+                if resultado_cruce["umbral"] is not None and umbral != resultado_cruce["umbral"]:
+                    st.info(f"ℹ️ Los resultados corresponden al umbral {resultado_cruce['umbral']}. "
+                            "Vuelve a realizar el cruce o activa el explorador de umbral para ver otro umbral.")
+            
+            # Guardar coincidencias en sesión
+            st.session_state["coincidencias"] = coincidencias
+            
+            detalles_html = "".join(f"<p>{detalle}</p>" for detalle in detalles)
             st.markdown(f"""
             <div class='success-box'>
                 <h3>✅ Cruce completado</h3>
-                <p>Se encontraron {len(coincidencias):,} coincidencias de {len(new_df):,} registros ({len(coincidencias)/len(new_df)*100:.1f}%).</p>
+                <p>Se encontraron coincidencias para {registros_cruzados:,} de {resultado_cruce['filas_nuevo']:,} registros ({registros_cruzados/max(resultado_cruce['filas_nuevo'], 1)*100:.1f}%).</p>
+                {detalles_html}
             </div>
             """, unsafe_allow_html=True)
             
+            if explorador is not None:
+                st.markdown("<h3 class='section-header'>🎚️ Registros cruzados según el umbral</h3>", unsafe_allow_html=True)
+                st.line_chart(explorador.curva().set_index("Umbral")[["Registros cruzados"]])
+            
             # Mostrar coincidencias en una tabla 
             st.markdown("<h3 class='section-header'>🔍 Resultados del cruce</h3>", unsafe_allow_html=True)
             
             # Crear un dataframe con los resultados
-            result_df = pd.DataFrame(coincidencias, columns=["Valor Nuevo", "Valor Base"])
+            result_df = pd.DataFrame(coincidencias, columns=["Valor Nuevo", "Valor Base", "Score"])
             st.dataframe(result_df, use_container_width=True, hide_index=False)
+            # Se registra una sola vez por cruce (con el umbral del cruce), no en cada rerun
+            if not resultado_cruce.get("registrado"):
+                registrar_dataset("Resultados del cruce", result_df)
+                resultado_cruce["registrado"] = True
             
             # Botón para descargar resultados
             col1, col2 = st.columns([1, 3])
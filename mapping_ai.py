@@ -2,7 +2,8 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from fuzzywuzzy import fuzz
-from utils import read_flexible_file
+from utils import MUESTRA_FILAS, filas_totales, similarity_matrix
+from almacen_datasets import elegir_datos
 
 def suggest_mapping(df1, df2, threshold=80):
     """
@@ -25,38 +26,35 @@ def suggest_mapping(df1, df2, threshold=80):
     df1_sample = df1.head(sample_rows)
     df2_sample = df2.head(sample_rows)
     
+    # Similitud por nombre de columna (peso: 0.5), todas las parejas en una sola matriz
+    nombre_scores = similarity_matrix(df1.columns, df2.columns) * 0.5
+    
+    # Similitud por contenido (peso: 0.5): promedio de los scores fila a fila de
+    # las primeras 10 filas, calculando una matriz columnas x columnas por fila
+    n_filas = min(10, sample_rows)
+    contenido_scores = np.zeros((len(df1.columns), len(df2.columns)))
+    if n_filas > 0:
+        values1 = df1_sample.head(n_filas).astype(str).values
+        values2 = df2_sample.head(n_filas).astype(str).values
+        for i in range(n_filas):
+            contenido_scores += similarity_matrix(values1[i], values2[i])
+        contenido_scores = (contenido_scores / n_filas) * 0.5
+        # Solo comparar si ambas columnas tienen contenido
+        con_datos1 = ~df1_sample.isna().all().values
+        con_datos2 = ~df2_sample.isna().all().values
+        contenido_scores *= np.outer(con_datos1, con_datos2)
+    
+    # Score total
+    scores = nombre_scores + contenido_scores
+    
     # Para cada columna en df1, encontrar la mejor coincidencia en df2
-    for col1 in df1.columns:
-        mejor_score = 0
-        mejor_col2 = None
-        
-        for col2 in df2.columns:
-            # Similitud por nombre de columna (peso: 0.5)
-            nombre_score = fuzz.token_sort_ratio(str(col1), str(col2)) * 0.5
-            
-            # Similitud por contenido (peso: 0.5)
-            contenido_score = 0
-            # Solo comparar si ambas columnas tienen contenido
-            if not (df1_sample[col1].isna().all() or df2_sample[col2].isna().all()):
-                # Convertir a string para comparación
-                values1 = df1_sample[col1].astype(str).tolist()
-                values2 = df2_sample[col2].astype(str).tolist()
-                # Calcular similitud promedio entre valores
-                similitudes = []
-                for i in range(min(10, len(values1), len(values2))):
-                    similitudes.append(fuzz.token_sort_ratio(values1[i], values2[i]))
-                if similitudes:
-                    contenido_score = (sum(similitudes) / len(similitudes)) * 0.5
-            
-            # Score total
-            score_total = nombre_score + contenido_score
-            
-            if score_total > mejor_score and score_total >= threshold:
-                mejor_score = score_total
-                mejor_col2 = col2
-        
-        if mejor_col2:
-            mapeo[col1] = {"columna": mejor_col2, "score": mejor_score}
+    for i, col1 in enumerate(df1.columns):
+        if len(df2.columns) == 0:
+            break
+        j = int(scores[i].argmax())
+        mejor_score = float(scores[i, j])
+        if mejor_score > 0 and mejor_score >= threshold:
+            mapeo[col1] = {"columna": df2.columns[j], "score": mejor_score}
     
     return mapeo
 
@@ -66,23 +64,22 @@ def run_mapping_ai():
     # Cargar archivos
     col1, col2 = st.columns(2)
     
+    # Las sugerencias solo usan los nombres y las primeras filas: alcanza con una muestra
     with col1:
         st.subheader("Primer archivo")
-        uploaded_file_1 = st.file_uploader("📁 Subí el primer archivo", type=["csv", "xls", "xlsx"])
-        if uploaded_file_1:
-            df1 = read_flexible_file(uploaded_file_1)
-            st.write(f"Columnas: {len(df1.columns)} - Filas: {len(df1)}")
+        nombre_1, df1 = elegir_datos("📁 Subí el primer archivo", key="mapeo_1", filas=MUESTRA_FILAS)
+        if df1 is not None:
+            st.write(f"Columnas: {len(df1.columns)} - Filas: {filas_totales(df1)}")
             st.dataframe(df1.head())
     
     with col2:
         st.subheader("Segundo archivo")
-        uploaded_file_2 = st.file_uploader("📁 Subí el segundo archivo", type=["csv", "xls", "xlsx"])
-        if uploaded_file_2:
-            df2 = read_flexible_file(uploaded_file_2)
-            st.write(f"Columnas: {len(df2.columns)} - Filas: {len(df2)}")
+        nombre_2, df2 = elegir_datos("📁 Subí el segundo archivo", key="mapeo_2", filas=MUESTRA_FILAS)
+        if df2 is not None:
+            st.write(f"Columnas: {len(df2.columns)} - Filas: {filas_totales(df2)}")
             st.dataframe(df2.head())
     
-    if uploaded_file_1 and uploaded_file_2:
+    if df1 is not None and df2 is not None:
         st.subheader("Configuración de mapeo")
         threshold = st.slider("Umbral de similitud", 50, 100, 80)
         
@@ -0,0 +1,969 @@
+"""
+Motor de cruce de datos para el Cruce Inteligente.
+
+En lugar de comparar cada fila del archivo NUEVO contra todas las filas del
+archivo BASE, construye un índice de bloques (bigramas de caracteres) sobre las
+claves del BASE y solo puntúa los candidatos que pueden superar el umbral.
+El filtrado es exacto: respeta la misma semántica de `token_sort_ratio >= umbral`
+que `utils.are_similar`.
+
+Antes del fuzzy matching, `cruzar` resuelve con un único `merge` las coincidencias
+exactas y las exactas tras normalizar (mayúsculas, acentos y espacios), de modo
+que al motor difuso solo llegan las filas que quedan sin emparejar. Esas filas se
+procesan en fragmentos, opcionalmente repartidos en varios procesos, y para cada
+una se buscan las `k` mejores claves del BASE con su score.
+
+El índice de un BASE se puede guardar en `cache/` asociado al hash del contenido
+del archivo, de modo que los cruces siguientes contra el mismo BASE no vuelven a
+construirlo. Los índices y los resultados guardados (ver `guardar_resultados`)
+sin usar en DIAS_CACHE_CRUCE días se borran, igual que los usados hace más tiempo
+si el total supera BYTES_MAXIMOS_CACHE_CRUCE.
+
+`cruzar_compuesto` cruza por varias columnas a la vez: las columnas exactas forman
+los bloques y las difusas o numéricas solo se puntúan dentro de cada bloque.
+"""
+
+import hashlib
+import heapq
+import math
+import multiprocessing
+import os
+import pickle
+from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from fuzzywuzzy import utils as fuzz_utils
+from rapidfuzz import fuzz as rf_fuzz
+from rapidfuzz import process as rf_process
+
+from utils import limpiar_cache, similarity_matrix
+
+# Tamaño de los n-gramas usados para los bloques
+TAMANO_NGRAMA = 2
+
+# Cantidad de valores del NUEVO que se puntúan juntos en una sola matriz
+TAMANO_LOTE = 128
+
+# Si las listas de bigramas a recorrer superan esta fracción del índice, se usa
+# directamente la ventana de longitud (recorrerlas costaría más que puntuarlas)
+FRACCION_MAXIMA_LISTAS = 0.25
+
+# Candidatos que se puntúan juntos antes de volver a comprobar la poda por score
+TAMANO_TRAMO = 256
+
+# Filas del NUEVO por fragmento: unidad de trabajo de cada proceso y de progreso
+TAMANO_FRAGMENTO = 2048
+
+# Máximo de celdas de cada matriz de scores de la clave compuesta
+CELDAS_MAXIMAS = 4_000_000
+
+# Tipos de columna admitidos en una clave compuesta
+TIPOS_COLUMNA = ("exacta", "difusa", "numerica")
+
+# Directorio donde se guardan los índices del BASE entre sesiones
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# Versión del formato del índice guardado; cambiarla invalida los índices anteriores
+VERSION_INDICE = 1
+
+# Límites de lo que el cruce guarda en `cache/` (ver `limpiar_cache_cruce`)
+DIAS_CACHE_CRUCE = 7
+BYTES_MAXIMOS_CACHE_CRUCE = 2 * 1024 ** 3
+
+# Índice del BASE disponible en cada proceso de trabajo (ver _inicializar_worker)
+_INDICE_WORKER: Optional["IndiceBloques"] = None
+
+
+def normalizar_clave(valor: Any) -> str:
+    """
+    Normaliza un valor igual que `fuzz.token_sort_ratio`: minúsculas, sin
+    caracteres especiales y con los tokens ordenados alfabéticamente.
+
+    Args:
+        valor: Valor a normalizar (se convierte a string)
+
+    Returns:
+        str: Clave normalizada
+    """
+    procesado = fuzz_utils.full_process(str(valor), force_ascii=True)
+    return " ".join(sorted(procesado.split()))
+
+
+def _ngramas(clave: str) -> List[str]:
+    """Devuelve los n-gramas de caracteres de una clave (con repeticiones)."""
+    return [clave[i:i + TAMANO_NGRAMA] for i in range(len(clave) - TAMANO_NGRAMA + 1)]
+
+
+class IndiceBloques:
+    """
+    Índice de bloques sobre las claves del archivo BASE.
+
+    Las claves se deduplican conservando la primera fila en la que aparecen, de
+    modo que el identificador de cada clave respeta el orden original del BASE.
+    Incluye también la tabla de claves exactas para el hash join, así que un índice
+    ya construido basta para cruzar sin volver a leer el BASE.
+    """
+
+    def __init__(self, valores: Iterable[Any]):
+        """
+        Construye el índice a partir de los valores del campo clave del BASE.
+
+        Args:
+            valores: Valores del campo clave en el orden del archivo BASE
+        """
+        valores = list(valores)
+        self.claves: List[str] = []
+        self.valores: List[Any] = []
+        self.posiciones: Dict[str, int] = {}
+        filas = []
+
+        for fila, valor in enumerate(valores):
+            clave = normalizar_clave(valor)
+            if clave not in self.posiciones:
+                self.posiciones[clave] = len(self.claves)
+                self.claves.append(clave)
+                self.valores.append(valor)
+                filas.append(fila)
+
+        # Fila del BASE en la que aparece cada clave por primera vez
+        self.filas = np.array(filas, dtype=np.int64)
+        self.tabla_exacta = tabla_exacta(pd.Series(valores, dtype=object))
+
+        self._claves_array = np.array(self.claves, dtype=object)
+        self.longitudes = np.array([len(c) for c in self.claves], dtype=np.int64)
+        # Orden por longitud para resolver ventanas de longitud con searchsorted
+        self._orden_longitud = np.argsort(self.longitudes, kind="stable")
+        self._longitudes_ordenadas = self.longitudes[self._orden_longitud]
+
+        postings = defaultdict(list)
+        for id_clave, clave in enumerate(self.claves):
+            for ngrama in set(_ngramas(clave)):
+                postings[ngrama].append(id_clave)
+        self.postings = {g: np.array(ids, dtype=np.int64) for g, ids in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.claves)
+
+    def _ventana_longitud(self, longitud: int, ratio_minimo: float) -> Tuple[int, int]:
+        """Rango de longitudes de clave que pueden alcanzar el ratio mínimo."""
+        minima = math.ceil(longitud * ratio_minimo / (2 - ratio_minimo))
+        maxima = math.floor(longitud * (2 - ratio_minimo) / ratio_minimo)
+        return minima, maxima
+
+    def _marcar_candidatos(self, clave: str, umbral: int, mascara: np.ndarray):
+        """
+        Marca en `mascara` las claves que pueden superar el umbral con `clave`.
+
+        Combina un filtro de longitud con un filtro de prefijo sobre bigramas:
+        una clave con distancia de edición `d` comparte al menos
+        `len - 1 - 2*d` bigramas con la consulta, así que basta con buscar en
+        las listas de los bigramas menos frecuentes de la consulta. Si esas listas
+        cubren buena parte del índice, recorrerlas cuesta más que puntuar toda la
+        ventana de longitud, y se marca la ventana completa.
+        """
+        if not clave:
+            # token_sort_ratio solo devuelve > 0 para una cadena vacía si la otra también lo es
+            exacta = self.posiciones.get(clave)
+            if exacta is not None:
+                mascara[exacta] = True
+            return
+
+        # El score se redondea, así que un ratio de (umbral - 0.5) ya alcanza el umbral
+        ratio_minimo = max(umbral - 0.5, 0.5) / 100
+        longitud = len(clave)
+        minima, maxima = self._ventana_longitud(longitud, ratio_minimo)
+
+        distancia_maxima = math.floor((longitud + maxima) * (1 - ratio_minimo))
+        ngramas = _ngramas(clave)
+        compartidos_minimos = len(ngramas) - TAMANO_NGRAMA * distancia_maxima
+
+        listas = []
+        if compartidos_minimos > 0:
+            # Prefijo de los bigramas más raros: al menos uno debe estar en el candidato
+            ngramas.sort(key=lambda g: len(self.postings.get(g, ())))
+            prefijo = set(ngramas[:len(ngramas) - compartidos_minimos + 1])
+            listas = [self.postings[g] for g in prefijo if g in self.postings]
+
+        if compartidos_minimos <= 0 or sum(len(l) for l in listas) > len(self) * FRACCION_MAXIMA_LISTAS:
+            # Clave corta o bigramas muy frecuentes: solo filtro de longitud
+            inicio = np.searchsorted(self._longitudes_ordenadas, minima, side="left")
+            fin = np.searchsorted(self._longitudes_ordenadas, maxima, side="right")
+            mascara[self._orden_longitud[inicio:fin]] = True
+            return
+
+        for lista in listas:
+            mascara[lista] = True
+
+    def candidatos(self, clave: str, umbral: int = 85) -> np.ndarray:
+        """
+        Obtiene los identificadores de las claves que pueden superar el umbral.
+
+        Args:
+            clave: Clave normalizada a buscar
+            umbral: Umbral de similitud (0-100)
+
+        Returns:
+            np.ndarray: Identificadores de clave candidatos, en orden ascendente
+        """
+        mascara = np.zeros(len(self), dtype=bool)
+        self._marcar_candidatos(clave, umbral, mascara)
+        return np.flatnonzero(mascara)
+
+    def buscar_lote(self, valores: List[Any], umbral: int = 85) -> List[Optional[int]]:
+        """
+        Busca, para cada valor, la primera clave del BASE (en orden de filas) similar.
+
+        Los candidatos de todo el lote se puntúan en una única matriz nativa con
+        `similarity_matrix`. Como el filtro de candidatos no descarta ninguna clave
+        válida, la primera columna que supera el umbral es la primera coincidencia.
+
+        Args:
+            valores: Valores del archivo NUEVO
+            umbral: Umbral de similitud (0-100)
+
+        Returns:
+            List[Optional[int]]: Identificador de la clave encontrada (o None) por valor
+        """
+        claves = [normalizar_clave(v) for v in valores]
+        mascara = np.zeros(len(self), dtype=bool)
+        for clave in claves:
+            self._marcar_candidatos(clave, umbral, mascara)
+        ids = np.flatnonzero(mascara)
+        if len(ids) == 0:
+            return [None] * len(claves)
+
+        # Mismo redondeo que fuzzywuzzy: un ratio de (umbral - 0.5) ya cuenta como umbral
+        scores = similarity_matrix(claves, self._claves_array[ids].tolist(),
+                                   scorer=rf_fuzz.ratio, threshold=umbral - 0.5)
+        aciertos = np.rint(scores) >= umbral
+        primeras = aciertos.argmax(axis=1)
+        return [int(ids[col]) if aciertos[fila, col] else None for fila, col in enumerate(primeras)]
+
+
+    def buscar(self, valores: Iterable[Any], umbral: int = 85) -> List[Optional[int]]:
+        """
+        Busca la primera clave similar para cada valor, procesando por lotes.
+
+        Args:
+            valores: Valores del archivo NUEVO
+            umbral: Umbral de similitud (0-100)
+
+        Returns:
+            List[Optional[int]]: Identificador de la clave encontrada (o None) por valor
+        """
+        valores = list(valores)
+        resultado = []
+        for inicio in range(0, len(valores), TAMANO_LOTE):
+            resultado.extend(self.buscar_lote(valores[inicio:inicio + TAMANO_LOTE], umbral))
+        return resultado
+
+    def buscar_mejores(self, valor: Any, umbral: int = 85, k: int = 1) -> List[Tuple[int, int]]:
+        """
+        Busca las `k` claves del BASE más similares al valor.
+
+        Los candidatos se recorren de mayor a menor cota de score (la cota depende
+        solo de las longitudes) y se mantienen los `k` mejores en un heap acotado.
+        El k-ésimo mejor score se usa como corte de rapidfuzz para los tramos
+        siguientes, y la búsqueda termina cuando ningún candidato restante puede
+        superarlo.
+
+        Args:
+            valor: Valor del archivo NUEVO
+            umbral: Umbral de similitud (0-100)
+            k: Cantidad máxima de coincidencias a devolver
+
+        Returns:
+            List[Tuple[int, int]]: Pares (identificador de clave, score) ordenados de
+            mejor a peor; ante empates se prioriza la primera fila del BASE
+        """
+        clave = normalizar_clave(valor)
+        ids = self.candidatos(clave, umbral)
+        if len(ids) == 0:
+            return []
+
+        # Cota superior del ratio según las longitudes: 2 * min / (la + lb)
+        longitud = len(clave)
+        longitudes = self.longitudes[ids]
+        suma = np.maximum(longitud + longitudes, 1)
+        cotas = np.where(longitudes == longitud, 100.0, 200.0 * np.minimum(longitud, longitudes) / suma)
+        orden = np.argsort(-cotas, kind="stable")
+        ids, cotas = ids[orden], cotas[orden]
+
+        # Heap de (score, -id): el primero es el peor de los k mejores
+        mejores: List[Tuple[float, int]] = []
+        corte = max(umbral - 0.5, 0)
+        for inicio in range(0, len(ids), TAMANO_TRAMO):
+            if len(mejores) == k and cotas[inicio] < mejores[0][0]:
+                break
+            tramo = ids[inicio:inicio + TAMANO_TRAMO]
+            resultados = rf_process.extract(
+                clave, self._claves_array[tramo].tolist(), scorer=rf_fuzz.ratio,
+                processor=None, score_cutoff=corte, limit=k
+            )
+            for _, score, posicion in resultados:
+                entrada = (score, -int(tramo[posicion]))
+                if len(mejores) < k:
+                    heapq.heappush(mejores, entrada)
+                elif entrada > mejores[0]:
+                    heapq.heapreplace(mejores, entrada)
+            if len(mejores) == k:
+                corte = max(corte, mejores[0][0])
+
+        # Mismo redondeo que fuzzywuzzy
+        return [(-id_neg, int(round(score))) for score, id_neg in sorted(mejores, reverse=True)
+                if round(score) >= umbral]
+
+    def buscar_mejores_lote(self, valores: Iterable[Any], umbral: int = 85,
+                            k: int = 1) -> List[List[Tuple[int, int]]]:
+        """
+        Aplica `buscar_mejores` a cada valor.
+
+        Args:
+            valores: Valores del archivo NUEVO
+            umbral: Umbral de similitud (0-100)
+            k: Cantidad máxima de coincidencias por valor
+
+        Returns:
+            List[List[Tuple[int, int]]]: Pares (identificador de clave, score) por valor
+        """
+        return [self.buscar_mejores(valor, umbral, k) for valor in valores]
+
+
+def cruzar_por_bloques(valores_nuevos: Iterable[Any], valores_base: Iterable[Any],
+                       umbral: int = 85) -> List[Tuple[Any, Any]]:
+    """
+    Realiza el cruce difuso entre los valores del archivo NUEVO y los del BASE.
+
+    Equivale a recorrer el BASE fila por fila con `are_similar` y quedarse con la
+    primera coincidencia, pero solo puntúa los candidatos del índice de bloques,
+    por lotes y en código nativo.
+
+    Args:
+        valores_nuevos: Valores del campo clave del archivo NUEVO
+        valores_base: Valores del campo clave del archivo BASE
+        umbral: Umbral de similitud (0-100)
+
+    Returns:
+        List[Tuple[Any, Any]]: Lista de coincidencias (valor nuevo, valor base)
+    """
+    indice = IndiceBloques(valores_base)
+    valores_nuevos = list(valores_nuevos)
+    return [
+        (valor, indice.valores[id_clave])
+        for valor, id_clave in zip(valores_nuevos, indice.buscar(valores_nuevos, umbral))
+        if id_clave is not None
+    ]
+
+
+def normalizar_exacta(valores: pd.Series) -> pd.Series:
+    """
+    Normaliza valores para el cruce exacto: sin acentos, en minúsculas y con los
+    espacios colapsados. Se aplica de forma vectorizada sobre toda la columna.
+
+    Args:
+        valores: Serie con los valores del campo clave
+
+    Returns:
+        pd.Series: Serie de strings normalizados
+    """
+    return (
+        valores.map(str)
+        .str.normalize("NFKD")
+        .str.encode("ascii", errors="ignore")
+        .str.decode("ascii")
+        .str.casefold()
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def tabla_exacta(valores_base: pd.Series) -> pd.DataFrame:
+    """
+    Construye la tabla del BASE para el hash join: una fila por clave normalizada.
+
+    Args:
+        valores_base: Valores del campo clave del archivo BASE
+
+    Returns:
+        pd.DataFrame: Columnas `valor_base` y `clave`; ante claves repetidas se
+        conserva la primera fila, como en el cruce difuso
+    """
+    return pd.DataFrame({
+        "valor_base": valores_base.reset_index(drop=True),
+        "clave": normalizar_exacta(valores_base).reset_index(drop=True),
+    }).drop_duplicates("clave", keep="first")
+
+
+def cruzar_exactas(valores_nuevos: pd.Series, valores_base: Optional[pd.Series] = None,
+                   tabla_base: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Resuelve las coincidencias exactas y normalizadas con un único hash join.
+
+    Args:
+        valores_nuevos: Valores del campo clave del archivo NUEVO
+        valores_base: Valores del campo clave del archivo BASE
+        tabla_base: Tabla ya construida con `tabla_exacta` (reemplaza a valores_base)
+
+    Returns:
+        pd.DataFrame: Una fila por valor del NUEVO con las columnas `valor_nuevo`,
+        `valor_base` (NaN si no hubo coincidencia) y `etapa`
+    """
+    nuevos = pd.DataFrame({
+        "valor_nuevo": valores_nuevos.reset_index(drop=True),
+        "clave": normalizar_exacta(valores_nuevos).reset_index(drop=True),
+    })
+    base = tabla_base if tabla_base is not None else tabla_exacta(valores_base)
+
+    resultado = nuevos.merge(base, on="clave", how="left", sort=False)
+    resultado["valor_base"] = resultado["valor_base"].astype(object)
+    encontrados = resultado["clave"].isin(base["clave"])
+    identicos = resultado["valor_nuevo"].map(str) == resultado["valor_base"].map(str)
+    resultado["etapa"] = np.where(encontrados, np.where(identicos, "exacta", "normalizada"), None)
+    return resultado.drop(columns="clave")
+
+
+def ruta_indice(hash_base: str, campo_clave: str) -> str:
+    """
+    Obtiene la ruta del índice guardado para un BASE y un campo clave.
+
+    Args:
+        hash_base: Huella del archivo BASE (ver `utils.huella_archivo`)
+        campo_clave: Campo clave del cruce
+
+    Returns:
+        str: Ruta absoluta al archivo del índice
+    """
+    hash_campo = hashlib.md5(str(campo_clave).encode()).hexdigest()[:8]
+    return os.path.join(CACHE_DIR, f"indice_v{VERSION_INDICE}_{hash_base}_{hash_campo}.pkl")
+
+
+def cargar_indice(hash_base: str, campo_clave: str) -> Optional[IndiceBloques]:
+    """
+    Carga el índice guardado para un BASE y un campo clave, si existe.
+
+    Args:
+        hash_base: Huella del archivo BASE (ver `utils.huella_archivo`)
+        campo_clave: Campo clave del cruce
+
+    Returns:
+        Optional[IndiceBloques]: Índice guardado o None si no existe o no se pudo leer
+    """
+    ruta = ruta_indice(hash_base, campo_clave)
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, "rb") as f:
+            indice = pickle.load(f)
+        # La fecha de modificación marca el último uso (ver `limpiar_cache_cruce`)
+        os.utime(ruta)
+        return indice
+    except Exception as e:
+        print(f"Error al leer el índice guardado: {str(e)}")
+        return None
+
+
+def guardar_indice(indice: IndiceBloques, hash_base: str, campo_clave: str) -> bool:
+    """
+    Guarda el índice en `cache/` para reutilizarlo en cruces posteriores.
+
+    Args:
+        indice: Índice a guardar
+        hash_base: Huella del archivo BASE (ver `utils.huella_archivo`)
+        campo_clave: Campo clave del cruce
+
+    Returns:
+        bool: True si se guardó correctamente, False en caso contrario
+    """
+    ruta = ruta_indice(hash_base, campo_clave)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Escribir en un archivo temporal y renombrar, para no dejar índices a medias
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            pickle.dump(indice, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+    except Exception as e:
+        print(f"Error al guardar el índice: {str(e)}")
+        return False
+    limpiar_cache_cruce()
+    return True
+
+
+def limpiar_cache_cruce(dias: float = DIAS_CACHE_CRUCE, bytes_maximos: int = BYTES_MAXIMOS_CACHE_CRUCE) -> int:
+    """
+    Borra los índices y resultados guardados sin usar en más de `dias` días y, si el resto
+    supera `bytes_maximos`, los usados hace más tiempo hasta quedar por debajo.
+
+    Returns:
+        int: Archivos borrados
+    """
+    return limpiar_cache(CACHE_DIR, ("indice_", "resultados_"), ".pkl", dias, bytes_maximos)
+
+
+def obtener_indice(hash_base: str, campo_clave: str,
+                   valores_base: Iterable[Any]) -> Tuple[IndiceBloques, bool]:
+    """
+    Devuelve el índice guardado del BASE o lo construye y lo guarda.
+
+    Args:
+        hash_base: Huella del archivo BASE (ver `utils.huella_archivo`)
+        campo_clave: Campo clave del cruce
+        valores_base: Valores del campo clave del BASE (solo se usan si hay que
+            construir el índice)
+
+    Returns:
+        Tuple[IndiceBloques, bool]: Índice y True si se reutilizó uno guardado
+    """
+    indice = cargar_indice(hash_base, campo_clave)
+    if indice is not None:
+        return indice, True
+    indice = IndiceBloques(valores_base)
+    guardar_indice(indice, hash_base, campo_clave)
+    return indice, False
+
+
+def _inicializar_worker(indice: Optional[IndiceBloques]):
+    """
+    Inicializa un proceso de trabajo. Con `fork` el índice ya se hereda del proceso
+    principal y llega None; en otro caso se recibe serializado una vez por proceso.
+    """
+    global _INDICE_WORKER
+    if indice is not None:
+        _INDICE_WORKER = indice
+
+
+def _buscar_en_worker(valores: List[Any], umbral: int, k: int) -> List[List[Tuple[int, int]]]:
+    """Busca un fragmento de valores en el índice del proceso de trabajo."""
+    return _INDICE_WORKER.buscar_mejores_lote(valores, umbral, k)
+
+
+@contextmanager
+def pool_cruce(indice: IndiceBloques, workers: int) -> Iterator[Optional[ProcessPoolExecutor]]:
+    """
+    Pool de procesos para la etapa difusa, con el índice del BASE cargado una vez por proceso.
+
+    Permite reutilizar los mismos procesos en varias llamadas a `cruzar` con el
+    mismo índice (por ejemplo, una por fragmento en el cruce en streaming).
+
+    Args:
+        indice: Índice de bloques del BASE
+        workers: Cantidad de procesos
+
+    Yields:
+        Optional[ProcessPoolExecutor]: Pool de procesos, o None si `workers` es 1
+    """
+    if workers <= 1:
+        yield None
+        return
+
+    global _INDICE_WORKER
+    contexto = multiprocessing.get_context()
+    heredado = contexto.get_start_method() == "fork"
+    if heredado:
+        _INDICE_WORKER = indice
+
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=contexto,
+        initializer=_inicializar_worker,
+        initargs=(None if heredado else indice,),
+    )
+    try:
+        yield executor
+    finally:
+        # Si el cruce se cancela, no esperar a los fragmentos pendientes
+        executor.shutdown(wait=False, cancel_futures=True)
+        if heredado:
+            _INDICE_WORKER = None
+
+
+def _buscar_fragmentos(indice: IndiceBloques, valores: List[Any], umbral: int, k: int, workers: int,
+                       ejecutor: Optional[ProcessPoolExecutor] = None
+                       ) -> Iterator[Tuple[int, List[List[Tuple[int, int]]]]]:
+    """
+    Busca los valores por fragmentos y devuelve cada resultado a medida que termina.
+
+    Args:
+        indice: Índice de bloques del BASE
+        valores: Valores del NUEVO a buscar
+        umbral: Umbral de similitud (0-100)
+        k: Cantidad máxima de coincidencias por valor
+        workers: Cantidad de procesos (1 para buscar en el proceso actual)
+        ejecutor: Pool ya creado con `pool_cruce` para el mismo índice; si no se
+            indica y `workers` es mayor que 1, se crea uno solo para esta búsqueda
+
+    Yields:
+        Tuple[int, List[List[Tuple[int, int]]]]: Posición inicial del fragmento y
+        los pares (identificador de clave, score) de cada valor
+    """
+    inicios = range(0, len(valores), TAMANO_FRAGMENTO)
+    if ejecutor is None and (workers <= 1 or len(valores) <= TAMANO_FRAGMENTO):
+        for inicio in inicios:
+            yield inicio, indice.buscar_mejores_lote(valores[inicio:inicio + TAMANO_FRAGMENTO], umbral, k)
+        return
+
+    if ejecutor is None:
+        with pool_cruce(indice, workers) as propio:
+            yield from _enviar_fragmentos(propio, valores, inicios, umbral, k)
+    else:
+        yield from _enviar_fragmentos(ejecutor, valores, inicios, umbral, k)
+
+
+def _enviar_fragmentos(ejecutor: ProcessPoolExecutor, valores: List[Any], inicios: range, umbral: int,
+                       k: int) -> Iterator[Tuple[int, List[List[Tuple[int, int]]]]]:
+    """Reparte los fragmentos en el pool y los devuelve a medida que terminan."""
+    futuros = {
+        ejecutor.submit(_buscar_en_worker, valores[inicio:inicio + TAMANO_FRAGMENTO], umbral, k): inicio
+        for inicio in inicios
+    }
+    try:
+        for futuro in as_completed(futuros):
+            yield futuros[futuro], futuro.result()
+    finally:
+        # Si el cruce se cancela, descartar los fragmentos que no empezaron
+        for futuro in futuros:
+            futuro.cancel()
+
+
+def hash_valores(valores: pd.Series) -> np.ndarray:
+    """
+    Calcula un hash por fila del campo clave, para reconocer filas ya cruzadas.
+
+    Args:
+        valores: Valores del campo clave
+
+    Returns:
+        np.ndarray: Hash (uint64) de cada valor, en el mismo orden
+    """
+    return pd.util.hash_pandas_object(valores.map(str), index=False).to_numpy()
+
+
+def ruta_resultados(hash_base: str, campo_clave: str, umbral: int, k: int) -> str:
+    """
+    Obtiene la ruta de los resultados guardados de cruces contra un BASE.
+
+    Args:
+        hash_base: Huella del archivo BASE (ver `utils.huella_archivo`)
+        campo_clave: Campo clave del cruce
+        umbral: Umbral de similitud usado en el cruce
+        k: Cantidad máxima de coincidencias por valor usada en el cruce
+
+    Returns:
+        str: Ruta absoluta al archivo de resultados
+    """
+    hash_parametros = hashlib.md5(f"{campo_clave}|{umbral}|{k}".encode()).hexdigest()[:8]
+    return os.path.join(CACHE_DIR, f"resultados_v{VERSION_INDICE}_{hash_base}_{hash_parametros}.pkl")
+
+
+def cargar_resultados(hash_base: str, campo_clave: str, umbral: int, k: int) -> Dict[int, Tuple[Optional[str], List[Tuple[Any, int]]]]:
+    """
+    Carga los resultados por fila de cruces anteriores contra el mismo BASE.
+
+    Args:
+        hash_base: Huella del archivo BASE (ver `utils.huella_archivo`)
+        campo_clave: Campo clave del cruce
+        umbral: Umbral de similitud del cruce
+        k: Cantidad máxima de coincidencias por valor
+
+    Returns:
+        Dict: Resultados por hash de fila (ver `cruzar`); vacío si no hay guardados
+    """
+    ruta = ruta_resultados(hash_base, campo_clave, umbral, k)
+    if not os.path.exists(ruta):
+        return {}
+    try:
+        with open(ruta, "rb") as f:
+            resultados = pickle.load(f)
+        # La fecha de modificación marca el último uso (ver `limpiar_cache_cruce`)
+        os.utime(ruta)
+        return resultados
+    except Exception as e:
+        print(f"Error al leer los resultados guardados: {str(e)}")
+        return {}
+
+
+def guardar_resultados(resultados: Dict[int, Tuple[Optional[str], List[Tuple[Any, int]]]],
+                       hash_base: str, campo_clave: str, umbral: int, k: int) -> bool:
+    """
+    Guarda los resultados por fila para reutilizarlos en el próximo cruce.
+
+    Args:
+        resultados: Resultados por hash de fila (ver `cruzar`)
+        hash_base: Huella del archivo BASE (ver `utils.huella_archivo`)
+        campo_clave: Campo clave del cruce
+        umbral: Umbral de similitud del cruce
+        k: Cantidad máxima de coincidencias por valor
+
+    Returns:
+        bool: True si se guardó correctamente, False en caso contrario
+    """
+    ruta = ruta_resultados(hash_base, campo_clave, umbral, k)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            pickle.dump(resultados, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporal, ruta)
+    except Exception as e:
+        print(f"Error al guardar los resultados: {str(e)}")
+        return False
+    limpiar_cache_cruce()
+    return True
+
+
+def cruzar(valores_nuevos: Iterable[Any], valores_base: Union[IndiceBloques, Iterable[Any]], umbral: int = 85,
+           k: int = 1, workers: int = 1,
+           al_progresar: Optional[Callable[[int, int, List[Tuple[Any, Any, int]]], Optional[bool]]] = None,
+           resultados_previos: Optional[Dict[int, Tuple[Optional[str], List[Tuple[Any, int]]]]] = None,
+           ejecutor: Optional[ProcessPoolExecutor] = None
+           ) -> Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]:
+    """
+    Cruza los valores del NUEVO contra el BASE en dos etapas: primero un hash join
+    exacto/normalizado y después el motor difuso para las filas restantes.
+
+    Las filas resueltas por el hash join tienen una única coincidencia con score
+    100; el resto recibe hasta `k` coincidencias, de mejor a peor.
+
+    Con `resultados_previos` el cruce es incremental: las filas cuyo campo clave ya
+    se cruzó (mismo hash) reutilizan su resultado y solo se calculan las nuevas o
+    modificadas. El diccionario se actualiza con los resultados calculados.
+
+    Args:
+        valores_nuevos: Valores del campo clave del archivo NUEVO
+        valores_base: Valores del campo clave del archivo BASE, o su índice ya
+            construido (por ejemplo, con `obtener_indice`)
+        umbral: Umbral de similitud (0-100)
+        k: Cantidad máxima de coincidencias por valor del NUEVO
+        workers: Procesos para la etapa difusa (1 para no usar procesos)
+        al_progresar: Función llamada tras cada etapa o fragmento con las filas
+            procesadas, el total y las coincidencias parciales. Si devuelve False,
+            el cruce se detiene
+        resultados_previos: Resultados por hash de fila, {hash: (etapa, [(valor
+            base, score), ...])}, de cruces anteriores con el mismo BASE y parámetros
+        ejecutor: Pool de procesos creado con `pool_cruce` para el mismo índice, para
+            reutilizarlo entre llamadas en lugar de crear uno en cada una
+
+    Returns:
+        Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]: Coincidencias (valor
+        nuevo, valor base, score) en el orden del NUEVO y cantidad de filas
+        emparejadas por etapa, junto con las filas `reutilizadas`, `recalculadas`
+        y las que quedaron `pendientes` si el cruce se detuvo
+    """
+    valores_nuevos = pd.Series(list(valores_nuevos), dtype=object)
+    total = len(valores_nuevos)
+    etapa_por_fila = pd.Series([None] * total, dtype=object)
+    por_fila: Dict[int, List[Tuple[Any, Any, int]]] = {}
+
+    # Filas ya cruzadas en una ejecución anterior
+    a_calcular = np.arange(total)
+    hashes = None
+    if resultados_previos is not None:
+        hashes = hash_valores(valores_nuevos)
+        conocidas = np.fromiter((h in resultados_previos for h in hashes), dtype=bool, count=total)
+        for fila in np.flatnonzero(conocidas):
+            etapa, encontrados = resultados_previos[hashes[fila]]
+            etapa_por_fila[fila] = etapa
+            if encontrados:
+                por_fila[fila] = [(valores_nuevos[fila], base, score) for base, score in encontrados]
+        a_calcular = np.flatnonzero(~conocidas)
+    reutilizadas = total - len(a_calcular)
+
+    a_cruzar = valores_nuevos.iloc[a_calcular]
+    if isinstance(valores_base, IndiceBloques):
+        indice = valores_base
+        resultado = cruzar_exactas(a_cruzar, tabla_base=indice.tabla_exacta)
+    else:
+        indice = None
+        valores_base = pd.Series(list(valores_base), dtype=object)
+        resultado = cruzar_exactas(a_cruzar, valores_base)
+    resultado.index = a_calcular
+
+    exactas = resultado.index[resultado["etapa"].notna()]
+    etapa_por_fila[exactas] = resultado.loc[exactas, "etapa"]
+    for fila in exactas:
+        por_fila[fila] = [(resultado.at[fila, "valor_nuevo"], resultado.at[fila, "valor_base"], 100)]
+    pendientes = resultado.index[resultado["etapa"].isna()]
+    procesadas = total - len(pendientes)
+    calculadas = list(exactas)
+    parciales = [c for fila in sorted(por_fila) for c in por_fila[fila]]
+    continuar = al_progresar is None or al_progresar(procesadas, total, parciales) is not False
+
+    if continuar and len(pendientes):
+        if indice is None:
+            indice = IndiceBloques(valores_base)
+        valores = resultado.loc[pendientes, "valor_nuevo"].tolist()
+        fragmentos = _buscar_fragmentos(indice, valores, umbral, k, workers, ejecutor)
+        try:
+            for inicio, encontrados in fragmentos:
+                filas = pendientes[inicio:inicio + len(encontrados)]
+                for fila, valor, mejores in zip(filas, valores[inicio:], encontrados):
+                    if mejores:
+                        etapa_por_fila[fila] = "difusa"
+                        por_fila[fila] = [(valor, indice.valores[id_clave], score) for id_clave, score in mejores]
+                        parciales.extend(por_fila[fila])
+                calculadas.extend(filas)
+                procesadas += len(encontrados)
+                if al_progresar is not None and al_progresar(procesadas, total, parciales) is False:
+                    break
+        finally:
+            fragmentos.close()
+
+    if resultados_previos is not None:
+        for fila in calculadas:
+            resultados_previos[hashes[fila]] = (
+                etapa_por_fila[fila], [(base, score) for _, base, score in por_fila.get(fila, [])]
+            )
+
+    coincidencias = [c for fila in sorted(por_fila) for c in por_fila[fila]]
+    etapas = {
+        etapa: int((etapa_por_fila == etapa).sum())
+        for etapa in ("exacta", "normalizada", "difusa")
+    }
+    etapas["reutilizadas"] = reutilizadas
+    etapas["recalculadas"] = procesadas - reutilizadas
+    etapas["pendientes"] = total - procesadas
+    return coincidencias, etapas
+
+
+def etiquetas_filas(df: pd.DataFrame, columnas: List[str]) -> List[str]:
+    """Une los valores de varias columnas en un texto por fila, para mostrar."""
+    return df[columnas].astype(str).agg(" | ".join, axis=1).tolist()
+
+
+def _bloques(df: pd.DataFrame, columnas: List[str]) -> Dict[str, np.ndarray]:
+    """Agrupa las posiciones de las filas según el valor normalizado de las columnas exactas."""
+    if not columnas:
+        return {"": np.arange(len(df))}
+    claves = normalizar_exacta(df[columnas[0]].reset_index(drop=True))
+    for columna in columnas[1:]:
+        claves = claves + "\x1f" + normalizar_exacta(df[columna].reset_index(drop=True))
+    return pd.Series(np.arange(len(df))).groupby(claves.to_numpy()).indices
+
+
+def cruzar_compuesto(new_df: pd.DataFrame, base_df: pd.DataFrame, columnas: List[Dict[str, Any]],
+                     umbral: int = 85, k: int = 1,
+                     al_progresar: Optional[Callable[[int, int, List[Tuple[Any, Any, int]]], Optional[bool]]] = None
+                     ) -> Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]:
+    """
+    Cruza dos DataFrames por una clave compuesta de varias columnas.
+
+    Cada columna se describe con un diccionario {"columna", "tipo", "peso",
+    "tolerancia"}. Las columnas `exacta` se usan como bloques: solo se comparan
+    filas con los mismos valores normalizados en todas ellas. Dentro de cada
+    bloque, las columnas `difusa` (token_sort_ratio) y `numerica` (100 si la
+    diferencia es menor o igual a la tolerancia, 0 si no) se combinan en un score
+    ponderado por sus pesos.
+
+    Args:
+        new_df: DataFrame del archivo NUEVO
+        base_df: DataFrame del archivo BASE
+        columnas: Descripción de las columnas de la clave compuesta
+        umbral: Umbral del score ponderado (0-100)
+        k: Cantidad máxima de coincidencias por fila del NUEVO
+        al_progresar: Función llamada tras cada bloque con las filas procesadas,
+            el total y las coincidencias parciales. Si devuelve False, el cruce se
+            detiene
+
+    Returns:
+        Tuple[List[Tuple[Any, Any, int]], Dict[str, int]]: Coincidencias (valores
+        nuevos, valores base, score), con los valores de la clave unidos por " | ",
+        y estadísticas: filas emparejadas (`compuesta`), `bloques` comparados,
+        `pares` puntuados y filas `pendientes` si el cruce se detuvo
+
+    Raises:
+        ValueError: Si un tipo de columna no está soportado, algún peso es
+            negativo o los pesos de las columnas puntuadas suman 0
+    """
+    for columna in columnas:
+        if columna["tipo"] not in TIPOS_COLUMNA:
+            raise ValueError(f"Tipo de columna no soportado: {columna['tipo']}")
+
+    exactas = [c["columna"] for c in columnas if c["tipo"] == "exacta"]
+    puntuadas = [c for c in columnas if c["tipo"] != "exacta"]
+    if any(c.get("peso", 1.0) < 0 for c in puntuadas):
+        raise ValueError("Los pesos de las columnas no pueden ser negativos")
+    peso_total = sum(c.get("peso", 1.0) for c in puntuadas)
+    if puntuadas and peso_total <= 0:
+        raise ValueError("La suma de los pesos de las columnas difusas y numéricas debe ser mayor que 0")
+    etiquetas_nuevo = etiquetas_filas(new_df, [c["columna"] for c in columnas])
+    etiquetas_base = etiquetas_filas(base_df, [c["columna"] for c in columnas])
+
+    # Preparar cada columna puntuada una sola vez
+    datos = []
+    for columna in puntuadas:
+        nombre = columna["columna"]
+        if columna["tipo"] == "difusa":
+            datos.append((
+                np.array([normalizar_clave(v) for v in new_df[nombre]], dtype=object),
+                np.array([normalizar_clave(v) for v in base_df[nombre]], dtype=object),
+            ))
+        else:
+            datos.append((
+                pd.to_numeric(new_df[nombre], errors="coerce").to_numpy(dtype=float),
+                pd.to_numeric(base_df[nombre], errors="coerce").to_numpy(dtype=float),
+            ))
+
+    def puntuar(filas_nuevo: np.ndarray, filas_base: np.ndarray) -> np.ndarray:
+        """Score ponderado de cada par de filas (nuevo x base) de un bloque."""
+        if not puntuadas:
+            return np.full((len(filas_nuevo), len(filas_base)), 100.0)
+        total = np.zeros((len(filas_nuevo), len(filas_base)))
+        for columna, (valores_nuevo, valores_base) in zip(puntuadas, datos):
+            peso = columna.get("peso", 1.0)
+            if columna["tipo"] == "difusa":
+                # Score mínimo que esta columna necesita aunque las demás den 100
+                corte = ((umbral - 0.5) * peso_total - (peso_total - peso) * 100) / peso if peso else 0
+                scores = similarity_matrix(valores_nuevo[filas_nuevo].tolist(), valores_base[filas_base].tolist(),
+                                           scorer=rf_fuzz.ratio, threshold=max(corte, 0))
+            else:
+                diferencias = np.abs(valores_nuevo[filas_nuevo][:, None] - valores_base[filas_base][None, :])
+                scores = np.where(diferencias <= columna.get("tolerancia", 0.0), 100.0, 0.0)
+            total += peso * scores
+        return total / peso_total
+
+    bloques_nuevo = _bloques(new_df, exactas)
+    bloques_base = _bloques(base_df, exactas)
+    total_filas = len(new_df)
+    procesadas = 0
+    bloques_comparados = 0
+    pares = 0
+    por_fila: Dict[int, List[Tuple[Any, Any, int]]] = {}
+    parciales: List[Tuple[Any, Any, int]] = []
+
+    for bloque, filas_nuevo in bloques_nuevo.items():
+        filas_base = bloques_base.get(bloque)
+        if filas_base is not None:
+            bloques_comparados += 1
+            tamano = max(1, min(TAMANO_LOTE, CELDAS_MAXIMAS // len(filas_base)))
+            for inicio in range(0, len(filas_nuevo), tamano):
+                lote = filas_nuevo[inicio:inicio + tamano]
+                scores = puntuar(lote, filas_base)
+                pares += scores.size
+                for i, fila in enumerate(lote):
+                    validos = np.flatnonzero(np.rint(scores[i]) >= umbral)
+                    if len(validos) == 0:
+                        continue
+                    # Orden estable: ante empates se prioriza la primera fila del BASE
+                    mejores = validos[np.argsort(-scores[i][validos], kind="stable")][:k]
+                    por_fila[fila] = [
+                        (etiquetas_nuevo[fila], etiquetas_base[filas_base[j]], int(round(scores[i][j])))
+                        for j in mejores
+                    ]
+                    parciales.extend(por_fila[fila])
+        procesadas += len(filas_nuevo)
+        if al_progresar is not None and al_progresar(procesadas, total_filas, parciales) is False:
+            break
+
+    coincidencias = [c for fila in sorted(por_fila) for c in por_fila[fila]]
+    estadisticas = {
+        "compuesta": len(por_fila),
+        "bloques": bloques_comparados,
+        "pares": pares,
+        "pendientes": total_filas - procesadas,
+    }
+    return coincidencias, estadisticas
+
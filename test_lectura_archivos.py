@@ -0,0 +1,71 @@
+"""
+Pruebas de la lectura de CSV de utils.py (encoding y motor de pyarrow).
+
+Ejecutar con: python -m pytest -q test_lectura_archivos.py
+"""
+import io
+
+import pandas as pd
+import pytest
+
+import utils
+
+
+def _archivo(contenido, nombre="datos.csv"):
+    """Archivo en memoria con nombre, como los de st.file_uploader."""
+    archivo = io.BytesIO(contenido)
+    archivo.name = nombre
+    return archivo
+
+
+CSV_CP1252 = ("nombre,ciudad\n" + "juan perez,Bogotá\nmaría lópez,Medellín\n" * 50).encode("cp1252")
+
+
+def test_read_csv_rapido_cp1252_devuelve_str():
+    df = utils._read_csv_rapido(_archivo(CSV_CP1252), ",", "cp1252")
+    for columna in df.columns:
+        assert pd.api.types.is_string_dtype(df[columna])
+        assert not df[columna].map(lambda v: isinstance(v, bytes)).any()
+    assert df["ciudad"].iloc[0] == "Bogotá"
+
+
+def test_read_csv_rapido_encoding_equivocado_no_devuelve_bytes():
+    # pyarrow devolvería bytes; la relectura con el motor de pandas falla explícitamente
+    with pytest.raises(UnicodeDecodeError):
+        utils._read_csv_rapido(_archivo(CSV_CP1252), ",", "utf-8")
+
+
+# Muestra ASCII (se detecta utf-8) y un byte cp1252 después de la muestra
+CSV_ACENTO_TARDIO = (("nombre;ciudad\n" + "juan perez;Bogota\n" * (utils.BYTES_MUESTRA_CSV // 18 + 100)
+                      + "maría lópez;Medellín\n").encode("cp1252"))
+
+
+@pytest.mark.parametrize("compactar", [False, True])
+def test_encoding_alternativo_despues_de_la_muestra(compactar):
+    archivo = _archivo(CSV_ACENTO_TARDIO, f"tardio_{compactar}.csv")
+    assert len(CSV_ACENTO_TARDIO) > utils.BYTES_MUESTRA_CSV
+    assert utils.detectar_formato_csv(archivo) == ("utf-8", ";")
+
+    df = utils.leer_archivo(archivo, compactar)
+    assert df["nombre"].astype(str).iloc[-1] == "maría lópez"
+    assert df["ciudad"].astype(str).iloc[-1] == "Medellín"
+    # El encoding que funcionó queda recordado para las relecturas
+    assert utils.detectar_formato_csv(archivo)[0] == "cp1252"
+
+
+def test_leer_columna_encoding_alternativo():
+    from cruce_streaming import leer_columna
+
+    archivo = _archivo(CSV_ACENTO_TARDIO, "tardio_columna.csv")
+    valores = leer_columna(archivo, "ciudad", "utf-8", ";", tamano_fragmento=1000)
+    assert valores.iloc[-1] == "Medellín"
+
+
+def test_buffers_con_mismo_nombre_y_tamano_no_comparten_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "CACHE_ARCHIVOS_DIR", str(tmp_path))
+    primero = _archivo(b"a,b\n1,2\n", "mismo.csv")
+    segundo = _archivo(b"a,b\n3,4\n", "mismo.csv")
+
+    assert utils.file_content_hash(primero) != utils.file_content_hash(segundo)
+    assert utils.read_flexible_file(primero).values.tolist() == [[1, 2]]
+    assert utils.read_flexible_file(segundo).values.tolist() == [[3, 4]]
@@ -0,0 +1,165 @@
+"""
+Pruebas de los motores del Cruce Inteligente contra una búsqueda exhaustiva.
+
+`cruzar` debe dar exactamente lo mismo que recorrer el BASE completo con
+`fuzz.token_sort_ratio` (como hacía el bucle original), así que los cambios en el
+índice de bloques o en la poda no pueden alterar los resultados sin que fallen
+estas pruebas. Los motores alternativos solo se comprueban en lo básico.
+
+Ejecutar con: python -m pytest -q test_motor_cruce.py
+"""
+import pandas as pd
+import pytest
+from fuzzywuzzy import fuzz
+
+from cruce_espanol import cruzar_espanol
+from cruce_lsh import cruzar_lsh
+from cruce_tfidf import cruzar_tfidf
+from cruce_tipado import cruzar_fechas, cruzar_numerico
+from explorador_umbral import ExploradorUmbral
+from motor_cruce import (IndiceBloques, cruzar, cruzar_compuesto, cruzar_por_bloques, normalizar_clave,
+                         normalizar_exacta)
+from utils import are_similar
+
+BASE = ["Juan Perez", "Maria Lopez", "Pedro Gomez", "Ana Martinez", "Carlos Rodriguez",
+        "Lucia Fernandez", "Jorge Ramirez", "Sofia Torres", "Perez Juan", "Maria Lopes",
+        "Luis Alberto Diaz", "Jose Garcia"]
+
+NUEVO = ["juan perez", "José García", "Maria Lopz", "Pedro Gomes", "Ana Martines", "Carlos Rodrigues",
+         "Lucia Hernandez", "Jorje Ramires", "Sofia Torrez", "Alberto Diaz Luis", "Marta Lopez", "xyz",
+         "", "Maria  Lopez"]
+
+
+def cruce_exhaustivo(nuevos, base, umbral, k):
+    """Cruce de referencia: hash join normalizado y luego todo el BASE con token_sort_ratio."""
+    exactas_base = normalizar_exacta(pd.Series(base, dtype=object)).tolist()
+    coincidencias = []
+    for nuevo in nuevos:
+        clave = normalizar_exacta(pd.Series([nuevo], dtype=object))[0]
+        if clave in exactas_base:
+            coincidencias.append((nuevo, base[exactas_base.index(clave)], 100))
+            continue
+        vistas, candidatos = set(), []
+        for fila, valor in enumerate(base):
+            # Claves repetidas: cuenta la primera fila, como en el índice
+            if normalizar_clave(valor) in vistas:
+                continue
+            vistas.add(normalizar_clave(valor))
+            score = fuzz.token_sort_ratio(nuevo, valor)
+            if score >= umbral:
+                candidatos.append((-score, fila, valor))
+        coincidencias += [(nuevo, valor, -score) for score, _, valor in sorted(candidatos)[:k]]
+    return coincidencias
+
+
+# Scores de la etapa difusa en el fixture (las exactas y normalizadas valen 100)
+SCORES_DIFUSOS = sorted({score for _, _, score in cruce_exhaustivo(NUEVO, BASE, 50, len(BASE)) if score < 100})
+
+
+@pytest.mark.parametrize("k", [1, 2, 3])
+@pytest.mark.parametrize("umbral", [50, 60, 70, 80, 85, 90, 95, 100])
+def test_cruzar_igual_a_busqueda_exhaustiva(umbral, k):
+    coincidencias, etapas = cruzar(NUEVO, BASE, umbral=umbral, k=k)
+    assert coincidencias == cruce_exhaustivo(NUEVO, BASE, umbral, k)
+    assert etapas["exacta"] + etapas["normalizada"] + etapas["difusa"] == len({c[0] for c in coincidencias})
+
+
+@pytest.mark.parametrize("score", SCORES_DIFUSOS)
+def test_cruzar_limites_del_umbral(score):
+    # Un score igual al umbral entra; con el umbral un punto más alto, ya no
+    for umbral in (score, score + 1):
+        assert cruzar(NUEVO, BASE, umbral=umbral, k=3)[0] == cruce_exhaustivo(NUEVO, BASE, umbral, 3)
+    en_umbral = {(n, b) for n, b, s in cruzar(NUEVO, BASE, umbral=score, k=len(BASE))[0] if s == score}
+    assert en_umbral
+    assert not en_umbral & {(n, b) for n, b, _ in cruzar(NUEVO, BASE, umbral=score + 1, k=len(BASE))[0]}
+
+
+def test_cruzar_con_indice_y_con_valores_da_lo_mismo():
+    indice = IndiceBloques(BASE)
+    assert cruzar(NUEVO, indice, umbral=80, k=2) == cruzar(NUEVO, BASE, umbral=80, k=2)
+
+
+def test_cruzar_incremental_da_lo_mismo():
+    previos = {}
+    cruzar(NUEVO[:8], BASE, umbral=80, k=2, resultados_previos=previos)
+    coincidencias, etapas = cruzar(NUEVO, BASE, umbral=80, k=2, resultados_previos=previos)
+    assert coincidencias == cruzar(NUEVO, BASE, umbral=80, k=2)[0]
+    assert etapas["reutilizadas"] == 8
+
+
+@pytest.mark.parametrize("nuevos, base", [([], BASE), (NUEVO, []), ([], [])])
+def test_cruzar_entradas_vacias(nuevos, base):
+    coincidencias, etapas = cruzar(nuevos, base, umbral=85, k=2)
+    assert coincidencias == []
+    assert etapas["exacta"] == etapas["normalizada"] == etapas["difusa"] == 0
+    assert etapas["pendientes"] == 0
+
+
+def test_cruzar_por_bloques_igual_al_bucle_original():
+    for umbral in (60, 85, 95):
+        esperado = []
+        for nuevo in NUEVO:
+            primero = next((valor for valor in BASE if are_similar(nuevo, valor, umbral)), None)
+            if primero is not None:
+                esperado.append((nuevo, primero))
+        assert cruzar_por_bloques(NUEVO, BASE, umbral) == esperado
+
+
+def test_explorador_filtra_igual_que_cruzar_con_el_umbral():
+    coincidencias, _ = cruzar(NUEVO, BASE, umbral=60, k=2)
+    explorador = ExploradorUmbral(coincidencias, NUEVO, 60)
+    for umbral in (60, 85, 95):
+        esperado, etapas = cruzar(NUEVO, BASE, umbral=umbral, k=2)
+        assert explorador.filtrar(umbral) == esperado
+        assert explorador.registros(umbral) == etapas["exacta"] + etapas["normalizada"] + etapas["difusa"]
+
+
+def test_lsh_solo_devuelve_coincidencias_verificadas():
+    coincidencias, etapas = cruzar_lsh(NUEVO, BASE, umbral=85, k=2)
+    exhaustivo = cruce_exhaustivo(NUEVO, BASE, 85, 2)
+    assert [c for c in coincidencias if c[2] == 100] == [c for c in exhaustivo if c[2] == 100]
+    for nuevo, base, score in coincidencias:
+        assert score >= 85
+        assert score == 100 or score == fuzz.token_sort_ratio(nuevo, base)
+    assert ("Alberto Diaz Luis", "Luis Alberto Diaz", 100) in coincidencias
+
+
+def test_tfidf_encuentra_variantes_cercanas():
+    coincidencias, etapas = cruzar_tfidf(NUEVO, BASE, umbral=80, k=1)
+    assert all(score >= 80 for _, _, score in coincidencias)
+    assert ("José García", "Jose Garcia", 100) in coincidencias
+    encontrados = {nuevo: base for nuevo, base, _ in coincidencias}
+    assert encontrados["Carlos Rodrigues"] == "Carlos Rodriguez"
+    assert "xyz" not in encontrados
+    assert etapas["pendientes"] == 0
+
+
+def test_espanol_cruza_variantes_foneticas():
+    coincidencias, etapas = cruzar_espanol(["Jorje Ramires", "Gonzales", "xyz"], ["Jorge Ramirez", "González"], umbral=85)
+    assert [(nuevo, base) for nuevo, base, _ in coincidencias] == [("Jorje Ramires", "Jorge Ramirez"),
+                                                                  ("Gonzales", "González")]
+    assert etapas["fonetica"] == 2
+
+
+def test_numerico_respeta_la_tolerancia():
+    coincidencias, etapas = cruzar_numerico([10, 10.4, 20, "x"], [10, 10.5, 30], tolerancia=0.5, k=2)
+    # El límite de la tolerancia entra con score 0; 20 y "x" no tienen coincidencia
+    assert coincidencias == [(10, 10, 100), (10, 10.5, 0), (10.4, 10.5, 80), (10.4, 10, 19)]
+    assert etapas == {"exacta": 1, "tolerancia": 1}
+
+
+def test_fechas_respeta_la_ventana():
+    coincidencias, etapas = cruzar_fechas(["2024-01-01", "2024-01-03", "2024-01-10", "no es fecha"],
+                                          ["2024-01-01", "2024-01-04"], dias=1, k=2)
+    assert coincidencias == [("2024-01-01", "2024-01-01", 100), ("2024-01-03", "2024-01-04", 0)]
+    assert etapas == {"exacta": 1, "tolerancia": 1}
+
+
+def test_compuesto_solo_compara_dentro_del_bloque():
+    nuevo = pd.DataFrame({"ciudad": ["Lima", "Lima", "Quito"], "nombre": ["Juan Perez", "Pedro Gomes", "Pedro Gomes"]})
+    base = pd.DataFrame({"ciudad": ["lima", "Quito"], "nombre": ["Juan Perez", "Pedro Gomez"]})
+    columnas = [{"columna": "ciudad", "tipo": "exacta"}, {"columna": "nombre", "tipo": "difusa", "peso": 1}]
+    coincidencias, etapas = cruzar_compuesto(nuevo, base, columnas, umbral=85)
+    assert coincidencias == [("Lima | Juan Perez", "lima | Juan Perez", 100),
+                             ("Quito | Pedro Gomes", "Quito | Pedro Gomez", 91)]
+    assert etapas["compuesta"] == 2
@@ -1,9 +1,14 @@
 import pandas as pd
 import chardet
+import csv
+import hashlib
 import io
 import re
+import time
 from fuzzywuzzy import fuzz
+from rapidfuzz import process as rf_process, fuzz as rf_fuzz, utils as rf_utils
 import os
+from collections import OrderedDict
 import streamlit as st
 
 def are_similar(a, b, threshold=85):
@@ -20,6 +25,37 @@ def are_similar(a, b, threshold=85):
     """
     return fuzz.token_sort_ratio(str(a), str(b)) >= threshold
 
+def similarity_matrix(queries, choices, scorer=None, threshold=0, processor=None, workers=-1):
+    """
+    Calcula la matriz de similitud entre una lista de consultas y una lista de opciones.
+    
+    Puntúa todos los pares en código nativo (rapidfuzz) y en varios hilos, evitando
+    una llamada de Python por cada par como ocurre con `are_similar`.
+    
+    Args:
+        queries (list): Strings a comparar (filas de la matriz)
+        choices (list): Strings contra los que comparar (columnas de la matriz)
+        scorer: Función de similitud de rapidfuzz (por defecto token_sort_ratio)
+        threshold (float): Los scores menores al umbral se devuelven como 0
+        processor: Preprocesamiento de cada string (None si ya vienen normalizados)
+        workers (int): Hilos a utilizar (-1 para usar todos los núcleos)
+        
+    Returns:
+        numpy.ndarray: Matriz de scores (0-100) de tamaño len(queries) x len(choices)
+    """
+    if scorer is None:
+        scorer = rf_fuzz.token_sort_ratio
+        if processor is None:
+            processor = rf_utils.default_process
+    return rf_process.cdist(
+        [str(q) for q in queries],
+        [str(c) for c in choices],
+        scorer=scorer,
+        processor=processor,
+        score_cutoff=threshold,
+        workers=workers
+    )
+
 def normalize_column_names(columns):
     """
     Normaliza los nombres de las columnas eliminando caracteres especiales y espacios.
@@ -32,35 +68,593 @@ def normalize_column_names(columns):
     """
     return [re.sub(r'[^a-zA-Z0-9]', '_', col.strip().lower()) for col in columns]
 
-def read_flexible_file(uploaded_file):
+# Hashes ya calculados, por archivo (ver `_id_archivo`); los más recientes
+HASHES_EN_MEMORIA = 64
+
+_HASHES_ARCHIVOS = OrderedDict()
+
+def _id_archivo(archivo):
     """
-    Lee un archivo CSV o Excel con detección automática de separadores y encoding.
+    Identifica un archivo sin leer su contenido: el file_id de Streamlit para los
+    archivos subidos (cambia con cada subida) y ruta, tamaño y fecha de
+    modificación para las rutas. Devuelve None para otros archivos (p. ej. un
+    BytesIO), cuyo contenido puede cambiar sin que cambie nada más y por eso se
+    hashea siempre.
+    """
+    if isinstance(archivo, str):
+        estado = os.stat(archivo)
+        return ("ruta", os.path.abspath(archivo), estado.st_size, estado.st_mtime_ns)
+    file_id = getattr(archivo, "file_id", None)
+    if file_id:
+        return ("subido", file_id)
+    return None
+
+def file_content_hash(uploaded_file):
+    """
+    Calcula el hash SHA-256 del contenido de un archivo subido.
+    
+    Permite reconocer el mismo archivo entre sesiones aunque cambie su nombre.
+    El hash de los archivos subidos y de las rutas se recuerda (ver `_id_archivo`),
+    así que los reruns y las distintas funciones que lo piden no vuelven a
+    recorrer el contenido.
+    
+    Args:
+        uploaded_file: Archivo subido a través de st.file_uploader, o ruta a un
+            archivo en disco
+        
+    Returns:
+        str: Hash hexadecimal del contenido
+    """
+    clave = _id_archivo(uploaded_file)
+    if clave is None:
+        return _hash_contenido(uploaded_file)
+    if clave in _HASHES_ARCHIVOS:
+        _HASHES_ARCHIVOS.move_to_end(clave)
+        return _HASHES_ARCHIVOS[clave]
+    
+    if isinstance(uploaded_file, str):
+        with open(uploaded_file, "rb") as archivo:
+            huella = _hash_contenido(archivo)
+    else:
+        huella = _hash_contenido(uploaded_file)
+    
+    _HASHES_ARCHIVOS[clave] = huella
+    if len(_HASHES_ARCHIVOS) > HASHES_EN_MEMORIA:
+        _HASHES_ARCHIVOS.popitem(last=False)
+    return huella
+
+def _hash_contenido(archivo):
+    """Recorre un archivo binario y devuelve el SHA-256 de su contenido."""
+    posicion = archivo.tell()
+    archivo.seek(0)
+    sha = hashlib.sha256()
+    for bloque in iter(lambda: archivo.read(1024 * 1024), b""):
+        sha.update(bloque)
+    archivo.seek(posicion)
+    return sha.hexdigest()
+
+def huella_archivo(uploaded_file, hoja=None, columnas=None):
+    """
+    Identifica los datos que se leen de un archivo: su contenido más la hoja y las
+    columnas elegidas.
+    
+    Dos hojas del mismo libro (o dos selecciones de columnas) dan huellas
+    distintas, así que los cachés por huella no las confunden.
     
     Args:
         uploaded_file: Archivo subido a través de st.file_uploader
+        hoja (str, optional): Hoja de un Excel
+        columnas (list, optional): Columnas elegidas
+        
+    Returns:
+        str: Hash del contenido, con un sufijo si se indicó hoja o columnas
+    """
+    huella = file_content_hash(uploaded_file)
+    if hoja is not None or columnas is not None:
+        huella += "_" + hashlib.md5(repr((hoja, columnas)).encode()).hexdigest()[:8]
+    return huella
+
+# Bytes iniciales usados para detectar encoding y separador de un CSV
+BYTES_MUESTRA_CSV = 64 * 1024
+
+# Formatos ya detectados (encoding, separador) por archivo, para no repetir la detección
+_FORMATOS_CSV = {}
+
+# Encodings que se prueban, en orden, si el detectado no decodifica el archivo completo
+ENCODINGS_ALTERNATIVOS = ["cp1252", "latin-1"]
+
+def _muestra_csv(archivo):
+    """Devuelve la muestra inicial de un CSV y la clave con que se recuerda su formato."""
+    if isinstance(archivo, str):
+        with open(archivo, "rb") as manejador:
+            muestra = manejador.read(BYTES_MUESTRA_CSV)
+        nombre, tamano = archivo, os.path.getsize(archivo)
+    else:
+        posicion = archivo.tell()
+        archivo.seek(0)
+        muestra = archivo.read(BYTES_MUESTRA_CSV)
+        archivo.seek(0, os.SEEK_END)
+        tamano = archivo.tell()
+        archivo.seek(posicion)
+        nombre = getattr(archivo, "name", "")
+    return (nombre, tamano, hashlib.md5(muestra).hexdigest()), muestra
+
+def detectar_formato_csv(archivo):
+    """
+    Detecta encoding y separador de un CSV a partir de una muestra acotada del comienzo.
+    
+    El resultado se recuerda por archivo (nombre, tamaño y muestra), así que las
+    relecturas del mismo archivo no repiten la detección. Si la muestra es ASCII
+    se supone utf-8; los lectores deben usar `leer_con_encoding_alternativo` para
+    recuperarse si más adelante aparecen bytes de otro encoding.
+    
+    Args:
+        archivo: Ruta o archivo binario (por ejemplo, el de st.file_uploader)
+        
+    Returns:
+        tuple: (encoding, separador)
+    """
+    clave, muestra = _muestra_csv(archivo)
+    if clave in _FORMATOS_CSV:
+        return _FORMATOS_CSV[clave]
+    
+    encoding = chardet.detect(muestra)["encoding"] or "utf-8"
+    # La muestra puede ser ASCII aunque más adelante haya acentos: utf-8 la contiene
+    if encoding.lower() == "ascii":
+        encoding = "utf-8"
+    
+    texto = muestra.decode(encoding, errors="ignore")
+    # Solo líneas completas: la muestra puede cortar la última a la mitad
+    if len(muestra) == BYTES_MUESTRA_CSV and "\n" in texto:
+        texto = texto[:texto.rindex("\n")]
+    try:
+        separador = csv.Sniffer().sniff(texto, delimiters=",;\t|").delimiter
+    except csv.Error:
+        primera_linea = texto.splitlines()[0] if texto else ""
+        separador = max([",", ";", "\t"], key=primera_linea.count)
+    
+    _FORMATOS_CSV[clave] = (encoding, separador)
+    return encoding, separador
+
+def leer_con_encoding_alternativo(archivo, encoding, leer):
+    """
+    Ejecuta una lectura de CSV y, si falla al decodificar, la repite con otros encodings.
+    
+    La detección usa solo el comienzo del archivo, así que un byte de cp1252 o
+    latin-1 más adelante hace fallar la lectura con el encoding detectado. En ese
+    caso se reintenta con ENCODINGS_ALTERNATIVOS (latin-1 decodifica cualquier
+    byte) y el encoding que funciona queda recordado para el archivo.
+    
+    Args:
+        archivo: Ruta o archivo binario del CSV
+        encoding: Encoding detectado
+        leer: Función que recibe un encoding y hace la lectura
+        
+    Returns:
+        El resultado de `leer`
+    """
+    candidatos = [encoding] + [e for e in ENCODINGS_ALTERNATIVOS if e != encoding.lower()]
+    for i, candidato in enumerate(candidatos):
+        try:
+            resultado = leer(candidato)
+        except UnicodeDecodeError:
+            if i == len(candidatos) - 1:
+                raise
+            continue
+        if candidato != encoding:
+            clave, _ = _muestra_csv(archivo)
+            separador = _FORMATOS_CSV.get(clave, (None, ","))[1]
+            _FORMATOS_CSV[clave] = (candidato, separador)
+        return resultado
+
+# Columnas de texto con menos valores distintos que esta fracción de filas se guardan como category
+FRACCION_MAXIMA_CATEGORIA = 0.5
+
+def memoria_df(df):
+    """
+    Calcula la memoria ocupada por un DataFrame, incluido el contenido de los strings.
+    
+    Args:
+        df (pandas.DataFrame): DataFrame a medir
         
     Returns:
-        pandas.DataFrame: DataFrame con los datos cargados
+        int: Bytes ocupados
     """
-    file_name = uploaded_file.name.lower()
-    if file_name.endswith(".xlsx") or file_name.endswith(".xls"):
-        return pd.read_excel(uploaded_file)
+    return int(df.memory_usage(deep=True).sum())
 
-    rawdata = uploaded_file.read()
+def compactar_tipos(df):
+    """
+    Reduce la memoria de un DataFrame sin perder información.
+    
+    Las columnas de texto con pocos valores distintos pasan a category, los enteros
+    al ancho más chico que admite su rango y los float a float32 solo si todos sus
+    valores se representan exactamente.
+    
+    Args:
+        df (pandas.DataFrame): DataFrame a compactar
+        
+    Returns:
+        pandas.DataFrame: Nuevo DataFrame con tipos compactos
+    """
+    compacto = {}
+    for columna in df.columns:
+        valores = df[columna]
+        if pd.api.types.is_bool_dtype(valores):
+            pass
+        elif pd.api.types.is_integer_dtype(valores):
+            valores = pd.to_numeric(valores, downcast="integer")
+        elif pd.api.types.is_float_dtype(valores):
+            reducidos = valores.astype("float32")
+            if ((reducidos.astype("float64") == valores) | valores.isna()).all():
+                valores = reducidos
+        elif pd.api.types.is_object_dtype(valores) or pd.api.types.is_string_dtype(valores):
+            if len(valores) and valores.nunique(dropna=True) < FRACCION_MAXIMA_CATEGORIA * len(valores):
+                valores = valores.astype("category")
+        compacto[columna] = valores
+    return pd.DataFrame(compacto, index=df.index)
+
+def _tiene_bytes(df):
+    """Indica si alguna columna de texto del DataFrame contiene valores bytes."""
+    for columna in df.columns:
+        valores = df[columna]
+        if pd.api.types.is_object_dtype(valores) and valores.map(lambda v: isinstance(v, bytes)).any():
+            return True
+    return False
+
+def _read_csv_rapido(uploaded_file, sep, encoding, columnas=None):
+    """
+    Lee un CSV con el motor de pyarrow (parseo multihilo) si está instalado.
+    Si pyarrow no está disponible o no admite el archivo, usa el motor de pandas.
+    
+    Con un encoding equivocado pyarrow no falla: deja como bytes los valores que
+    no puede decodificar. En ese caso el archivo se relee con el motor de pandas,
+    que sí lanza UnicodeDecodeError.
+    """
+    try:
+        import pyarrow  # noqa: F401
+        uploaded_file.seek(0)
+        df = pd.read_csv(uploaded_file, sep=sep, encoding=encoding, usecols=columnas, engine="pyarrow")
+        if not _tiene_bytes(df):
+            return df
+    except Exception:
+        pass
     uploaded_file.seek(0)
-    result = chardet.detect(rawdata)
-    encoding = result['encoding']
+    return pd.read_csv(uploaded_file, sep=sep, encoding=encoding, usecols=columnas)
+
+# Carpeta del caché de archivos ya leídos (Parquet, por hash de contenido)
+CACHE_ARCHIVOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+# Archivos leídos que se conservan en memoria (los más recientes)
+ARCHIVOS_EN_MEMORIA = 4
 
-    try_separators = [',', ';', '\t']
-    for sep in try_separators:
+# Límites del caché en disco: los Parquet sin usar en más días que estos se borran,
+# y si el total supera el tamaño máximo se borran los usados hace más tiempo
+DIAS_CACHE_ARCHIVOS = 7
+BYTES_MAXIMOS_CACHE_ARCHIVOS = 2 * 1024 ** 3
+
+_CACHE_ARCHIVOS = OrderedDict()
+
+def _ruta_cache_archivo(clave):
+    """Ruta del Parquet de un archivo ya leído."""
+    return os.path.join(CACHE_ARCHIVOS_DIR, f"archivo_{clave}.parquet")
+
+def _cargar_cache_archivo(clave):
+    """Busca un archivo ya leído en memoria y luego en disco; devuelve None si no está."""
+    if clave in _CACHE_ARCHIVOS:
+        _CACHE_ARCHIVOS.move_to_end(clave)
+        return _CACHE_ARCHIVOS[clave]
+    ruta = _ruta_cache_archivo(clave)
+    if os.path.exists(ruta):
         try:
-            df = pd.read_csv(uploaded_file, sep=sep, encoding=encoding)
-            if df.shape[1] > 1:
-                return df
+            df = pd.read_parquet(ruta)
+            # La fecha de modificación marca el último uso (ver `limpiar_cache_archivos`)
+            os.utime(ruta)
         except Exception:
+            return None
+        _recordar_archivo(clave, df)
+        return df
+    return None
+
+def _recordar_archivo(clave, df):
+    """Agrega un archivo leído al caché en memoria, descartando el menos reciente."""
+    _CACHE_ARCHIVOS[clave] = df
+    _CACHE_ARCHIVOS.move_to_end(clave)
+    if len(_CACHE_ARCHIVOS) > ARCHIVOS_EN_MEMORIA:
+        _CACHE_ARCHIVOS.popitem(last=False)
+
+def _guardar_cache_archivo(clave, df):
+    """Guarda un archivo leído en memoria y como Parquet en cache/ (escritura atómica)."""
+    _recordar_archivo(clave, df)
+    ruta = _ruta_cache_archivo(clave)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(CACHE_ARCHIVOS_DIR, exist_ok=True)
+        df.to_parquet(temporal, index=False)
+        os.replace(temporal, ruta)
+    except Exception:
+        # Columnas que Parquet no admite (p. ej. tipos mezclados): queda solo en memoria
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    limpiar_cache_archivos()
+
+def limpiar_cache_archivos(dias=DIAS_CACHE_ARCHIVOS, bytes_maximos=BYTES_MAXIMOS_CACHE_ARCHIVOS):
+    """
+    Borra los Parquet del caché de archivos sin usar en más de `dias` días y, si el
+    resto supera `bytes_maximos`, los usados hace más tiempo hasta quedar por debajo.
+    
+    Returns:
+        int: Archivos borrados
+    """
+    return limpiar_cache(CACHE_ARCHIVOS_DIR, "archivo_", ".parquet", dias, bytes_maximos)
+
+def limpiar_cache(carpeta, prefijos, sufijos, dias, bytes_maximos):
+    """
+    Borra de una carpeta de caché los archivos sin usar en más de `dias` días y, si
+    el resto supera `bytes_maximos`, los usados hace más tiempo hasta quedar por
+    debajo. La fecha de modificación marca el último uso.
+    
+    Args:
+        carpeta (str): Carpeta del caché
+        prefijos (str | tuple): Prefijo (o prefijos) de los archivos a considerar
+        sufijos (str | tuple): Extensión (o extensiones) de los archivos a considerar
+        dias (float): Días sin uso tras los que se borra un archivo
+        bytes_maximos (int): Tamaño máximo del total de esos archivos
+        
+    Returns:
+        int: Archivos borrados
+    """
+    archivos = []
+    for nombre in os.listdir(carpeta) if os.path.isdir(carpeta) else []:
+        if nombre.startswith(prefijos) and nombre.endswith(sufijos):
+            ruta = os.path.join(carpeta, nombre)
+            try:
+                estado = os.stat(ruta)
+            except OSError:
+                continue
+            archivos.append((estado.st_mtime, estado.st_size, ruta))
+    
+    archivos.sort()
+    limite = time.time() - dias * 86400
+    total = sum(tamano for _, tamano, _ in archivos)
+    borrados = 0
+    for modificado, tamano, ruta in archivos:
+        if modificado >= limite and total <= bytes_maximos:
+            break
+        try:
+            os.remove(ruta)
+        except OSError:
+            # P. ej. un archivo abierto con memory map en Windows
+            continue
+        total -= tamano
+        borrados += 1
+    return borrados
+
+# Hojas y columnas de los Excel ya abiertos, por contenido del archivo
+_ESTRUCTURA_EXCEL = {}
+
+def motor_excel():
+    """
+    Motor para leer Excel: calamine (nativo, mucho más rápido) si python-calamine
+    está instalado; si no, None para que pandas use su motor por defecto.
+    """
+    try:
+        import python_calamine  # noqa: F401
+        return "calamine"
+    except ImportError:
+        return None
+
+def es_excel(uploaded_file):
+    """Indica si el archivo subido es un Excel (.xlsx o .xls)."""
+    return uploaded_file.name.lower().endswith((".xlsx", ".xls"))
+
+def estructura_excel(uploaded_file, hoja=None):
+    """
+    Lista las hojas de un Excel o las columnas de una hoja sin leer sus filas.
+    
+    El resultado se recuerda por contenido del archivo.
+    
+    Args:
+        uploaded_file: Archivo Excel subido a través de st.file_uploader
+        hoja (str, optional): Si se indica, devuelve las columnas de esa hoja
+        
+    Returns:
+        list: Nombres de las hojas, o de las columnas de la hoja indicada
+    """
+    clave = (file_content_hash(uploaded_file), hoja)
+    if clave not in _ESTRUCTURA_EXCEL:
+        uploaded_file.seek(0)
+        if hoja is None:
+            with pd.ExcelFile(uploaded_file, engine=motor_excel()) as libro:
+                _ESTRUCTURA_EXCEL[clave] = list(libro.sheet_names)
+        else:
+            _ESTRUCTURA_EXCEL[clave] = list(pd.read_excel(uploaded_file, sheet_name=hoja, nrows=0,
+                                                          engine=motor_excel()).columns)
+        uploaded_file.seek(0)
+    return _ESTRUCTURA_EXCEL[clave]
+
+def seleccionar_hoja_excel(uploaded_file, key):
+    """
+    Muestra los selectores de hoja y columnas para un archivo Excel.
+    
+    Args:
+        uploaded_file: Archivo subido a través de st.file_uploader
+        key (str): Prefijo para las claves de los widgets
+        
+    Returns:
+        tuple: (hoja, columnas) para `read_flexible_file`; (None, None) si no es un
+        Excel o si se cargan la primera hoja y todas las columnas
+    """
+    if not es_excel(uploaded_file):
+        return None, None
+    hojas = estructura_excel(uploaded_file)
+    hoja = st.selectbox("Hoja", hojas, key=f"{key}_hoja") if len(hojas) > 1 else hojas[0]
+    disponibles = estructura_excel(uploaded_file, hoja)
+    columnas = st.multiselect("Columnas a cargar", disponibles, default=disponibles, key=f"{key}_columnas",
+                              help="Solo se leen las columnas elegidas, lo que acelera la carga de libros grandes.")
+    return hoja, (columnas if columnas and len(columnas) < len(disponibles) else None)
+
+def read_flexible_file(uploaded_file, compactar=False, hoja=None, columnas=None):
+    """
+    Lee un archivo CSV o Excel con detección automática de separadores y encoding.
+    
+    El resultado se guarda en caché según el hash del contenido (en memoria y como
+    Parquet en cache/), así que los reruns de Streamlit y las demás páginas que
+    abren el mismo archivo no lo vuelven a parsear.
+    
+    Args:
+        uploaded_file: Archivo subido a través de st.file_uploader
+        compactar (bool): Si es True, los CSV se leen con el motor de pyarrow y los
+            tipos se compactan (ver `compactar_tipos`). La memoria antes y después
+            queda en df.attrs["memoria"]
+        hoja (str, optional): Hoja de un Excel (por defecto la primera)
+        columnas (list, optional): Columnas a leer (por defecto todas)
+        
+    Returns:
+        pandas.DataFrame: DataFrame con los datos cargados (una copia propia, que
+        se puede modificar sin afectar al caché)
+    """
+    clave = huella_archivo(uploaded_file, hoja, columnas)
+    clave = f"{clave}_{'compacto' if compactar else 'original'}"
+    df = _cargar_cache_archivo(clave)
+    if df is None:
+        df = leer_archivo(uploaded_file, compactar, hoja, columnas)
+        _guardar_cache_archivo(clave, df)
+    return df.copy()
+
+def leer_archivo(uploaded_file, compactar=False, hoja=None, columnas=None):
+    """
+    Lee y parsea un archivo subido sin caché (mismos argumentos que `read_flexible_file`).
+    
+    Para lecturas que se guardan en otro lado (p. ej. los datasets en Feather) y
+    no deben dejar una copia en el caché de archivos.
+    """
+    if es_excel(uploaded_file):
+        uploaded_file.seek(0)
+        df = pd.read_excel(uploaded_file, sheet_name=hoja if hoja is not None else 0, usecols=columnas,
+                           engine=motor_excel())
+        uploaded_file.seek(0)
+    else:
+        # Encoding y separador salen de una muestra del comienzo; el CSV se lee una sola vez
+        encoding, sep = detectar_formato_csv(uploaded_file)
+        
+        def leer(encoding):
             uploaded_file.seek(0)
+            if compactar:
+                return _read_csv_rapido(uploaded_file, sep, encoding, columnas)
+            return pd.read_csv(uploaded_file, sep=sep, encoding=encoding, usecols=columnas)
+        
+        df = leer_con_encoding_alternativo(uploaded_file, encoding, leer)
+        uploaded_file.seek(0)
+    
+    if compactar:
+        memoria_antes = memoria_df(df)
+        df = compactar_tipos(df)
+        df.attrs["memoria"] = {"antes": memoria_antes, "despues": memoria_df(df)}
+    return df
+
+# Filas que se leen en la primera fase de la carga (vista previa y selección de campos)
+MUESTRA_FILAS = 1000
+
+# Muestras que se conservan en memoria (las más recientes)
+MUESTRAS_EN_MEMORIA = 8
+
+_MUESTRAS = OrderedDict()
+
+def contar_filas(uploaded_file, hoja=None):
+    """
+    Cuenta las filas de datos de un archivo sin parsearlo.
+
+    En los CSV se cuentan los saltos de línea (un campo entre comillas con saltos
+    de línea cuenta de más); en los .xlsx se usa la dimensión guardada en la hoja.
+
+    Args:
+        uploaded_file: Archivo subido a través de st.file_uploader
+        hoja (str, optional): Hoja de un Excel (por defecto la primera)
+
+    Returns:
+        int: Filas sin contar el encabezado, o None si no se pueden contar sin leer la hoja
+    """
+    posicion = uploaded_file.tell()
+    try:
+        uploaded_file.seek(0)
+        if es_excel(uploaded_file):
+            if not uploaded_file.name.lower().endswith(".xlsx"):
+                return None
+            import openpyxl
+            libro = openpyxl.load_workbook(uploaded_file, read_only=True)
+            try:
+                hoja_excel = libro[hoja] if hoja is not None else libro.worksheets[0]
+                return max(hoja_excel.max_row - 1, 0) if hoja_excel.max_row else None
+            finally:
+                libro.close()
+
+        saltos, ultimo = 0, b""
+        for bloque in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+            saltos += bloque.count(b"\n")
+            ultimo = bloque[-1:]
+        # La última línea puede no terminar en salto de línea
+        lineas = saltos + (1 if ultimo and ultimo != b"\n" else 0)
+        return max(lineas - 1, 0)
+    except Exception:
+        return None
+    finally:
+        uploaded_file.seek(posicion)
+
+def leer_muestra(uploaded_file, filas=MUESTRA_FILAS, hoja=None, columnas=None):
+    """
+    Primera fase de la carga: lee el encabezado y las primeras filas de un archivo.
+
+    Alcanza para vistas previas, listas de columnas, selección del campo clave y
+    sugerencias de mapeo sin parsear el archivo completo, que se carga después con
+    `read_flexible_file` y solo con las columnas que necesita la operación.
+
+    Args:
+        uploaded_file: Archivo subido a través de st.file_uploader
+        filas (int): Filas a leer
+        hoja (str, optional): Hoja de un Excel (por defecto la primera)
+        columnas (list, optional): Columnas a leer (por defecto todas)
+
+    Returns:
+        pandas.DataFrame: Primeras filas del archivo. El total de filas del archivo
+        queda en df.attrs["filas_totales"] (ver `filas_totales`)
+    """
+    clave = (file_content_hash(uploaded_file), filas, hoja, tuple(columnas) if columnas else None)
+    if clave in _MUESTRAS:
+        _MUESTRAS.move_to_end(clave)
+        return _MUESTRAS[clave].copy()
+
     uploaded_file.seek(0)
-    return pd.read_csv(uploaded_file, encoding=encoding)
+    if es_excel(uploaded_file):
+        df = pd.read_excel(uploaded_file, sheet_name=hoja if hoja is not None else 0, usecols=columnas,
+                           nrows=filas, engine=motor_excel())
+    else:
+        encoding, sep = detectar_formato_csv(uploaded_file)
+        
+        def leer(encoding):
+            uploaded_file.seek(0)
+            return pd.read_csv(uploaded_file, sep=sep, encoding=encoding, usecols=columnas, nrows=filas)
+        
+        df = leer_con_encoding_alternativo(uploaded_file, encoding, leer)
+    uploaded_file.seek(0)
+
+    # Si el archivo tiene menos filas que la muestra, la muestra es el archivo completo
+    total = contar_filas(uploaded_file, hoja) if len(df) == filas else len(df)
+    if total is not None:
+        df.attrs["filas_totales"] = max(total, len(df))
+
+    _MUESTRAS[clave] = df
+    if len(_MUESTRAS) > MUESTRAS_EN_MEMORIA:
+        _MUESTRAS.popitem(last=False)
+    return df.copy()
+
+def filas_totales(df):
+    """
+    Filas del archivo del que proviene un DataFrame.
+
+    Para las muestras de `leer_muestra` es el total del archivo; para el resto,
+    la cantidad de filas del DataFrame.
+    """
+    return df.attrs.get("filas_totales", len(df))
 
 def get_api_key(service="openai"):
     """